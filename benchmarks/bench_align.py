@@ -0,0 +1,59 @@
+""" 
+    -------------------------------------------------------------------------------------------------
+    Benchmark: `align_parallel_pats` on sentences with many grammar patterns
+    Compared with the previous implementation, which re-filtered all patterns for every headword.
+    Usage: python -m benchmarks.bench_align -num_pats 10 100 1000
+    -------------------------------------------------------------------------------------------------
+"""
+
+import time
+import random
+import argparse
+from modules.grampat import align_parallel_pats
+
+def legacy_align_parallel_pats(src_pats, tgt_pats):
+    """ Reference path: filter patterns per common headword, pop pairs from the front. """
+    src_heads = set([pat[0] for pat in src_pats])
+    tgt_heads = set([pat[0] for pat in tgt_pats])
+    grouped_parallel_pats = []
+    for head in list(src_heads & tgt_heads):
+        grouped_parallel_pats.append([list(filter(lambda pat: pat[0] in head, src_pats)),
+                                      list(filter(lambda pat: pat[0] in head, tgt_pats))])
+    parallel_pats = []
+    for src_pats_, tgt_pats_ in grouped_parallel_pats:
+        while len(src_pats_) and len(tgt_pats_):
+            parallel_pats.append([src_pats_.pop(0), tgt_pats_.pop(0)])
+    return parallel_pats
+
+def make_pats(num_pats, num_heads, rng):
+    """ Synthetic `sent_to_pats` results, one pattern per start position. """
+    heads = ['HEAD{}'.format(i) for i in range(num_heads)]
+    return [(rng.choice(heads), 'V n', 'ngram', (i, i+1)) for i in range(num_pats)]
+
+def bench(func, pairs, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for src_pats, tgt_pats in pairs:
+            func(src_pats, tgt_pats)
+    return (time.perf_counter() - start) / repeat / len(pairs)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark parallel grammar pattern alignment')
+    parser.add_argument('-num_pats', type=int, nargs='+', default=[10, 100, 1000],
+                        help='The numbers of grammar patterns per sentence.')
+    parser.add_argument('-num_sents', type=int, default=20,
+                        help='The number of sentence pairs per size.')
+    parser.add_argument('-repeat', type=int, default=3,
+                        help='The number of runs per size.')
+    args = parser.parse_args()
+    
+    rng = random.Random(0)
+    for num_pats in args.num_pats:
+        num_heads = max(1, num_pats // 4)
+        pairs = [(make_pats(num_pats, num_heads, rng), make_pats(num_pats, num_heads, rng)) for _ in range(args.num_sents)]
+        results = []
+        for name, func in [('legacy', legacy_align_parallel_pats),
+                           ('by order', align_parallel_pats),
+                           ('by position', lambda src, tgt: align_parallel_pats(src, tgt, by_position=True))]:
+            results.append('{} {:9.3f} ms'.format(name, bench(func, pairs, args.repeat) * 1e3))
+        print('{:5d} patterns/sentence: {}'.format(num_pats, ', '.join(results)))
@@ -0,0 +1,51 @@
+""" 
+    -------------------------------------------------------------------------------------------------
+    Benchmark: `sent_to_pats` per sentence vs. vectorized `batch_sent_to_pats` over a packed batch
+    Reports sentences/sec, peak memory and memory held by the results (tracemalloc) of each path.
+    Usage: python -m benchmarks.bench_batch_grampat -in_path data/src.tree.txt -repeat 50
+    -------------------------------------------------------------------------------------------------
+"""
+
+import time
+import argparse
+import tracemalloc
+from modules.shallow_parser import shallow_parse_batch
+from modules.tree_reader import read_tree_line
+from modules.grampat import sent_to_pats
+from modules.batch_grampat import pack_sents, batch_sent_to_pats
+
+def per_sentence(parsed_sents):
+    return [sent_to_pats(parsed) for parsed in parsed_sents]
+
+def vectorized(parsed_sents):
+    return batch_sent_to_pats(pack_sents(parsed_sents))
+
+def bench(func, parsed_sents):
+    start = time.perf_counter()
+    func(parsed_sents)
+    sec = time.perf_counter() - start
+    # Trace memory in a second run, since tracing slows Python down.
+    tracemalloc.start()
+    result = func(parsed_sents)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return len(parsed_sents) / sec, peak / 2**20, current / 2**20
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark vectorized grammar pattern extraction')
+    parser.add_argument('-in_path', type=str, default='data/src.tree.txt',
+                        help='The *file* path to the tree strings.')
+    parser.add_argument('-repeat', type=int, default=50,
+                        help='The number of times to repeat the input file in one batch.')
+    args = parser.parse_args()
+    
+    with open(args.in_path) as in_file:
+        tree_strs = [read_tree_line(line) for line in in_file if line.strip()]
+    parsed_sents = [parsed for parsed in shallow_parse_batch(tree_strs, ignore_errors=True) if parsed] * args.repeat
+    
+    print('Sentences: {}'.format(len(parsed_sents)))
+    for name, func in [('sent_to_pats', per_sentence), ('batch_sent_to_pats', vectorized)]:
+        sents_per_sec, peak_mb, result_mb = bench(func, parsed_sents)
+        print('{:18s}: {:10.1f} sentences/sec, peak {:7.2f} MB, results {:7.2f} MB'.format(
+            name, sents_per_sec, peak_mb, result_mb))
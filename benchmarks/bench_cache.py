@@ -0,0 +1,65 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Benchmark: grammar pattern cache on a corpus with repeated sentences
+    Sample lines are drawn with Zipfian repetition, then counted in chunks by `count_parallel_lines`
+    without a cache, with the in-process LRU, and with a warm persistent store (a second run).
+    Usage: python -m benchmarks.bench_cache -in_src_path data/src.tree.txt -in_tgt_path data/tgt.tree.txt
+    -------------------------------------------------------------------------------------------------
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+from collections import Counter
+from compute_grampat import count_parallel_lines
+from modules.pat_cache import set_cache
+
+def run(parallel_lines, chunk_size, **kwargs):
+    counters = Counter()
+    start = time.perf_counter()
+    for i in range(0, len(parallel_lines), chunk_size):
+        counters.update(count_parallel_lines(parallel_lines[i:i+chunk_size], **kwargs)[1])
+    return time.perf_counter() - start, counters
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the grammar pattern cache')
+    parser.add_argument('-in_src_path', type=str, default='data/src.tree.txt',
+                        help='The source *file* path to the tree strings.')
+    parser.add_argument('-in_tgt_path', type=str, default='data/tgt.tree.txt',
+                        help='The target *file* path to the tree strings.')
+    parser.add_argument('-num_lines', type=int, default=5000,
+                        help='The number of parallel lines drawn from the samples.')
+    parser.add_argument('-chunk_size', type=int, default=500,
+                        help='The number of lines per worker chunk.')
+    parser.add_argument('-cache_size', type=int, default=100000,
+                        help='The number of cached results.')
+    parser.add_argument('-spacy_model', type=str, default='en_core_web_lg',
+                        help='The spaCy model for the "spacy" lemmatizer.')
+    args = parser.parse_args()
+
+    with open(args.in_src_path) as in_src_file, open(args.in_tgt_path) as in_tgt_file:
+        samples = [(src_line.strip(), tgt_line.strip()) for src_line, tgt_line in zip(in_src_file, in_tgt_file)]
+    rng = random.Random(0)
+    parallel_lines = rng.choices(samples, [1 / (i + 1) for i in range(len(samples))], k=args.num_lines)
+    lemmatizer_config = {'backend': 'spacy', 'model': args.spacy_model}
+    kwargs = {'batch_size': args.chunk_size, 'lemmatizer_config': lemmatizer_config}
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        disk_path = os.path.join(tmp_path, 'cache.db')
+        runs = [
+            ('no cache', None),
+            ('lru', {'max_size': args.cache_size, 'namespace': 'lru'}),
+            ('disk (cold)', {'max_size': 1, 'disk_path': disk_path, 'namespace': 'disk'}),
+            ('disk (warm)', {'max_size': 1, 'disk_path': disk_path, 'namespace': 'disk'})
+        ]
+        run(parallel_lines[:10], args.chunk_size, **kwargs) # Warm up the lemmatizer
+        for name, cache_config in runs:
+            if name == 'disk (warm)':
+                # A new process-level cache, like another run, with the store written by the cold run.
+                set_cache()
+            sec, counters = run(parallel_lines, args.chunk_size, cache_config=cache_config, **kwargs)
+            print('{:12s}: {:7.2f} sec, parsed {:6d} / {:6d} sentences, {:6d} hits ({:6d} disk), {:6d} misses'.format(
+                name, sec, counters['parsed_sents'], counters['sents'],
+                counters['cache_hits'] + counters['disk_hits'], counters['disk_hits'], counters['cache_misses']))
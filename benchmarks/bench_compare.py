@@ -0,0 +1,105 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Benchmark: cross-corpus comparison (`modules/grampat_compare.py`) against probing nested dicts
+    Synthetic `count_dict`s of a native corpus (no corrections) and learner corpora are compared by
+    ranking the (head, src_pat, tgt_pat) cells whose correction rate in a learner corpus most exceeds
+    the native baseline, and by log-odds of the usage of (head, src_pat) in every learner corpus.
+    The reference path probes `count_dict`s and `head_stpat_dict` marginals cell by cell.
+    Usage: python -m benchmarks.bench_compare -num_heads 20000 -num_rows 1000000
+    -------------------------------------------------------------------------------------------------
+"""
+
+import math
+import time
+import random
+import argparse
+from modules.grampat_stats import new_count_dict
+from modules.grampat_compare import compare_corpora
+from query_grampat import get_head_stpat_dict
+from benchmarks.bench_inconsistent import make_count_dict
+
+def make_native_count_dict(count_dict):
+    """ A corpus without corrections: every instance keeps its source pattern. """
+    native_dict = new_count_dict()
+    for src_pat, tgt_dict in count_dict.items():
+        for head_dict in tgt_dict.values():
+            for head, count in head_dict.items():
+                native_dict[src_pat][src_pat][head] += count
+    return native_dict
+
+def probe_compare(stats_dict, names, baseline, topk, min_count, alpha=0.5):
+    """ Reference path: rates and log-odds by dict probes of every cell. """
+    head_stpat_dicts = {corpus: get_head_stpat_dict(stats['count_dict']) for corpus, stats in stats_dict.items()}
+    cells = set()
+    for stats in stats_dict.values():
+        for src_pat, tgt_dict in stats['count_dict'].items():
+            for tgt_pat, head_dict in tgt_dict.items():
+                cells.update((head, src_pat, tgt_pat) for head, count in head_dict.items() if count)
+
+    def source_total(corpus, head, src_pat):
+        return head_stpat_dicts[corpus].get(head, {}).get(src_pat, {}).get('*', 0)
+
+    def rate(corpus, head, src_pat, tgt_pat):
+        return head_stpat_dicts[corpus].get(head, {}).get(src_pat, {}).get(tgt_pat, 0) / \
+            max(source_total(corpus, head, src_pat), 1)
+
+    totals = {corpus: sum(head_stpat_dicts[corpus]['*'][src_pat][tgt_pat]
+                          for src_pat in head_stpat_dicts[corpus]['*'] for tgt_pat in head_stpat_dicts[corpus]['*'][src_pat])
+              for corpus in stats_dict}
+    results = []
+    for name in names:
+        rate_diffs = [(rate(name, *cell) - rate(baseline, *cell), cell) for cell in cells
+                      if cell[1] != cell[2] and source_total(name, *cell[:2]) >= min_count]
+        top_rates = sorted(rate_diffs, key=lambda item: (-item[0], item[1]))[:topk]
+        log_odds = []
+        for cell in cells:
+            a, b = source_total(name, *cell[:2]) + alpha, source_total(baseline, *cell[:2]) + alpha
+            a_total, b_total = totals[name] + alpha, totals[baseline] + alpha
+            log_odds.append((math.log(a / max(a_total - a, alpha)) - math.log(b / max(b_total - b, alpha)), cell))
+        top_log_odds = sorted(log_odds, key=lambda item: (-item[0], item[1]))[:topk]
+        results.append((top_rates, top_log_odds))
+    return results
+
+def vectorized_compare(stats_dict, names, baseline, topk, min_count):
+    comparison = compare_corpora(stats_dict)
+    rates = comparison.correction_rate()
+    source_totals = comparison.group_totals('head', 'src_pat')
+    j = comparison.column_id(baseline)
+    results = []
+    for name in names:
+        i = comparison.column_id(name)
+        top_rates = comparison.rank(rates[:, i] - rates[:, j], topk,
+                                    comparison.select(changed=True) & (source_totals[:, i] >= min_count))
+        top_log_odds = comparison.rank(comparison.log_odds(name, baseline, counts=source_totals), topk)
+        results.append(tuple([(row['score'], (row['head'], row['src_pat'], row['tgt_pat'])) for row in top]
+                             for top in (top_rates, top_log_odds)))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark cross-corpus comparison')
+    parser.add_argument('-num_heads', type=int, default=20000,
+                        help='The number of headwords.')
+    parser.add_argument('-num_rows', type=int, default=1000000,
+                        help='The number of counted instances per corpus.')
+    parser.add_argument('-topk', type=int, default=20,
+                        help='The number of ranked cells.')
+    parser.add_argument('-min_count', type=int, default=5,
+                        help='The minimum count of (head, src_pat) in the learner corpus to rank correction rates.')
+    args = parser.parse_args()
+
+    stats_dict = {'bnc': {'count_dict': make_native_count_dict(
+        make_count_dict(args.num_heads, args.num_rows, random.Random(0)))}}
+    for seed, name in enumerate(['clcfce', 'efcamdat', 'lang8'], start=1):
+        stats_dict[name] = {'count_dict': make_count_dict(args.num_heads, args.num_rows, random.Random(seed))}
+
+    start = time.perf_counter()
+    comparison = compare_corpora(stats_dict)
+    print('{} cells of {} corpora, aligned in {:.3f} sec'.format(
+        len(comparison), len(stats_dict), time.perf_counter() - start))
+
+    results = {}
+    for path, func in [('probe', probe_compare), ('vectorized', vectorized_compare)]:
+        start = time.perf_counter()
+        results[path] = func(stats_dict, ['clcfce', 'efcamdat', 'lang8'], 'bnc', args.topk, args.min_count)
+        print('{:10s}: {:8.3f} sec'.format(path, time.perf_counter() - start))
+    assert results['probe'] == results['vectorized'], 'Rankings of both paths differ.'
@@ -0,0 +1,126 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Benchmark: counting candidate patterns of a corpus (`modules/grampat_discover.py`)
+    - extract: sentences/sec of `sent_to_candidates` against `sent_to_pats` on tree strings
+    - count: memory and time of counting a synthetic stream of candidates with a `Counter` of strings
+      against `PatternCounter` within a budget of `-max_items` counters. Candidates follow a Zipfian
+      distribution over `-num_distinct` patterns and are counted in worker chunks, like
+      `discover_grampat.py`. Reported: retained and peak memory, the largest pruned count (`floor`), the
+      recall of candidates counted at least `-min_count` times, and the largest error of ranked counts.
+      Bounds are checked: true counts lie between guaranteed counts and max counts, and candidates
+      counted more than `floor` times are kept.
+    About 100M tokens of BNC-like text give 100-200M candidates.
+    Usage: python -m benchmarks.bench_discover -num_candidates 20000000 -max_items 1000000
+    -------------------------------------------------------------------------------------------------
+"""
+
+import time
+import argparse
+import tracemalloc
+import numpy as np
+from collections import Counter
+from modules.shallow_parser import shallow_parse_batch
+from modules.tree_reader import read_tree_line
+from modules.grampat import sent_to_pats
+from modules.grampat_discover import sent_to_candidates, pattern_hash, PatternCounter
+
+heads = ['V', 'N', 'ADJ']
+elements = ['n', 'v', 'adj', 'adv', 'v-ing', 'v-ed', 'to', 'that', 'wh', 'amount'] + \
+    'about after against among as at between by for from in into of on over through with and'.split()
+
+def to_pattern(pat_id):
+    """ A distinct synthetic candidate for every ID, e.g., 'V about n'. """
+    pat = [heads[pat_id % len(heads)]]
+    pat_id //= len(heads)
+    while True:
+        pat.append(elements[pat_id % len(elements)])
+        pat_id //= len(elements)
+        if not pat_id: break
+    return ' '.join(pat)
+
+def iter_chunks(num_candidates, num_distinct, chunk_size, seed=0):
+    """ Yields `Counter`s of candidates of worker chunks. """
+    rng = np.random.RandomState(seed)
+    for start in range(0, num_candidates, chunk_size):
+        pat_ids = (rng.zipf(1.1, min(chunk_size, num_candidates - start)) - 1) % num_distinct
+        pat_ids, counts = np.unique(pat_ids, return_counts=True)
+        yield Counter({to_pattern(pat_id): count for pat_id, count in zip(pat_ids.tolist(), counts.tolist())})
+
+def count_exact(args):
+    pat_counts = Counter()
+    for chunk in iter_chunks(args.num_candidates, args.num_distinct, args.chunk_size):
+        pat_counts.update(chunk)
+    return pat_counts
+
+def count_bounded(args):
+    counter = PatternCounter(args.max_items, args.min_count)
+    for chunk in iter_chunks(args.num_candidates, args.num_distinct, args.chunk_size):
+        counter.update(chunk)
+    return counter
+
+def measure(func, *args):
+    """ Returns the result, seconds, retained MB and peak MB of `func(*args)`.
+        Memory is traced in a second run, since tracing slows allocations down.
+    """
+    start = time.perf_counter()
+    func(*args)
+    sec = time.perf_counter() - start
+    tracemalloc.start()
+    result = func(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, sec, current / 2**20, peak / 2**20
+
+def bench_extract(in_path, repeat):
+    with open(in_path) as in_file:
+        tree_strs = [read_tree_line(line) for line in in_file if line.strip()]
+    parsed_sents = [parsed for parsed in shallow_parse_batch(tree_strs, ignore_errors=True) if parsed]
+    for name, func in [('sent_to_pats', sent_to_pats), ('sent_to_candidates', sent_to_candidates)]:
+        start, num_items = time.perf_counter(), 0
+        for _ in range(repeat):
+            for parsed in parsed_sents:
+                num_items += len(func(parsed))
+        sec = time.perf_counter() - start
+        print('{:18s}: {:9.1f} sentences/sec, {:6.2f} results/sentence'.format(
+            name, len(parsed_sents) * repeat / sec, num_items / len(parsed_sents) / repeat))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark counting candidate patterns within a memory budget')
+    parser.add_argument('-in_path', type=str, default='data/src.tree.txt',
+                        help='The *file* path to the tree strings for the extraction benchmark.')
+    parser.add_argument('-repeat', type=int, default=20,
+                        help='The number of passes over the input file.')
+    parser.add_argument('-num_candidates', type=int, default=20000000,
+                        help='The number of synthetic candidates to count.')
+    parser.add_argument('-num_distinct', type=int, default=50000000,
+                        help='The number of distinct synthetic candidates.')
+    parser.add_argument('-chunk_size', type=int, default=500000,
+                        help='The number of candidates per worker chunk.')
+    parser.add_argument('-max_items', type=int, default=1000000,
+                        help='The budget of counters of `PatternCounter`.')
+    parser.add_argument('-min_count', type=int, default=50,
+                        help='The minimum count of ranked candidates.')
+    args = parser.parse_args()
+
+    bench_extract(args.in_path, args.repeat)
+
+    exact, exact_sec, exact_mb, exact_peak_mb = measure(count_exact, args)
+    counter, sec, mb, peak_mb = measure(count_bounded, args)
+    frequent = {pat: count for pat, count in exact.items() if count >= args.min_count}
+    ranked = {pat: (count, max_count) for pat, count, max_count in counter.most_common()}
+    recall = np.mean([pat in ranked for pat in frequent]) if frequent else 1.0
+    max_error = max([max_count - count for count, max_count in ranked.values()] or [0])
+    assert counter.total == sum(exact.values()) and all(pat in frequent for pat in ranked)
+    assert all(count <= exact[pat] <= max_count for pat, (count, max_count) in ranked.items()), \
+        'True counts are out of bounds.'
+    kept = set(counter.keys.tolist())
+    assert all(pattern_hash(pat) in kept for pat, count in exact.items() if count > counter.floor), \
+        'Candidates counted more than the largest pruned count are lost.'
+    print('{} candidates, {} distinct, {} counted at least {} times'.format(
+        counter.total, len(exact), len(frequent), args.min_count))
+    print('  Counter:        {:6.2f} sec, retained {:8.2f} MB, peak {:8.2f} MB, {:9d} counters'.format(
+        exact_sec, exact_mb, exact_peak_mb, len(exact)))
+    print('  PatternCounter: {:6.2f} sec, retained {:8.2f} MB, peak {:8.2f} MB, {:9d} counters'.format(
+        sec, mb, peak_mb, len(counter)))
+    print('  largest pruned count {}, recall {:.4f} of candidates counted at least min_count times, '
+          'largest count error {}, {} ranked'.format(counter.floor, recall, max_error, len(ranked)))
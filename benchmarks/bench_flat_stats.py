@@ -0,0 +1,101 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Benchmark: memory and time of counting with nested dicts of strings vs. interned keys (`FlatStats`)
+    Synthetic aligned patterns with Zipfian pattern pairs, headwords and n-gram examples are counted
+    in chunks and merged, like `compute_grampat.py`. Strings are built per occurrence, like the
+    results of `sent_to_pats`.
+    Reported: retained and peak memory of the merged statistics, bytes of pickled chunks sent back by
+    workers, and seconds of counting (and of building nested dicts for output).
+    Usage: python -m benchmarks.bench_flat_stats -num_pats 1000000
+    -------------------------------------------------------------------------------------------------
+"""
+
+import time
+import pickle
+import random
+import argparse
+import tracemalloc
+from modules.grampat_stats import new_count_dict, new_ngram_dict, add_parallel_pats, merge_counts, FlatStats
+
+def make_events(num_pats, num_pat_pairs, num_heads, num_ngrams, rng):
+    """ Indices (pattern pair, headword, n-gram) of synthetic aligned patterns, one per sentence. """
+    pair_ids = rng.choices(range(num_pat_pairs), [1 / (i + 1) for i in range(num_pat_pairs)], k=num_pats)
+    head_ids = rng.choices(range(num_heads), [1 / (i + 1) for i in range(num_heads)], k=num_pats)
+    ngram_ids = rng.choices(range(num_ngrams), [1 / (i + 1) for i in range(num_ngrams)], k=num_pats)
+    return list(zip(pair_ids, head_ids, ngram_ids))
+
+def to_parallel_pats(event):
+    """ `align_parallel_pats` result of an event, with new strings. """
+    pair_id, head_id, ngram_id = event
+    head = 'HEAD{}'.format(head_id)
+    src_pat, tgt_pat = 'V about n{}'.format(pair_id % 40), 'V n{}'.format(pair_id)
+    src_ngram = '{} about example {}'.format(head.lower(), ngram_id)
+    tgt_ngram = '{} example {}'.format(head.lower(), ngram_id)
+    return [[(head, src_pat, src_ngram, (0, 3)), (head, tgt_pat, tgt_ngram, (0, 2))]]
+
+def count_nested(events, max_ngrams, chunk_size):
+    count_dict, ngram_dict, chunk_bytes = new_count_dict(), new_ngram_dict(), 0
+    for i in range(0, len(events), chunk_size):
+        chunk_count_dict, chunk_ngram_dict = new_count_dict(), new_ngram_dict()
+        for event in events[i:i+chunk_size]:
+            add_parallel_pats(chunk_count_dict, chunk_ngram_dict, to_parallel_pats(event), max_ngrams)
+        chunk_bytes += len(pickle.dumps((chunk_count_dict, chunk_ngram_dict)))
+        merge_counts(count_dict, chunk_count_dict)
+        merge_counts(ngram_dict, chunk_ngram_dict, max_ngrams)
+    return (count_dict, ngram_dict), chunk_bytes
+
+def count_flat(events, max_ngrams, chunk_size):
+    stats, chunk_bytes = FlatStats(max_ngrams), 0
+    for i in range(0, len(events), chunk_size):
+        chunk_stats = FlatStats(max_ngrams)
+        for event in events[i:i+chunk_size]:
+            chunk_stats.add_parallel_pats(to_parallel_pats(event))
+        chunk_bytes += len(pickle.dumps(chunk_stats))
+        stats.merge(chunk_stats)
+    return stats, chunk_bytes
+
+def measure(func, *args):
+    """ Returns the result, seconds, retained MB and peak MB of `func(*args)`.
+        Memory is traced in a second run, since tracing slows allocations down.
+    """
+    start = time.perf_counter()
+    func(*args)
+    sec = time.perf_counter() - start
+    tracemalloc.start()
+    result = func(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, sec, current / 2**20, peak / 2**20
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark counting with interned keys')
+    parser.add_argument('-num_pats', type=int, default=1000000,
+                        help='The number of aligned patterns.')
+    parser.add_argument('-num_pat_pairs', type=int, default=400,
+                        help='The number of distinct (source pattern, target pattern) pairs.')
+    parser.add_argument('-num_heads', type=int, default=5000,
+                        help='The number of headwords.')
+    parser.add_argument('-num_ngrams', type=int, default=200,
+                        help='The number of distinct n-gram examples per headword.')
+    parser.add_argument('-chunk_size', type=int, default=50000,
+                        help='The number of aligned patterns per worker chunk.')
+    parser.add_argument('-max_ngrams', type=int, nargs='+', default=[0, 20],
+                        help='The n-gram limits to benchmark (0: unbounded).')
+    args = parser.parse_args()
+
+    events = make_events(args.num_pats, args.num_pat_pairs, args.num_heads, args.num_ngrams, random.Random(0))
+    for max_ngrams in args.max_ngrams:
+        (nested, nested_bytes), nested_sec, nested_mb, nested_peak_mb = measure(
+            count_nested, events, max_ngrams, args.chunk_size)
+        (flat, flat_bytes), flat_sec, flat_mb, flat_peak_mb = measure(count_flat, events, max_ngrams, args.chunk_size)
+        output, output_sec, _, output_peak_mb = measure(flat.to_nested)
+        assert output == nested, 'Statistics of interned keys differ from nested dicts.'
+        del nested, output
+        print('max_ngrams={:3d}: {:8d} cells, {:8d} counts of n-grams'.format(
+            max_ngrams, len(flat.counts), len(flat.ngram_counts) if not max_ngrams else
+            sum(map(len, flat.ngram_counts.values()))))
+        print('  nested: {:6.2f} sec, retained {:8.2f} MB, peak {:8.2f} MB, chunks {:8.2f} MB'.format(
+            nested_sec, nested_mb, nested_peak_mb, nested_bytes / 2**20))
+        print('  flat:   {:6.2f} sec, retained {:8.2f} MB, peak {:8.2f} MB, chunks {:8.2f} MB'.format(
+            flat_sec, flat_mb, flat_peak_mb, flat_bytes / 2**20))
+        print('  to_nested for output: {:6.2f} sec, peak {:8.2f} MB'.format(output_sec, output_peak_mb))
@@ -0,0 +1,97 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Benchmark: `get_inconsistent_dict` on a synthetic corpus-sized `count_dict`
+    Compared with the previous implementation, which checked a list of visited pattern sets
+    and re-tokenized patterns for every pair of every headword.
+    Its prepositions held '    on' instead of 'on', thus cases of pattern pairs changing 'on' are only
+    found now, and they are left out of the comparison.
+    Usage: python -m benchmarks.bench_inconsistent -num_heads 20000 -num_rows 1000000
+    -------------------------------------------------------------------------------------------------
+"""
+
+import time
+import random
+import argparse
+from modules.grampat import cobuild_pats
+from modules.grampat_stats import new_count_dict
+from query_grampat import get_head_stpat_dict, get_inconsistent_dict
+
+# The previous prepositions, copied as they were: the continued line of the indented literal made '    on'
+# instead of 'on', thus pattern pairs changing 'on' were never inconsistent.
+pgPreps = 'in_favor_of|_|about|after|against|among|as|at|between|behind|by|for|from|in|into|of|\
+    on|upon|over|through|to|towards|toward|under|with'.split('|')
+otherPreps ='out|'.split('|')
+legacy_preps = set(pgPreps + otherPreps)
+
+def changes_on(case):
+    """ Whether the pattern pair of an inconsistent case differs by 'on'. """
+    src_pat, tgt_pat = next(iter(case)).split(' -> ')
+    return 'on' in set(src_pat.split()).symmetric_difference(tgt_pat.split())
+
+def legacy_get_inconsistent_dict(head_stpat_dict):
+    """ Reference path: the previous implementation, with the previous prepositions. """
+    inconsistent_dict = {}
+    for head in head_stpat_dict.keys():
+        if head == '*': continue
+        visited_pats = []
+        for src_pat in head_stpat_dict[head].keys():
+            for tgt_pat in head_stpat_dict[head][src_pat].keys():
+                if src_pat != '*' and tgt_pat != '*' and src_pat != tgt_pat \
+                and head_stpat_dict[head].get(tgt_pat) and head_stpat_dict[head][tgt_pat].get(src_pat)\
+                and {src_pat, tgt_pat} not in visited_pats\
+                and set(src_pat.split()).symmetric_difference(set(tgt_pat.split()))\
+                and not set(src_pat.split()).symmetric_difference(set(tgt_pat.split())) - legacy_preps:
+                    inconsistent_dict.setdefault(head, []).append({
+                        f'{src_pat} -> {tgt_pat}': head_stpat_dict[head][src_pat][tgt_pat],
+                        f'{tgt_pat} -> {src_pat}': head_stpat_dict[head][tgt_pat][src_pat],
+                        f'{src_pat} -> {src_pat}': head_stpat_dict[head][src_pat].get(src_pat, 0),
+                        f'{tgt_pat} -> {tgt_pat}': head_stpat_dict[head][tgt_pat].get(tgt_pat, 0)
+                    })
+                    visited_pats.append({src_pat, tgt_pat})
+    return inconsistent_dict
+
+def make_count_dict(num_heads, num_rows, rng):
+    """ Synthetic `count_dict` of COBUILD patterns with Zipfian headwords and patterns.
+        Most instances keep their pattern, others change into a random pattern of the same headword POS.
+    """
+    pats_by_pos = {}
+    for pat in sorted(cobuild_pats.pats):
+        pats_by_pos.setdefault(pat.split()[0], []).append(pat)
+    pos_list = sorted(pats_by_pos)
+    heads = ['HEAD{}'.format(i) for i in range(num_heads)]
+    head_weights = [1 / (i + 1) for i in range(num_heads)]
+    count_dict = new_count_dict()
+    for head_id in rng.choices(range(num_heads), head_weights, k=num_rows):
+        pats = pats_by_pos[pos_list[head_id % len(pos_list)]]
+        src_pat = pats[min(int(rng.expovariate(0.05)), len(pats) - 1)]
+        tgt_pat = src_pat if rng.random() < 0.5 else pats[min(int(rng.expovariate(0.05)), len(pats) - 1)]
+        count_dict[src_pat][tgt_pat][heads[head_id]] += 1
+    return count_dict
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark inconsistent grammar pattern detection')
+    parser.add_argument('-num_heads', type=int, default=20000,
+                        help='The number of headwords.')
+    parser.add_argument('-num_rows', type=int, default=1000000,
+                        help='The number of counted instances.')
+    parser.add_argument('-seed', type=int, default=0,
+                        help='The random seed.')
+    args = parser.parse_args()
+
+    count_dict = make_count_dict(args.num_heads, args.num_rows, random.Random(args.seed))
+    head_stpat_dict = get_head_stpat_dict(count_dict)
+    num_pairs = sum(len(tgt_dict) for stpat_dict in head_stpat_dict.values() for tgt_dict in stpat_dict.values())
+    print('{} headwords, {} (head, src_pat, tgt_pat) entries'.format(len(head_stpat_dict), num_pairs))
+
+    results = {}
+    for name, func in [('legacy', legacy_get_inconsistent_dict), ('current', get_inconsistent_dict)]:
+        start = time.perf_counter()
+        results[name] = dict(func(head_stpat_dict))
+        sec = time.perf_counter() - start
+        print('{:8s}: {:8.3f} sec, {} inconsistent cases'.format(
+            name, sec, sum(len(cases) for cases in results[name].values())))
+    # Only pairs changing 'on' are new.
+    without_on = {head: [case for case in cases if not changes_on(case)] for head, cases in results['current'].items()}
+    print('{} cases change "on", which were missed by the previous prepositions'.format(
+        sum(changes_on(case) for cases in results['current'].values() for case in cases)))
+    assert results['legacy'] == {head: cases for head, cases in without_on.items() if cases}
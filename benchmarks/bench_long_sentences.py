@@ -0,0 +1,57 @@
+""" 
+    -------------------------------------------------------------------------------------------------
+    Scaling benchmark: `shallow_parse` time per sentence on long sentences (100+ tokens)
+    Long trees are built by joining sample trees under one root.
+    Usage: python -m benchmarks.bench_long_sentences -in_path data/src.tree.txt
+    -------------------------------------------------------------------------------------------------
+"""
+
+import time
+import argparse
+from nltk.tree import Tree
+from modules.shallow_parser import shallow_parse
+from modules.tree_reader import read_tree_line
+
+def read_trees(in_path):
+    trees = []
+    with open(in_path) as in_file:
+        for line in in_file:
+            try:
+                tree = Tree.fromstring(read_tree_line(line))
+            except:
+                continue
+            # Skip trees broken by bracket words, e.g., "(-LRB- ()".
+            if all(len(subtree) for subtree in tree.subtrees()):
+                trees.append(tree)
+    return trees
+
+def make_long_tree_str(trees, min_len):
+    """ Join the children of sample trees under one root until it has at least `min_len` words. """
+    children, length = [], 0
+    while length < min_len:
+        for tree in trees:
+            children.extend(tree)
+            length += len(tree.leaves())
+            if length >= min_len: break
+    return Tree('S', children).pformat(margin=float('inf'))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark shallow parser on long sentences')
+    parser.add_argument('-in_path', type=str, default='data/src.tree.txt',
+                        help='The *file* path to the tree strings.')
+    parser.add_argument('-lengths', type=int, nargs='+', default=[25, 50, 100, 200, 400, 800],
+                        help='The minimum sentence lengths (words) to benchmark.')
+    parser.add_argument('-repeat', type=int, default=5,
+                        help='The number of runs per length.')
+    args = parser.parse_args()
+    
+    trees = read_trees(args.in_path)
+    shallow_parse(make_long_tree_str(trees, 1)) # Warm up the lemmatizer
+    for min_len in args.lengths:
+        tree_str = make_long_tree_str(trees, min_len)
+        num_words = len(Tree.fromstring(tree_str).leaves())
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            shallow_parse(tree_str)
+        sec = (time.perf_counter() - start) / args.repeat
+        print('{:5d} words: {:9.2f} ms/sentence, {:7.2f} us/word'.format(num_words, sec * 1e3, sec / num_words * 1e6))
@@ -0,0 +1,73 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Benchmark: memory, output size and top-5 recall of bounded `ngram_dict` (`-max_ngrams`)
+    Synthetic aligned patterns with Zipfian headwords and n-gram examples are counted in chunks
+    and merged, like `compute_grampat.py`.
+    Usage: python -m benchmarks.bench_ngram_cap -max_ngrams 0 5 20 100
+    -------------------------------------------------------------------------------------------------
+"""
+
+import time
+import dill
+import random
+import argparse
+import tracemalloc
+from modules.grampat_stats import new_count_dict, new_ngram_dict, add_parallel_pats, merge_counts
+
+def make_parallel_pats(num_pats, num_heads, num_ngrams, rng):
+    """ Synthetic `align_parallel_pats` results, one aligned pattern per sentence. """
+    heads = ['HEAD{}'.format(i) for i in range(num_heads)]
+    head_weights = [1 / (i + 1) for i in range(num_heads)]
+    ngram_weights = [1 / (i + 1) for i in range(num_ngrams)]
+    parallel_pats = []
+    for head in rng.choices(heads, head_weights, k=num_pats):
+        i = rng.choices(range(num_ngrams), ngram_weights)[0]
+        ngram = '{} example {}'.format(head.lower(), i)
+        parallel_pats.append([[(head, 'V about n', ngram, (0, 2)), (head, 'V n', ngram, (0, 1))]])
+    return parallel_pats
+
+def count(parallel_pats, max_ngrams, chunk_size):
+    count_dict, ngram_dict = new_count_dict(), new_ngram_dict()
+    for i in range(0, len(parallel_pats), chunk_size):
+        chunk_count_dict, chunk_ngram_dict = new_count_dict(), new_ngram_dict()
+        for pats in parallel_pats[i:i+chunk_size]:
+            add_parallel_pats(chunk_count_dict, chunk_ngram_dict, pats, max_ngrams)
+        merge_counts(count_dict, chunk_count_dict)
+        merge_counts(ngram_dict, chunk_ngram_dict, max_ngrams)
+    return count_dict, ngram_dict
+
+def top_ngrams(ngram_dict, k=5):
+    return {head: set(sorted(ngrams, key=ngrams.get, reverse=True)[:k])
+            for head, ngrams in ngram_dict['V about n']['V n'].items()}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark bounded n-gram examples')
+    parser.add_argument('-num_pats', type=int, default=500000,
+                        help='The number of aligned patterns.')
+    parser.add_argument('-num_heads', type=int, default=2000,
+                        help='The number of headwords.')
+    parser.add_argument('-num_ngrams', type=int, default=2000,
+                        help='The number of distinct n-gram examples per headword.')
+    parser.add_argument('-chunk_size', type=int, default=50000,
+                        help='The number of aligned patterns per worker chunk.')
+    parser.add_argument('-max_ngrams', type=int, nargs='+', default=[0, 5, 20, 100],
+                        help='The n-gram limits to benchmark (0: unbounded).')
+    args = parser.parse_args()
+
+    parallel_pats = make_parallel_pats(args.num_pats, args.num_heads, args.num_ngrams, random.Random(0))
+    exact_top = None
+    for max_ngrams in args.max_ngrams:
+        tracemalloc.start()
+        start = time.perf_counter()
+        _, ngram_dict = count(parallel_pats, max_ngrams, args.chunk_size)
+        sec = time.perf_counter() - start
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        size_mb = len(dill.dumps(ngram_dict)) / 2**20
+        num_ngrams = sum(len(ngrams) for ngrams in ngram_dict['V about n']['V n'].values())
+        top = top_ngrams(ngram_dict)
+        # Top-5 recall against the unbounded run (or the first run).
+        exact_top = exact_top or top
+        recall = sum(len(top[head] & exact_top[head]) for head in exact_top) / sum(map(len, exact_top.values()))
+        print('max_ngrams={:4d}: {:8d} n-grams, {:6.2f} sec, peak {:8.2f} MB, output {:7.2f} MB, top-5 recall {:.3f}'.format(
+            max_ngrams, num_ngrams, sec, peak_mb, size_mb, recall))
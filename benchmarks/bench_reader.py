@@ -0,0 +1,94 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Benchmark: input reading of `compute_grampat.py` on plain and compressed synthetic corpora
+    - read: lines/sec of `ParallelReader` alone, and of the previous `readline()` loop on plain files
+    - overlap: seconds of reading while the main thread waits for workers (emulated by sleeping as
+      long as reading a block takes), without prefetch and with `-prefetch` blocks read ahead
+    Usage: python -m benchmarks.bench_reader -num_lines 200000 -batch_size 4096
+    -------------------------------------------------------------------------------------------------
+"""
+
+import os
+import bz2
+import gzip
+import lzma
+import time
+import shutil
+import argparse
+import tempfile
+from modules.input_reader import ParallelReader
+from benchmarks.make_corpus import load_templates, make_corpus, write_corpus
+
+def legacy_read_parallel(src_file, tgt_file, batch_size=1024):
+    """ Reference path: the previous reader of text files, one `readline()` per line. """
+    while True:
+        parallel_lines = []
+        num_lines = 0
+        for _ in range(batch_size):
+            src_line = src_file.readline()
+            tgt_line = tgt_file.readline()
+            if not src_line and not tgt_line:
+                break
+            num_lines += 1
+            src_line, tgt_line = src_line.strip(), tgt_line.strip()
+            if src_line and tgt_line:
+                parallel_lines.append((src_line, tgt_line))
+        if num_lines:
+            yield parallel_lines
+        if num_lines < batch_size:
+            return
+
+def compress(path, suffix, open_func):
+    with open(path, 'rb') as in_file, open_func(path + suffix, 'wb') as out_file:
+        shutil.copyfileobj(in_file, out_file)
+    return path + suffix
+
+def run(src_path, tgt_path, batch_size, prefetch, work_sec=0):
+    """ Returns seconds to read all blocks, sleeping `work_sec` per block, and the number of lines. """
+    start = time.perf_counter()
+    num_lines = 0
+    with ParallelReader(src_path, tgt_path, block_size=batch_size, prefetch=prefetch) as reader:
+        for block in reader:
+            num_lines += len(block.parallel_lines)
+            time.sleep(work_sec)
+    return time.perf_counter() - start, num_lines
+
+def run_legacy(src_path, tgt_path, batch_size):
+    start = time.perf_counter()
+    with open(src_path) as src_file, open(tgt_path) as tgt_file:
+        num_lines = sum(len(lines) for lines in legacy_read_parallel(src_file, tgt_file, batch_size))
+    return time.perf_counter() - start, num_lines
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pipelined input reader')
+    parser.add_argument('-in_src_path', type=str, default='data/src.tree.txt',
+                        help='The source *file* path to the template tree strings.')
+    parser.add_argument('-in_tgt_path', type=str, default='data/tgt.tree.txt',
+                        help='The target *file* path to the template tree strings.')
+    parser.add_argument('-num_lines', type=int, default=200000,
+                        help='The number of parallel lines of the synthetic corpus.')
+    parser.add_argument('-batch_size', type=int, default=4096,
+                        help='The number of lines per block.')
+    parser.add_argument('-prefetch', type=int, default=2,
+                        help='The number of blocks read ahead.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        templates = load_templates(args.in_src_path, args.in_tgt_path)
+        src_path, tgt_path = write_corpus(make_corpus(templates, args.num_lines), tmp_path)
+        print('{} lines, {:.1f} MB per side'.format(args.num_lines, os.path.getsize(src_path) / 2**20))
+        inputs = [('plain', src_path, tgt_path)]
+        for suffix, open_func in [('.gz', gzip.open), ('.xz', lzma.open), ('.bz2', bz2.open)]:
+            inputs.append((suffix[1:], compress(src_path, suffix, open_func), compress(tgt_path, suffix, open_func)))
+
+        sec, num_lines = run_legacy(src_path, tgt_path, args.batch_size)
+        print('{:6s} {:>10s}: {:8.3f} sec, {:10.0f} lines/sec'.format('plain', 'readline', sec, num_lines / sec))
+        for name, in_src_path, in_tgt_path in inputs:
+            read_sec, num_lines = run(in_src_path, in_tgt_path, args.batch_size, 0)
+            print('{:6s} {:>10s}: {:8.3f} sec, {:10.0f} lines/sec'.format(name, 'read', read_sec, num_lines / read_sec))
+            # Workers take as long as reading, thus reading is hidden at best.
+            work_sec = read_sec / -(-args.num_lines // args.batch_size)
+            for prefetch in [0, args.prefetch]:
+                sec, _ = run(in_src_path, in_tgt_path, args.batch_size, prefetch, work_sec)
+                print('{:6s} {:>10s}: {:8.3f} sec with workers, {:8.3f} sec waiting for input'.format(
+                    name, 'prefetch={}'.format(prefetch), sec, max(0, sec - read_sec)))
@@ -0,0 +1,50 @@
+""" 
+    -------------------------------------------------------------------------------------------------
+    Micro-benchmark: `sent_to_pats` vs. matching every n-gram with `ngram_to_pats`
+    Usage: python -m benchmarks.bench_sent_to_pats -in_path data/src.tree.txt
+    -------------------------------------------------------------------------------------------------
+"""
+
+import time
+import argparse
+from modules.shallow_parser import shallow_parse_batch
+from modules.tree_reader import read_tree_line
+from modules.grampat import sent_to_pats, sent_to_ngram, ngram_to_pats, ngram_to_head
+
+def per_ngram_pats(parsed):
+    """ Reference path: match every n-gram of `sent_to_ngram` on its own. """
+    pats = []
+    for start, end in sent_to_ngram(*parsed):
+        pat = ngram_to_pats(*parsed, start, end)
+        if pat: 
+            head = ngram_to_head(*parsed, start, end)
+            lexicons = ' '.join([' '.join(x) for x in parsed[0][start:end] ])
+            pats.append((head, pat, lexicons, (start, end-1)))
+    return pats
+
+def bench(func, parsed_sents, repeat):
+    num_pats = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for parsed in parsed_sents:
+            num_pats += len(func(parsed))
+    sec = time.perf_counter() - start
+    return num_pats / sec, len(parsed_sents) * repeat / sec
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark grammar pattern extraction (patterns/sec)')
+    parser.add_argument('-in_path', type=str, default='data/src.tree.txt',
+                        help='The *file* path to the tree strings.')
+    parser.add_argument('-repeat', type=int, default=20,
+                        help='The number of passes over the input file.')
+    args = parser.parse_args()
+    
+    with open(args.in_path) as in_file:
+        tree_strs = [read_tree_line(line) for line in in_file if line.strip()]
+    parsed_sents = [parsed for parsed in shallow_parse_batch(tree_strs, ignore_errors=True) if parsed]
+    assert all(sent_to_pats(parsed) == per_ngram_pats(parsed) for parsed in parsed_sents)
+    
+    print('Sentences: {}'.format(len(parsed_sents)))
+    for name, func in [('ngram_to_pats', per_ngram_pats), ('sent_to_pats', sent_to_pats)]:
+        pats_per_sec, sents_per_sec = bench(func, parsed_sents, args.repeat)
+        print('{:14s}: {:10.1f} patterns/sec, {:9.1f} sentences/sec'.format(name, pats_per_sec, sents_per_sec))
@@ -0,0 +1,87 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Load generator: latency percentiles of `serve_grampat.py` under concurrent clients
+    The service runs in this process on a free local port. Every client sends parallel sentence
+    requests of the sample lines over a keep-alive HTTP connection, one after another.
+    Micro-batching (`-max_batch`) is compared with one request per batch.
+    Usage: python -m benchmarks.bench_service -in_src_path data/src.tree.txt -in_tgt_path data/tgt.tree.txt
+    -------------------------------------------------------------------------------------------------
+"""
+
+import json
+import time
+import argparse
+import threading
+import http.client
+from modules.shallow_parser import set_lemmatizer, get_lemmatizer
+from serve_grampat import GrampatService, make_server
+
+def client(port, requests, latencies):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    for request in requests:
+        start = time.perf_counter()
+        conn.request('POST', '/', json.dumps(request), {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+def run(parallel_lines, num_clients, num_requests, max_batch, max_wait):
+    service = GrampatService(max_batch=max_batch, max_wait=max_wait)
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    latencies = [[] for _ in range(num_clients)]
+    threads = []
+    for i in range(num_clients):
+        lines = [parallel_lines[(i * num_requests + j) % len(parallel_lines)] for j in range(num_requests)]
+        requests = [{'src_tree': src_line, 'tgt_tree': tgt_line} for src_line, tgt_line in lines]
+        threads.append(threading.Thread(target=client, args=(port, requests, latencies[i])))
+    start = time.perf_counter()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    sec = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+    return sec, sorted(latency for client_latencies in latencies for latency in client_latencies), service.batcher.counters
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark latency of the grammar pattern service')
+    parser.add_argument('-in_src_path', type=str, default='data/src.tree.txt',
+                        help='The source *file* path to the tree strings.')
+    parser.add_argument('-in_tgt_path', type=str, default='data/tgt.tree.txt',
+                        help='The target *file* path to the tree strings.')
+    parser.add_argument('-clients', type=int, nargs='+', default=[1, 8, 32],
+                        help='The numbers of concurrent clients to benchmark.')
+    parser.add_argument('-num_requests', type=int, default=100,
+                        help='The number of requests per client.')
+    parser.add_argument('-max_batch', type=int, nargs='+', default=[1, 64],
+                        help='The maximum batch sizes to benchmark (1: no batching).')
+    parser.add_argument('-max_wait_ms', type=float, default=0,
+                        help='The maximum time (ms) to wait for more requests of a batch.')
+    parser.add_argument('-spacy_model', type=str, default='en_core_web_lg',
+                        help='The spaCy model for the "spacy" lemmatizer.')
+    parser.add_argument('-lemma_table', type=str, default=None,
+                        help='The *file* path to the lookup table. If given, the "lookup" lemmatizer is used.')
+    args = parser.parse_args()
+
+    if args.lemma_table:
+        set_lemmatizer('lookup', table_path=args.lemma_table)
+    else:
+        set_lemmatizer('spacy', model=args.spacy_model)
+    get_lemmatizer().load()
+    with open(args.in_src_path) as in_src_file, open(args.in_tgt_path) as in_tgt_file:
+        parallel_lines = [(src_line.strip(), tgt_line.strip()) for src_line, tgt_line in zip(in_src_file, in_tgt_file)
+                          if src_line.strip() and tgt_line.strip()]
+
+    for num_clients in args.clients:
+        for max_batch in args.max_batch:
+            sec, latencies, counters = run(parallel_lines, num_clients, args.num_requests, max_batch, args.max_wait_ms / 1000)
+            print('clients={:3d} max_batch={:3d}: {:8.1f} req/sec, mean batch {:6.1f}, '
+                  'p50 {:7.2f} ms, p90 {:7.2f} ms, p99 {:7.2f} ms, max {:7.2f} ms'.format(
+                num_clients, max_batch, len(latencies) / sec, counters['requests'] / counters['batches'],
+                *(1000 * percentile(latencies, p) for p in (50, 90, 99)), 1000 * latencies[-1]))
@@ -0,0 +1,46 @@
+""" 
+    -------------------------------------------------------------------------------------------------
+    Throughput benchmark: per-sentence `shallow_parse` vs. batched `shallow_parse_batch`
+    Usage: python -m benchmarks.bench_shallow_parse -in_path data/src.tree.txt
+    -------------------------------------------------------------------------------------------------
+"""
+
+import time
+import argparse
+from modules.shallow_parser import shallow_parse, shallow_parse_batch
+from modules.tree_reader import read_tree_line
+
+def read_tree_strs(in_path, repeat=1):
+    with open(in_path) as in_file:
+        tree_strs = [read_tree_line(line) for line in in_file if line.strip()]
+    return tree_strs * repeat
+
+def bench_per_sentence(tree_strs):
+    start = time.perf_counter()
+    for tree_str in tree_strs:
+        try:
+            shallow_parse(tree_str)
+        except:
+            pass
+    return len(tree_strs) / (time.perf_counter() - start)
+
+def bench_batch(tree_strs, batch_size):
+    start = time.perf_counter()
+    for _ in shallow_parse_batch(tree_strs, batch_size=batch_size, ignore_errors=True):
+        pass
+    return len(tree_strs) / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark shallow parser throughput (sentences/sec)')
+    parser.add_argument('-in_path', type=str, default='data/src.tree.txt',
+                        help='The *file* path to the tree strings.')
+    parser.add_argument('-repeat', type=int, default=10,
+                        help='The number of times to repeat the input file.')
+    parser.add_argument('-batch_size', type=int, default=1024,
+                        help='The number of sentences buffered by spacy pipeline.')
+    args = parser.parse_args()
+    
+    tree_strs = read_tree_strs(args.in_path, args.repeat)
+    print('Sentences: {}'.format(len(tree_strs)))
+    print('shallow_parse       : {:10.1f} sentences/sec'.format(bench_per_sentence(tree_strs)))
+    print('shallow_parse_batch : {:10.1f} sentences/sec'.format(bench_batch(tree_strs, args.batch_size)))
@@ -0,0 +1,58 @@
+""" 
+    -------------------------------------------------------------------------------------------------
+    Startup benchmark: import time and resident memory of the shallow parser per lemmatizer backend
+    Every backend is measured in a fresh process, like a joblib worker.
+    Usage: python -m benchmarks.bench_startup -in_path data/src.tree.txt -lemma_table data/lemma.tsv
+    -------------------------------------------------------------------------------------------------
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+from modules.tree_reader import read_tree_line
+
+# Run in a fresh process: import the module, then parse one sentence (which loads the lemmatizer).
+child_code = '''
+import sys, json, time, resource
+start = time.perf_counter()
+from modules.shallow_parser import shallow_parse, set_lemmatizer
+import_sec = time.perf_counter() - start
+set_lemmatizer(**json.loads(sys.argv[1]))
+start = time.perf_counter()
+shallow_parse(sys.argv[2])
+load_sec = time.perf_counter() - start
+# ru_maxrss is in kilobytes on Linux.
+print(json.dumps({'import_sec': import_sec, 'first_parse_sec': load_sec,
+                  'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+'''
+
+def measure(lemmatizer_config, tree_str):
+    output = subprocess.check_output([sys.executable, '-c', child_code, json.dumps(lemmatizer_config), tree_str])
+    return json.loads(output.decode().strip().split('\n')[-1])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark shallow parser startup time and memory')
+    parser.add_argument('-in_path', type=str, default='data/src.tree.txt',
+                        help='The *file* path to the tree strings.')
+    parser.add_argument('-spacy_models', type=str, nargs='+', default=['en_core_web_lg', 'en_core_web_sm'],
+                        help='The spaCy models to measure.')
+    parser.add_argument('-lemma_table', type=str, default=None,
+                        help='The *file* path to the lookup table for the "lookup" lemmatizer.')
+    args = parser.parse_args()
+    
+    with open(args.in_path) as in_file:
+        tree_str = read_tree_line(in_file.readline())
+    
+    configs = [{'backend': 'spacy', 'model': model} for model in args.spacy_models]
+    if args.lemma_table:
+        configs.append({'backend': 'lookup', 'table_path': args.lemma_table})
+    
+    for config in configs:
+        try:
+            result = measure(config, tree_str)
+        except subprocess.CalledProcessError:
+            print('{}: failed to load'.format(config))
+            continue
+        print('{}: import {:.3f}s, first parse {:.3f}s, max RSS {:.1f} MB'.format(
+            config, result['import_sec'], result['first_parse_sec'], result['max_rss_mb']))
@@ -0,0 +1,94 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Benchmark: open time, resident memory and cold query latency of statistics files
+    `*.grampat.dill` (fully unpickled) vs. `*.grampat.bin` (memory mapped).
+    Every file is measured in a fresh process.
+    Usage: python -m benchmarks.bench_store -in_path data/dataset_name.grampat.dill
+    -------------------------------------------------------------------------------------------------
+"""
+
+import os
+import sys
+import dill
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+from modules.grampat_store import convert_dill, load_store
+from query_grampat import get_head_stpat_dict, get_topk
+
+# Run in a fresh process: open the file, then look up the top headwords and a count of the first patterns.
+child_code = '''
+import sys, json, time
+from query_grampat import load_file
+def rss_mb():
+    # Current resident memory (ru_maxrss of a child may start at the peak of its parent).
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS')) / 1024
+start_rss = rss_mb()
+start = time.perf_counter()
+stats = load_file(sys.argv[1])
+open_sec = time.perf_counter() - start
+count_dict = stats['count_dict']
+start = time.perf_counter()
+src_pat = next(iter(count_dict))
+tgt_pat = next(iter(count_dict[src_pat]))
+top_heads = sorted(count_dict[src_pat][tgt_pat].items(), key=lambda item: item[1], reverse=True)[:5]
+count = count_dict[src_pat][tgt_pat][top_heads[0][0]]
+query_sec = time.perf_counter() - start
+print(json.dumps({'open_ms': open_sec * 1e3, 'query_ms': query_sec * 1e3, 'rss_mb': rss_mb() - start_rss}))
+'''
+
+def measure(prefix):
+    output = subprocess.check_output([sys.executable, '-c', child_code, prefix],
+                                     env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    return json.loads(output.decode().strip().split('\n')[-1])
+
+def time_queries(name, queries, repeat=1000):
+    for query_name, query in queries:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            query()
+        print('{:4s}: {:28s} {:10.2f} us/query'.format(name, query_name, (time.perf_counter() - start) / repeat * 1e6))
+
+def bench_queries(dill_path, bin_path, topk=5):
+    """ Latency of interactive queries on a loaded dill file vs. the query indexes of a compact file. """
+    with open(dill_path, 'rb') as f:
+        stats = dill.load(f)
+    store = load_store(bin_path)
+    # Query the most frequent pattern pair and a random headword of it.
+    src_pat, tgt_pat = max(((src_pat, tgt_pat) for src_pat, tgt_dict in stats['count_dict'].items()
+                            for tgt_pat in tgt_dict), key=lambda pair: len(stats['count_dict'][pair[0]][pair[1]]))
+    head = random.choice(list(stats['count_dict'][src_pat][tgt_pat]))
+
+    start = time.perf_counter()
+    head_stpat_dict = get_head_stpat_dict(stats['count_dict'])
+    print('dill: get_head_stpat_dict {:10.2f} ms'.format((time.perf_counter() - start) * 1e3))
+    for name, count_dict, head_stpat_dict in [('dill', stats['count_dict'], head_stpat_dict),
+                                              ('bin', store['count_dict'], get_head_stpat_dict(store['count_dict']))]:
+        time_queries(name, [
+            ('top-k heads of pair', lambda: get_topk(count_dict[src_pat][tgt_pat], topk)),
+            ('count of pair, head', lambda: count_dict[src_pat][tgt_pat][head]),
+            ('top-k tgt of head, src', lambda: get_topk(head_stpat_dict[head][src_pat], topk)),
+            ('marginal of head, src', lambda: head_stpat_dict[head][src_pat]['*'])
+        ])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark statistics file formats')
+    parser.add_argument('-in_path', type=str, required=True,
+                        help='The *file* path to the "*.grampat.dill" statistics.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        # `load_file` picks the format by the files under a prefix.
+        dill_prefix, bin_prefix = os.path.join(tmp_path, 'dill'), os.path.join(tmp_path, 'bin')
+        os.symlink(os.path.abspath(args.in_path), dill_prefix + '.grampat.dill')
+        convert_dill(args.in_path, bin_prefix + '.grampat.bin')
+        for name, prefix in [('dill', dill_prefix), ('bin', bin_prefix)]:
+            size_mb = os.path.getsize(os.path.realpath(prefix + '.grampat.' + name)) / 2**20
+            result = measure(prefix)
+            print('{:4s}: {:8.2f} MB file, open {:9.2f} ms, cold query {:8.2f} ms, +{:7.2f} MB RSS'.format(
+                name, size_mb, result['open_ms'], result['query_ms'], result['rss_mb']))
+        bench_queries(args.in_path, bin_prefix + '.grampat.bin')
@@ -0,0 +1,44 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Micro-benchmark: per-line cost of reading tree lines
+    `eval` + NLTK `ParentedTree.fromstring` vs. `read_tree_line` + `parse_tree_str`.
+    Usage: python -m benchmarks.bench_tree_reader -in_path data/src.tree.txt
+    -------------------------------------------------------------------------------------------------
+"""
+
+import time
+import argparse
+from nltk.tree import ParentedTree
+from modules.tree_reader import read_tree_line, parse_tree_str
+
+def nltk_read(line):
+    return ParentedTree.fromstring(eval(line))
+
+def fast_read(line):
+    return parse_tree_str(read_tree_line(line))
+
+def bench(read, lines, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            try:
+                read(line)
+            except:
+                pass
+    return (time.perf_counter() - start) / (repeat * len(lines))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark tree line readers')
+    parser.add_argument('-in_path', type=str, default='data/src.tree.txt',
+                        help='The *file* path to the tree strings.')
+    parser.add_argument('-repeat', type=int, default=20,
+                        help='The number of runs over the input lines.')
+    args = parser.parse_args()
+
+    with open(args.in_path) as in_file:
+        lines = [line for line in in_file if line.strip()]
+
+    base_sec = bench(nltk_read, lines, args.repeat)
+    fast_sec = bench(fast_read, lines, args.repeat)
+    print('eval + ParentedTree:          {:8.2f} us/line'.format(base_sec * 1e6))
+    print('read_tree_line + parse_tree:  {:8.2f} us/line ({:.1f}x)'.format(fast_sec * 1e6, base_sec / fast_sec))
@@ -0,0 +1,90 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Scaling benchmark: `compute_grampat` throughput (lines/sec) by the number of workers
+    - pool: process pool workers load the lemmatizer once in an initializer
+    - joblib: joblib workers, per-chunk tasks
+    Every worker counts a contiguous chunk of lines and returns partial statistics for merging.
+    The sample lines are repeated up to `-num_lines`.
+    Usage: python -m benchmarks.bench_workers -in_src_path data/src.tree.txt -in_tgt_path data/tgt.tree.txt
+    -------------------------------------------------------------------------------------------------
+"""
+
+import time
+import argparse
+import multiprocessing
+from functools import partial
+from joblib import Parallel, delayed
+from modules.grampat_stats import FlatStats
+from compute_grampat import split_chunks, count_parallel_lines, init_worker, count_in_worker
+
+def read_parallel_lines(in_src_path, in_tgt_path, num_lines):
+    with open(in_src_path) as in_src_file, open(in_tgt_path) as in_tgt_file:
+        lines = [(src_line.strip(), tgt_line.strip()) for src_line, tgt_line in zip(in_src_file, in_tgt_file)
+                 if src_line.strip() and tgt_line.strip()]
+    return (lines * (-(-num_lines // len(lines))))[:num_lines]
+
+def run(count_chunks, parallel_lines, batch_size, n_jobs):
+    stats = FlatStats()
+    for i in range(0, len(parallel_lines), batch_size):
+        for chunk_stats, _ in count_chunks(split_chunks(parallel_lines[i:i+batch_size], n_jobs)):
+            stats.merge(chunk_stats)
+    return stats
+
+def bench_pool(parallel_lines, n_jobs, batch_size, worker_kwargs):
+    start = time.perf_counter()
+    with multiprocessing.Pool(n_jobs, initializer=partial(init_worker, **worker_kwargs)) as pool:
+        # Wait until every worker has loaded the lemmatizer.
+        pool.map(count_in_worker, [[]] * n_jobs, chunksize=1)
+        init_sec = time.perf_counter() - start
+        start = time.perf_counter()
+        run(partial(pool.map, count_in_worker), parallel_lines, batch_size, n_jobs)
+    return init_sec, time.perf_counter() - start
+
+def bench_joblib(parallel_lines, n_jobs, batch_size, worker_kwargs):
+    start = time.perf_counter()
+    with Parallel(n_jobs=n_jobs) as parallel:
+        count_chunks = lambda chunks: parallel(delayed(count_parallel_lines)(chunk, **worker_kwargs)
+                                               for chunk in chunks)
+        # Warm up workers, which load the lemmatizer on their first chunk.
+        count_chunks(split_chunks(parallel_lines[:n_jobs], n_jobs))
+        init_sec = time.perf_counter() - start
+        start = time.perf_counter()
+        run(count_chunks, parallel_lines, batch_size, n_jobs)
+    return init_sec, time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark compute_grampat scaling by the number of workers')
+    parser.add_argument('-in_src_path', type=str, default='data/src.tree.txt',
+                        help='The source *file* path to the tree strings.')
+    parser.add_argument('-in_tgt_path', type=str, default='data/tgt.tree.txt',
+                        help='The target *file* path to the tree strings.')
+    parser.add_argument('-num_lines', type=int, default=4000,
+                        help='The number of parallel lines to process.')
+    parser.add_argument('-batch_size', type=int, default=1024,
+                        help='The number of lines per batch.')
+    parser.add_argument('-n_jobs', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='The numbers of workers to benchmark.')
+    parser.add_argument('-modes', type=str, nargs='+', default=['pool', 'joblib'], choices=['pool', 'joblib'],
+                        help='The worker modes to benchmark.')
+    parser.add_argument('-spacy_model', type=str, default='en_core_web_lg',
+                        help='The spaCy model for the "spacy" lemmatizer.')
+    parser.add_argument('-lemma_table', type=str, default=None,
+                        help='The *file* path to the lookup table. If given, the "lookup" lemmatizer is used.')
+    args = parser.parse_args()
+
+    if args.lemma_table:
+        lemmatizer_config = {'backend': 'lookup', 'table_path': args.lemma_table}
+    else:
+        lemmatizer_config = {'backend': 'spacy', 'model': args.spacy_model}
+    worker_kwargs = {'batch_size': args.batch_size, 'lemmatizer_config': lemmatizer_config}
+    benches = {'pool': bench_pool, 'joblib': bench_joblib}
+
+    parallel_lines = read_parallel_lines(args.in_src_path, args.in_tgt_path, args.num_lines)
+    print('{} parallel lines, {} CPUs'.format(len(parallel_lines), multiprocessing.cpu_count()))
+    for mode in args.modes:
+        base_sec = None
+        for n_jobs in args.n_jobs:
+            init_sec, sec = benches[mode](parallel_lines, n_jobs, args.batch_size, worker_kwargs)
+            base_sec = base_sec or sec
+            print('{:6s} n_jobs={:2d}: startup {:6.2f} s, {:9.1f} lines/sec, {:5.2f}x'.format(
+                mode, n_jobs, init_sec, len(parallel_lines) / sec, base_sec / sec))
@@ -0,0 +1,115 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Synthetic parallel tree corpus generator for benchmarks
+    Every synthetic sentence pair coordinates one or more template pairs of `data/*.tree.txt`, thus
+    edits of the target side stay those of real sentence pairs, and their order is kept on both sides.
+    Sentence lengths (in tokens) follow a log-normal distribution, which has the long tail of real
+    corpora. Templates are drawn with replacement, thus short sentences repeat like in real corpora.
+    The same seed generates the same corpus.
+    Usage: python -m benchmarks.make_corpus -num_lines 100000 -out_path data/synthetic
+    -------------------------------------------------------------------------------------------------
+"""
+
+import os
+import json
+import math
+import random
+import argparse
+from modules.tree_reader import parse_tree_str, is_pos, read_tree_line
+
+def tree_to_str(node):
+    """ Linearize (label, children) tuples into a tree string. """
+    if is_pos(node):
+        return '({} {})'.format(*node)
+    return '({} {})'.format(node[0], ' '.join(tree_to_str(child) for child in node[1]))
+
+def count_tokens(node):
+    return 1 if is_pos(node) else sum(count_tokens(child) for child in node[1])
+
+def load_templates(in_src_path, in_tgt_path):
+    """ Returns a list of parallel template trees, skipping lines that cannot be read. """
+    templates = []
+    with open(in_src_path) as in_src_file, open(in_tgt_path) as in_tgt_file:
+        for src_line, tgt_line in zip(in_src_file, in_tgt_file):
+            try:
+                templates.append((parse_tree_str(read_tree_line(src_line)), parse_tree_str(read_tree_line(tgt_line))))
+            except ValueError:
+                continue
+    return templates
+
+def _strip_period(tree):
+    # A coordinated clause does not end with its own sentence-final punctuation.
+    label, children = tree
+    if len(children) > 1 and is_pos(children[-1]) and children[-1][0] == '.':
+        return (label, children[:-1])
+    return tree
+
+def coordinate(trees):
+    """ One sentence of clauses "S1 , S2 , ... and Sk ." (a single tree is returned as is). """
+    if len(trees) == 1:
+        return trees[0]
+    children = []
+    for i, tree in enumerate(trees):
+        if i:
+            children.append(('CC', 'and') if i == len(trees) - 1 else (',', ','))
+        children.append(_strip_period(tree) if i < len(trees) - 1 else tree)
+    return ('S', children)
+
+def make_corpus(templates, num_lines, mean_len=20, sigma=0.6, same_ratio=0, seed=0):
+    """ Yields `num_lines` parallel tree strings.
+        `mean_len`: The median sentence length in tokens.
+        `sigma`: The standard deviation of the log-normal distribution of sentence lengths.
+        `same_ratio`: The share of target sentences copied from their source sentences (no edits).
+    """
+    rng = random.Random(seed)
+    lengths = [count_tokens(src) for src, _ in templates]
+    for _ in range(num_lines):
+        target_len = rng.lognormvariate(math.log(mean_len), sigma)
+        indices, num_tokens = [], 0
+        while num_tokens < target_len:
+            i = rng.randrange(len(templates))
+            # Stop at the number of templates closest to the target length.
+            if indices and num_tokens + lengths[i] - target_len > target_len - num_tokens:
+                break
+            indices.append(i)
+            num_tokens += lengths[i]
+        src_tree_str = tree_to_str(coordinate([templates[i][0] for i in indices]))
+        if rng.random() < same_ratio:
+            yield src_tree_str, src_tree_str
+        else:
+            yield src_tree_str, tree_to_str(coordinate([templates[i][1] for i in indices]))
+
+def write_corpus(parallel_trees, out_path):
+    """ Write parallel tree strings to "<out_path>/src.tree.txt" and "<out_path>/tgt.tree.txt". """
+    if not os.path.exists(out_path):
+        os.makedirs(out_path)
+    out_src_path, out_tgt_path = os.path.join(out_path, 'src.tree.txt'), os.path.join(out_path, 'tgt.tree.txt')
+    with open(out_src_path, 'w') as out_src_file, open(out_tgt_path, 'w') as out_tgt_file:
+        for src_tree_str, tgt_tree_str in parallel_trees:
+            out_src_file.write(json.dumps(src_tree_str) + '\n')
+            out_tgt_file.write(json.dumps(tgt_tree_str) + '\n')
+    return out_src_path, out_tgt_path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic parallel tree corpus from templates')
+    parser.add_argument('-in_src_path', type=str, default='data/src.tree.txt',
+                        help='The source *file* path to the template tree strings.')
+    parser.add_argument('-in_tgt_path', type=str, default='data/tgt.tree.txt',
+                        help='The target *file* path to the template tree strings.')
+    parser.add_argument('-out_path', type=str, required=True,
+                        help='The *folder* path to "src.tree.txt" and "tgt.tree.txt" of the corpus.')
+    parser.add_argument('-num_lines', type=int, default=100000,
+                        help='The number of parallel lines.')
+    parser.add_argument('-mean_len', type=float, default=20,
+                        help='The median sentence length in tokens.')
+    parser.add_argument('-sigma', type=float, default=0.6,
+                        help='The standard deviation of the log-normal distribution of sentence lengths.')
+    parser.add_argument('-same_ratio', type=float, default=0,
+                        help='The share of target sentences copied from their source sentences (no edits).')
+    parser.add_argument('-seed', type=int, default=0,
+                        help='The random seed.')
+    args = parser.parse_args()
+
+    templates = load_templates(args.in_src_path, args.in_tgt_path)
+    print('Writing {} lines from {} templates...'.format(args.num_lines, len(templates)))
+    write_corpus(make_corpus(templates, args.num_lines, args.mean_len, args.sigma, args.same_ratio, args.seed), args.out_path)
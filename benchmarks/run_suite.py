@@ -0,0 +1,212 @@
+"""
+    -------------------------------------------------------------------------------------------------
+    Benchmark suite on a synthetic corpus (see `benchmarks/make_corpus.py`)
+    - shallow_parse, shallow_parse_batch, sent_to_pats, align_parallel_pats: in process, best of `-repeat`
+    - compute_grampat: end-to-end run of the script, with stage timings of its metrics
+    - query_grampat: get_head_stpat_dict, get_inconsistent_dict and get_topk of every parallel pattern,
+      on the dill statistics and on the compact file
+    Results are saved as JSON with the commit, thus runs of two commits can be compared with `-baseline`.
+    Usage: python -m benchmarks.run_suite -num_lines 5000 -out_path bench_results.json [-baseline old.json]
+    -------------------------------------------------------------------------------------------------
+"""
+
+import os
+import sys
+import json
+import time
+import dill
+import platform
+import argparse
+import datetime
+import tempfile
+import subprocess
+import multiprocessing
+from modules.shallow_parser import shallow_parse, shallow_parse_batch, set_lemmatizer, get_lemmatizer
+from modules.grampat import sent_to_pats, align_parallel_pats
+from modules.grampat_store import save_store, load_store
+from query_grampat import get_head_stpat_dict, get_inconsistent_dict, get_topk
+from benchmarks.make_corpus import load_templates, make_corpus, write_corpus
+
+def best_of(func, repeat, min_sec=0.2):
+    """ Returns the minimum seconds per call of `repeat` runs of `func` and the result of the last call.
+        Every run calls `func` as many times as it takes `min_sec` seconds (like `timeit`), thus short
+        workloads are not timer noise.
+    """
+    number, best_sec = 1, None
+    for _ in range(repeat):
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                result = func()
+            sec = time.perf_counter() - start
+            if sec >= min_sec or number >= 1 << 20:
+                break
+            number *= 2
+        best_sec = sec / number if best_sec is None else min(best_sec, sec / number)
+    return best_sec, result
+
+def result(items, unit, sec, **extra):
+    return dict(extra, items=items, unit=unit, sec=sec, items_per_sec=items / sec if sec else None)
+
+def bench_extraction(parallel_tree_strs, repeat):
+    tree_strs = [tree_str for pair in parallel_tree_strs for tree_str in pair]
+    results = {}
+    # Single calls on a sample, since every call starts a lemmatizer stream.
+    sample = tree_strs[:500]
+    sec, _ = best_of(lambda: [shallow_parse(tree_str) for tree_str in sample], repeat)
+    results['shallow_parse'] = result(len(sample), 'sentences', sec)
+    sec, parsed_sents = best_of(lambda: list(shallow_parse_batch(tree_strs, ignore_errors=True)), repeat)
+    results['shallow_parse_batch'] = result(len(tree_strs), 'sentences', sec)
+    sec, pats_list = best_of(lambda: [sent_to_pats(parsed) if parsed is not None else None for parsed in parsed_sents],
+                             repeat)
+    results['sent_to_pats'] = result(len(parsed_sents), 'sentences', sec,
+                                     patterns=sum(len(pats) for pats in pats_list if pats is not None))
+    pairs = [(src_pats, tgt_pats) for src_pats, tgt_pats in zip(pats_list[0::2], pats_list[1::2])
+             if src_pats is not None and tgt_pats is not None]
+    for name, by_position in [('align_parallel_pats', False), ('align_parallel_pats_by_position', True)]:
+        sec, _ = best_of(lambda: [align_parallel_pats(src_pats, tgt_pats, by_position) for src_pats, tgt_pats in pairs],
+                         repeat)
+        results[name] = result(len(pairs), 'sentence pairs', sec)
+    return results
+
+def bench_compute(in_src_path, in_tgt_path, out_path, num_lines, args):
+    """ Run `compute_grampat.py` end-to-end and returns its results and the path to its statistics. """
+    metrics_path = os.path.join(out_path, 'metrics.jsonl')
+    command = [sys.executable, 'compute_grampat.py', '-in_src_path', in_src_path, '-in_tgt_path', in_tgt_path,
+               '-out_path', out_path, '-out_prefix', 'bench', '-n_jobs', str(args.n_jobs),
+               '-batch_size', str(args.batch_size), '-metrics_path', metrics_path]
+    if args.lemma_table:
+        command += ['-lemmatizer', 'lookup', '-lemma_table', args.lemma_table]
+    else:
+        command += ['-spacy_model', args.spacy_model]
+    if args.pool:
+        command += ['-pool']
+    start = time.perf_counter()
+    subprocess.check_call(command, stdout=subprocess.DEVNULL)
+    wall_sec = time.perf_counter() - start
+    with open(metrics_path) as metrics_file:
+        metrics = [json.loads(line) for line in metrics_file][-1]
+    results = {'compute_grampat': result(num_lines, 'lines', metrics['elapsed_sec'], wall_sec=wall_sec,
+                                         sents=metrics['sents'], parsed_sents=metrics['parsed_sents'],
+                                         stages=metrics['stages'])}
+    return results, os.path.join(out_path, 'bench.grampat.dill')
+
+def bench_query(stats, repeat, suffix):
+    results = {}
+    count_dict = stats['count_dict']
+    sec, head_stpat_dict = best_of(lambda: get_head_stpat_dict(count_dict), repeat)
+    results['get_head_stpat_dict' + suffix] = result(len(count_dict), 'source patterns', sec)
+    sec, inconsistent_dict = best_of(lambda: get_inconsistent_dict(head_stpat_dict), repeat)
+    results['get_inconsistent_dict' + suffix] = result(len(head_stpat_dict), 'headwords', sec,
+                                                       cases=sum(map(len, inconsistent_dict.values())))
+    keys = [(src_pat, tgt_pat) for src_pat, tgt_dict in count_dict.items() for tgt_pat in tgt_dict]
+    sec, _ = best_of(lambda: [get_topk(count_dict[src_pat][tgt_pat], 5) for src_pat, tgt_pat in keys], repeat)
+    results['get_topk' + suffix] = result(len(keys), 'queries', sec)
+    return results
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except:
+        return None
+
+def compare(results, baseline, tolerance):
+    """ Print throughput of every benchmark against the baseline, and returns the names of regressions. """
+    regressions = []
+    print('{:36s} {:>14s} {:>14s} {:>8s}'.format('benchmark', 'baseline/sec', 'current/sec', 'ratio'))
+    for name, current in results.items():
+        if name not in baseline or not baseline[name]['items_per_sec'] or not current['items_per_sec']:
+            continue
+        ratio = current['items_per_sec'] / baseline[name]['items_per_sec']
+        regressed = ratio < 1 - tolerance
+        if regressed: regressions.append(name)
+        print('{:36s} {:14.1f} {:14.1f} {:7.2f}x{}'.format(
+            name, baseline[name]['items_per_sec'], current['items_per_sec'], ratio, '  REGRESSION' if regressed else ''))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the benchmark suite on a synthetic corpus')
+    parser.add_argument('-in_src_path', type=str, default='data/src.tree.txt',
+                        help='The source *file* path to the template tree strings.')
+    parser.add_argument('-in_tgt_path', type=str, default='data/tgt.tree.txt',
+                        help='The target *file* path to the template tree strings.')
+    parser.add_argument('-num_lines', type=int, default=5000,
+                        help='The number of parallel lines of the synthetic corpus.')
+    parser.add_argument('-mean_len', type=float, default=20,
+                        help='The median sentence length in tokens.')
+    parser.add_argument('-sigma', type=float, default=0.6,
+                        help='The standard deviation of the log-normal distribution of sentence lengths.')
+    parser.add_argument('-same_ratio', type=float, default=0.2,
+                        help='The share of target sentences copied from their source sentences.')
+    parser.add_argument('-seed', type=int, default=0,
+                        help='The random seed of the synthetic corpus.')
+    parser.add_argument('-repeat', type=int, default=3,
+                        help='The number of runs of in-process benchmarks (the best one is reported).')
+    parser.add_argument('-n_jobs', type=int, default=2,
+                        help='The number of workers of `compute_grampat.py`.')
+    parser.add_argument('-batch_size', type=int, default=1024,
+                        help='The batch size of `compute_grampat.py`.')
+    parser.add_argument('-pool', action='store_true',
+                        help='Run `compute_grampat.py` with a process pool.')
+    parser.add_argument('-spacy_model', type=str, default='en_core_web_lg',
+                        help='The spaCy model for the "spacy" lemmatizer.')
+    parser.add_argument('-lemma_table', type=str, default=None,
+                        help='The *file* path to the lookup table. If given, the "lookup" lemmatizer is used.')
+    parser.add_argument('-out_path', type=str, default='bench_results.json',
+                        help='The *file* path to the JSON results.')
+    parser.add_argument('-baseline', type=str, default=None,
+                        help='The *file* path to JSON results of another run to compare with.')
+    parser.add_argument('-tolerance', type=float, default=0.1,
+                        help='Report benchmarks slower than the baseline by more than this share as regressions.')
+    args = parser.parse_args()
+
+    if args.lemma_table:
+        set_lemmatizer('lookup', table_path=args.lemma_table)
+    else:
+        set_lemmatizer('spacy', model=args.spacy_model)
+    get_lemmatizer().load()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_path:
+        templates = load_templates(args.in_src_path, args.in_tgt_path)
+        parallel_tree_strs = list(make_corpus(templates, args.num_lines, args.mean_len, args.sigma,
+                                              args.same_ratio, args.seed))
+        in_src_path, in_tgt_path = write_corpus(parallel_tree_strs, tmp_path)
+
+        print('Benchmarking extraction...')
+        results.update(bench_extraction(parallel_tree_strs, args.repeat))
+        print('Benchmarking compute_grampat...')
+        compute_results, stats_path = bench_compute(in_src_path, in_tgt_path, tmp_path, args.num_lines, args)
+        results.update(compute_results)
+
+        print('Benchmarking query_grampat...')
+        with open(stats_path, 'rb') as stats_file:
+            stats = dill.load(stats_file)
+        results.update(bench_query(stats, args.repeat, ''))
+        store_path = os.path.join(tmp_path, 'bench.grampat.bin')
+        save_store(store_path, stats['count_dict'], stats['ngram_dict'])
+        results.update(bench_query(load_store(store_path), args.repeat, '_bin'))
+
+    report = {
+        'commit': get_commit(),
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'config': vars(args),
+        'results': results
+    }
+    with open(args.out_path, 'w') as out_file:
+        json.dump(report, out_file, indent=2)
+    print('Results are saved to "{}".'.format(args.out_path))
+
+    for name, bench_result in results.items():
+        print('{:36s} {:10d} {:16s} {:9.3f} sec {:12.1f} /sec'.format(
+            name, bench_result['items'], bench_result['unit'], bench_result['sec'], bench_result['items_per_sec'] or 0))
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        print('Compared with commit {}:'.format(baseline.get('commit')))
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            sys.exit(1)
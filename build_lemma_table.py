@@ -0,0 +1,34 @@
+import os
+import argparse
+from itertools import islice
+from modules.input_reader import open_input
+from modules.shallow_parser import build_lemma_table, SpacyLemmatizer
+from compute_grampat import _safe_read_tree_line
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the lookup table of the "lookup" lemmatizer with a spaCy model')
+    parser.add_argument('-in_path', type=str, required=True,
+                        help='The *file* path to tree strings seperated by newline, e.g., the source and target '
+                             'inputs concatenated (may be compressed: .gz, .xz, .bz2).')
+    parser.add_argument('-out_path', type=str, required=True,
+                        help='The *file* path to the lookup table, e.g., "data/lemma.tsv".')
+    parser.add_argument('-spacy_model', type=str, default='en_core_web_lg',
+                        help='The spaCy model giving the lemmas, e.g., "en_core_web_sm".')
+    parser.add_argument('-batch_size', type=int, default=1000,
+                        help='The number of sentences to lazily processed by spacy pipeline.')
+    parser.add_argument('-max_lines', type=int, default=0,
+                        help='Only read the first N lines (0: all).')
+    args = parser.parse_args()
+
+    out_dir = os.path.dirname(args.out_path)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    print('Building the lookup table of "{}" to "{}"...'.format(args.in_path, args.out_path))
+    with open_input(args.in_path) as in_file:
+        lines = islice(in_file, args.max_lines) if args.max_lines else in_file
+        tree_strs = (_safe_read_tree_line(line.decode('utf-8').strip()) for line in lines)
+        build_lemma_table(tree_strs, args.out_path, SpacyLemmatizer(args.spacy_model), args.batch_size)
+
+    with open(args.out_path) as f:
+        print('Saved {} (word, POS tag) lemmas. Pass -lemmatizer lookup -lemma_table {} to use them.'.format(
+            sum(1 for _ in f), args.out_path))
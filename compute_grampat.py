@@ -1,38 +1,187 @@
 import os
-import dill 
 import argparse
-from collections import defaultdict
-from joblib import Parallel, delayed
-from modules.shallow_parser import shallow_parse
-from modules.grampat import sent_to_pats, align_parallel_pats
+import json
+import datetime
+import multiprocessing
+from itertools import chain
+from collections import Counter
+from functools import partial
+from joblib import Parallel, delayed, effective_n_jobs
+from modules.shallow_parser import shallow_parse_batch, set_lemmatizer, get_lemmatizer
+from modules.tree_reader import read_tree_line
+from modules.input_reader import ParallelReader
+from modules.pat_cache import set_cache, get_cache
+from modules.grampat import sent_to_pats, align_parallel_pats, set_inventory
+from modules.batch_grampat import sents_to_pats
+from modules.grampat_store import save_store
+from modules.stage_timer import add_time, get_time, timed, pop_timings, perf_counter, profiled, stage_times, format_report
+from modules.grampat_stats import FlatStats, count_lines, load_progress, save_checkpoint, iter_checkpoint_parts, remove_checkpoint, save_stats, merge_stats,\
+    parse_shard, shard_lines, iter_stat_files, subtract_counts, digest_file, new_manifest, load_manifest, save_manifest,\
+    find_input, check_input, find_same_content, add_input, remove_input
 
-def lazily_read_parallel(src_file, tgt_file, batch_size=1024):
-    """ Lazy version of for ... in zip(src_file, tgt_file) """
-    stop = False
-    while not stop:
-        parallel_lines = []
-        for _ in range(batch_size):
-            src_line = src_file.readline().strip()
-            tgt_line = tgt_file.readline().strip()
-            if not src_line or not tgt_line:
-                continue
-            if src_line and tgt_line:
-                parallel_lines.append((src_line, tgt_line))
-            else: 
-                stop = True
-                break
-        yield parallel_lines
-        
-def func_to_parallel(parallel_line):
-    src_tree_str, tgt_tree_str = parallel_line
-    parallel_pats = []
+def split_chunks(lines, num_chunks):
+    """ Split lines into at most `num_chunks` contiguous chunks. """
+    chunk_size = max(1, -(-len(lines) // max(1, num_chunks)))
+    return [lines[i:i+chunk_size] for i in range(0, len(lines), chunk_size)]
+
+def _safe_read_tree_line(line):
+    try:
+        return read_tree_line(line)
+    except:
+        return ''
+
+def get_cache_config(args):
+    """ Cache config passed to `set_cache` in every worker, or None if there is no cache. """
+    if not args.cache_size and not args.cache_path:
+        return None
+    return {'max_size': args.cache_size, 'disk_path': args.cache_path, 'namespace': get_cache_namespace(args)}
+
+def get_cache_namespace(args):
+    """ The namespace of cache keys: the config that changes grammar patterns of a tree string.
+        Files of the config (lemma table, pattern inventory) are given by the digests of their contents,
+        thus files regenerated at the same path do not hit stale patterns. `-vectorized` is left out,
+        since both paths give the same patterns.
+    """
+    namespace = [get_lemmatizer_config(args)]
+    if args.lemmatizer == 'lookup':
+        namespace[0] = {'backend': 'lookup', 'table_digest': digest_file(args.lemma_table)}
+    inventory_config = get_inventory_config(args)
+    if inventory_config:
+        namespace.append(dict(inventory_config, path=digest_file(inventory_config['path'])))
+    return json.dumps(namespace, sort_keys=True)
+
+def get_lemmatizer_config(args):
+    """ Lemmatizer config passed to `set_lemmatizer` in every worker. """
+    if args.lemmatizer == 'lookup':
+        return {'backend': 'lookup', 'table_path': args.lemma_table}
+    return {'backend': 'spacy', 'model': args.spacy_model}
+
+def get_inventory_config(args):
+    """ Inventory config passed to `set_inventory` in every worker, or None to match the COBUILD patterns. """
+    if not args.pats_path:
+        return None
+    return {'path': os.path.abspath(args.pats_path), 'top': args.pats_top, 'with_cobuild': args.pats_with_cobuild}
+
+def _safe_sent_to_pats(parsed):
     try:
-        src_pats = sent_to_pats(shallow_parse(eval(src_tree_str)))
-        tgt_pats = sent_to_pats(shallow_parse(eval(tgt_tree_str)))
-        parallel_pats = align_parallel_pats(src_pats, tgt_pats)
+        return sent_to_pats(parsed) if parsed is not None else None
     except:
-        pass
-    return parallel_pats
+        return None
+
+def extract_pats(tree_strs, batch_size=1024, vectorized=False):
+    """ Returns grammar patterns of every tree string (None if it cannot be parsed).
+        Tree strings are shallow parsed in batch.
+        If `vectorized`, grammar patterns are extracted in batch by `batch_grampat`.
+    """
+    with timed('load_lemmatizer'):
+        get_lemmatizer().load()
+    start, chunk_sec = perf_counter(), get_time('chunk_tree')
+    parsed = list(shallow_parse_batch(tree_strs, batch_size=batch_size, ignore_errors=True))
+    # Chunking of tree strings is interleaved with the lemmatizer pipeline, the rest is lemmatization.
+    add_time('lemmatize', perf_counter() - start - (get_time('chunk_tree') - chunk_sec))
+    with timed('grampat'):
+        if vectorized:
+            return sents_to_pats(parsed)
+        return [_safe_sent_to_pats(p) for p in parsed]
+
+def func_to_parallel(parallel_lines, batch_size=1024, lemmatizer_config=None, vectorized=False, by_position=False,
+                     cache_config=None, counters=None, inventory_config=None):
+    """ Returns parallel grammar patterns of every parallel line in a worker chunk.
+        Every distinct tree string of the chunk is extracted once, thus target sentences identical to
+        their source sentences and repeated sentences are not parsed again.
+        If `vectorized`, grammar patterns of the chunk are extracted in batch by `batch_grampat`.
+        If `by_position`, grammar patterns are aligned by nearest n-gram span.
+        `cache_config`: Kwargs of `set_cache` to look up grammar patterns of tree strings seen before.
+        `counters`: Optional `Counter` of sentences, parsed sentences and cache hits.
+        `inventory_config`: Kwargs of `set_inventory` to match a discovered pattern inventory.
+    """
+    if lemmatizer_config:
+        set_lemmatizer(**lemmatizer_config)
+    if inventory_config:
+        set_inventory(**inventory_config)
+    if cache_config:
+        set_cache(**cache_config)
+    cache = get_cache()
+    if counters is None: counters = Counter()
+    
+    with timed('read_tree'):
+        src_tree_strs = [_safe_read_tree_line(src_line) for src_line, _ in parallel_lines]
+        tgt_tree_strs = [_safe_read_tree_line(tgt_line) for _, tgt_line in parallel_lines]
+    
+    # Grammar patterns of distinct tree strings: cached ones, then the rest in order of lines.
+    tree_strs = list(dict.fromkeys(src_tree_strs + tgt_tree_strs))
+    if cache is not None:
+        with timed('cache'):
+            cache_counters = Counter(cache.counters)
+            tree_pats = cache.get_many(tree_strs)
+            counters.update(cache.counters - cache_counters)
+    else:
+        tree_pats = {}
+    new_tree_strs = [tree_str for tree_str in tree_strs if tree_str not in tree_pats]
+    new_tree_pats = list(zip(new_tree_strs, extract_pats(new_tree_strs, batch_size, vectorized)))
+    tree_pats.update(new_tree_pats)
+    if cache is not None:
+        with timed('cache'):
+            cache.put_many(new_tree_pats)
+    
+    counters['lines'] += len(parallel_lines)
+    counters['same_lines'] += sum(src_tree_str == tgt_tree_str for src_tree_str, tgt_tree_str
+                                  in zip(src_tree_strs, tgt_tree_strs))
+    counters['sents'] += len(src_tree_strs) + len(tgt_tree_strs)
+    counters['parsed_sents'] += len(new_tree_strs)
+    
+    start = perf_counter()
+    parallel_pats_list = []
+    for src_tree_str, tgt_tree_str in zip(src_tree_strs, tgt_tree_strs):
+        src_pats, tgt_pats = tree_pats[src_tree_str], tree_pats[tgt_tree_str]
+        parallel_pats = []
+        try:
+            if src_pats is not None and tgt_pats is not None:
+                parallel_pats = align_parallel_pats(src_pats, tgt_pats, by_position)
+        except:
+            pass
+        parallel_pats_list.append(parallel_pats)
+    add_time('align', perf_counter() - start)
+    return parallel_pats_list
+
+def count_parallel_lines(parallel_lines, batch_size=1024, lemmatizer_config=None, vectorized=False, by_position=False,
+                         max_ngrams=0, cache_config=None, profile_dir=None, inventory_config=None):
+    """ Returns partial statistics (`FlatStats`) and counters of a worker chunk.
+        Only the partial aggregates are sent back to the main process for merging, with every pattern,
+        headword and n-gram string once.
+        Counters include seconds of every stage ("time.<stage>") of the chunk.
+        `max_ngrams`: The maximum number of n-gram examples per (src_pat, tgt_pat, head) (0: unbounded).
+        `profile_dir`: Dump cProfile stats of every worker process to this *folder* if it is given.
+    """
+    with profiled(profile_dir, 'worker'):
+        start = perf_counter()
+        stats, counters = FlatStats(max_ngrams), Counter()
+        parallel_pats_list = func_to_parallel(parallel_lines, batch_size, lemmatizer_config, vectorized, by_position,
+                                              cache_config, counters, inventory_config)
+        with timed('aggregate'):
+            for parallel_pats in parallel_pats_list:
+                stats.add_parallel_pats(parallel_pats)
+        add_time('worker', perf_counter() - start)
+        counters.update(pop_timings())
+    return stats, counters
+
+# Arguments of `count_parallel_lines` in a pool worker, set by `init_worker`.
+_worker_kwargs = None
+
+def init_worker(batch_size=1024, lemmatizer_config=None, vectorized=False, by_position=False, max_ngrams=0,
+                cache_config=None, profile_dir=None, inventory_config=None):
+    """ Initializer of process pool workers: load the lemmatizer once per worker. """
+    global _worker_kwargs
+    _worker_kwargs = {'batch_size': batch_size, 'vectorized': vectorized, 'by_position': by_position,
+                      'max_ngrams': max_ngrams, 'cache_config': cache_config, 'profile_dir': profile_dir}
+    if lemmatizer_config:
+        set_lemmatizer(**lemmatizer_config)
+    if inventory_config:
+        set_inventory(**inventory_config)
+    get_lemmatizer().load()
+
+def count_in_worker(parallel_lines):
+    return count_parallel_lines(parallel_lines, **_worker_kwargs)
         
 def main(args):
     """
@@ -52,13 +201,21 @@ def main(args):
             - value: count
     """
         
+    # Statistics are counted with interned keys (`FlatStats`), and nested dicts are only built for output:
     # parallel_pat_dict[src_pat][tgt_pat][head]: count
     # note that src_pat may be as same as tgt_pat
-    count_dict = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-
     # ngram examples for parallel grammar patterns
     # parallel_ngram[src_pat][tgt_pat][head]: (src_ngram, tgt_ngram)
-    ngram_dict = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(int))))
+    stats = FlatStats(args.max_ngrams)
+    
+    lemmatizer_config = get_lemmatizer_config(args)
+    # Negative -n_jobs count back from the number of CPUs, like joblib.
+    n_jobs = effective_n_jobs(args.n_jobs)
+    inventory_config = get_inventory_config(args)
+    
+    # Counters of sentences, parsed sentences, cache hits and seconds of stages ("time.<stage>") of this run.
+    counters = Counter()
+    wall_start = perf_counter()
     
     # Check output path is exists, otherwise create one.
     if not os.path.exists(args.out_path):
@@ -66,54 +223,233 @@ def main(args):
     
     # Print output paths for sanity-check.
     out_path = os.path.join(args.out_path, '{}.grampat.dill'.format(args.out_prefix))
+    checkpoint_path = os.path.join(args.out_path, '{}.checkpoint'.format(args.out_prefix))
+    manifest_path = os.path.join(args.out_path, '{}.grampat.manifest.json'.format(args.out_prefix))
     print('Statistics will be saved to "{}"...'.format(out_path))
     
-    with open(args.in_src_path) as in_src_file, open(args.in_tgt_path) as in_tgt_file,\
-        open(out_path, 'wb') as out_file,\
-        Parallel(n_jobs=args.n_jobs) as parallel:
-
-        # Check if parallel files have the same line count.
-        in_src_file_len = len(in_src_file.readlines())
-        in_tgt_file_len = len(in_tgt_file.readlines())
-        assert in_src_file_len == in_tgt_file_len
-        in_src_file.seek(0), in_tgt_file.seek(0)
+    # Check if parallel files have the same line count.
+    in_src_file_len = count_lines(args.in_src_path)
+    in_tgt_file_len = count_lines(args.in_tgt_path)
+    assert in_src_file_len == in_tgt_file_len, 'Misaligned inputs: "{}" has {} lines, but "{}" has {} lines.'.format(
+        args.in_src_path, in_src_file_len, args.in_tgt_path, in_tgt_file_len)
+    
+    # Only process the lines of the shard.
+    shard_id, num_shards = parse_shard(args.shard)
+    shard_start, shard_end = shard_lines(in_src_file_len, shard_id, num_shards)
+    shard_len = shard_end - shard_start
+    if num_shards > 1:
+        print('Processing shard {}/{}: lines [{}, {})...'.format(shard_id, num_shards, shard_start, shard_end))
+    
+    # Update existing statistics: only count lines not ingested yet, or the lines of inputs to remove.
+    manifest, has_stats = new_manifest(args.max_ngrams), False
+    if inventory_config:
+        manifest['inventory'] = inventory_config
+    if args.update or args.remove:
+        if os.path.exists(out_path):
+            manifest = load_manifest(manifest_path)
+            assert manifest is not None, 'The statistics "{}" have no manifest of ingested inputs.'.format(out_path)
+            assert manifest.get('stats_digest') == digest_file(out_path),\
+                'The statistics "{}" changed since its manifest was saved.'.format(out_path)
+            assert manifest['max_ngrams'] == args.max_ngrams,\
+                'The statistics "{}" were counted with -max_ngrams {}.'.format(out_path, manifest['max_ngrams'])
+            assert manifest.get('inventory') == inventory_config,\
+                'The statistics "{}" were counted with another pattern inventory.'.format(out_path)
+            has_stats = True
+        entry = find_input(manifest, args.in_src_path, args.in_tgt_path)
+        if entry is not None:
+            check_input(entry)
+        if args.remove:
+            assert entry is not None, 'The inputs were never ingested into "{}".'.format(out_path)
+            assert not args.max_ngrams, 'Bounded n-gram examples cannot be removed exactly.'
+            assert len(entry['ranges']) == 1, 'The inputs were ingested in several line ranges.'
+            shard_start, shard_end = entry['ranges'][0]['start'], entry['ranges'][0]['end']
+        elif entry is not None:
+            shard_start = max(line_range['end'] for line_range in entry['ranges'])
+        else:
+            same_entry = find_same_content(manifest, args.in_src_path, args.in_tgt_path, in_src_file_len)
+            if same_entry is not None:
+                print('The inputs were already ingested from "{}" and "{}".'.format(
+                    same_entry['src_path'], same_entry['tgt_path']))
+                return
+        if shard_start >= shard_end:
+            print('No new lines to ingest.')
+            return
+        shard_len = shard_end - shard_start
+        print('{} lines [{}, {})...'.format('Removing' if args.remove else 'Adding', shard_start, shard_end))
+    
+    # Get total batch count.
+    num_iteration = -(-shard_len // args.batch_size)
+    
+    # Resume from the last completed batch, or start over.
+    progress = {
+        'in_src_path': os.path.abspath(args.in_src_path),
+        'in_tgt_path': os.path.abspath(args.in_tgt_path),
+        'batch_size': args.batch_size,
+        'shard': [shard_id, num_shards],
+        'line_range': [shard_start, shard_end],
+        'max_ngrams': args.max_ngrams,
+        'inventory': inventory_config,
+        'num_lines': 0,
+        'src_offset': 0,
+        'tgt_offset': 0,
+        'num_parts': 0
+    }
+    last_progress = load_progress(checkpoint_path)
+    if last_progress and args.resume:
+        assert all(last_progress.get(key) == progress[key]
+                   for key in ['in_src_path', 'in_tgt_path', 'batch_size', 'shard', 'line_range', 'max_ngrams', 'inventory']),\
+            'The checkpoint "{}" is from other inputs, batch size, line range, n-gram limit or pattern inventory.'.format(checkpoint_path)
+        progress = last_progress
+        print('Resuming from line {} ({} parts saved)...'.format(progress['num_lines'], progress['num_parts']))
+    elif last_progress:
+        remove_checkpoint(checkpoint_path)
+    
+    # Every worker counts a contiguous chunk of lines and returns partial statistics.
+    if args.profile_dir and not os.path.exists(args.profile_dir):
+        os.makedirs(args.profile_dir)
+    worker_kwargs = {'batch_size': args.batch_size, 'lemmatizer_config': lemmatizer_config,
+                     'vectorized': args.vectorized, 'by_position': args.align_by_position,
+                     'max_ngrams': args.max_ngrams, 'cache_config': get_cache_config(args),
+                     'profile_dir': args.profile_dir, 'inventory_config': inventory_config}
+    if args.pool:
+        executor = multiprocessing.Pool(n_jobs, initializer=partial(init_worker, **worker_kwargs))
+        count_chunks = partial(executor.map, count_in_worker)
+    else:
+        executor = Parallel(n_jobs=n_jobs)
+        count_chunks = lambda chunks: executor(delayed(count_parallel_lines)(chunk, **worker_kwargs)
+                                               for chunk in chunks)
+    
+    metrics_file = open(args.metrics_path, 'a') if args.metrics_path else None
+    
+    # Batches are read, decompressed and decoded in a background thread while workers count the last ones.
+    reader = ParallelReader(args.in_src_path, args.in_tgt_path, block_size=args.batch_size,
+                            start=shard_start + progress['num_lines'], max_lines=shard_len - progress['num_lines'],
+                            offsets=(progress['src_offset'], progress['tgt_offset']) if progress['num_lines'] else None,
+                            prefetch=args.prefetch)
+    # Line numbers of lines with an empty side, which are not counted.
+    empty_lines = []
+    
+    with reader, executor:
         
-        # Get total line count.
-        num_iteration = in_src_file_len // args.batch_size + 1
+        first_batch_id = progress['num_lines'] // args.batch_size
+        first_num_lines = progress['num_lines']
         
         # Start processing.
-        for batch_id, parallel_lines in enumerate(lazily_read_parallel(in_src_file, in_tgt_file, batch_size=args.batch_size)):
+        start = perf_counter()
+        for batch_id, block in enumerate(reader, start=first_batch_id):
+            # Time waiting for the reader.
+            counters['time.read_input'] += perf_counter() - start
+            parallel_lines = block.parallel_lines
+            empty_lines += block.empty_lines
             print('Processing batch: {}/{}...'.format(batch_id+1, num_iteration), end='\r')
-            parallel_pats = parallel(delayed(func_to_parallel)(parallel_line) for parallel_line in parallel_lines)
+            # Each worker shallow parses a contiguous chunk of lines in batch.
+            chunks = split_chunks(parallel_lines, n_jobs)
+            start = perf_counter()
+            results = count_chunks(chunks)
+            # Time of workers beyond the slowest chunk: worker startup, scheduling, pickling and transfer of chunks and results.
+            counters['time.ipc'] += perf_counter() - start - max([c['time.worker'] for _, c in results], default=0)
             # Save statistics
-            # `parallel_pats`: parallel grammmar patterns of every parallel sentences
-            for pats in parallel_pats:
-                for parallel_pat in pats:
-                    head, src_pat, src_ngram, _ = parallel_pat[0]
-                    head, tgt_pat, tgt_ngram, _ = parallel_pat[1]
-                    count_dict[src_pat][tgt_pat][head] += 1
-                    ngram_dict[src_pat][tgt_pat][head][(src_ngram, tgt_ngram)] += 1
+            # Partial statistics are merged in chunk order, thus keys keep the order of input lines.
+            start = perf_counter()
+            for chunk_stats, chunk_counters in results:
+                counters.update(chunk_counters)
+                stats.merge(chunk_stats)
+            counters['time.merge'] += perf_counter() - start
             
-            print('Done batch: {}/{}...'.format(batch_id+1, num_iteration), end='\r')
+            # Save partial statistics and start over, thus memory is bounded by `checkpoint_every` batches.
+            num_lines = block.end - shard_start
+            if args.checkpoint_every and (batch_id + 1) % args.checkpoint_every == 0:
+                start = perf_counter()
+                progress.update(num_lines=num_lines, src_offset=block.src_offset, tgt_offset=block.tgt_offset)
+                progress = save_checkpoint(checkpoint_path, progress, *stats.to_nested())
+                stats = FlatStats(args.max_ngrams)
+                counters['time.checkpoint'] += perf_counter() - start
             
-            # Stop
-            if batch_id + 1 == num_iteration:
-                break
-        
-        # Save statistics to file
-        print('Saving statistics to "{}"...'.format(out_path))
-        
-        dill.dump({
-            'count_dict': count_dict,
-            'ngram_dict': ngram_dict
-        }, out_file)
+            # Throughput and ETA of this run.
+            elapsed_sec = perf_counter() - wall_start
+            lines_per_sec = (num_lines - first_num_lines) / elapsed_sec
+            eta_sec = (shard_len - num_lines) / lines_per_sec if lines_per_sec else 0
+            print('Done batch: {}/{}, {:.1f} sents/sec, ETA {}...'.format(
+                batch_id+1, num_iteration, counters['sents'] / elapsed_sec, datetime.timedelta(seconds=int(eta_sec))),
+                end='\r')
+            if metrics_file:
+                metrics = {'batch': batch_id + 1, 'num_batches': num_iteration, 'num_lines': num_lines,
+                           'elapsed_sec': elapsed_sec, 'sents': counters['sents'],
+                           'parsed_sents': counters['parsed_sents'], 'empty_lines': len(empty_lines),
+                           'sents_per_sec': counters['sents'] / elapsed_sec, 'lines_per_sec': lines_per_sec,
+                           'eta_sec': eta_sec, 'stages': stage_times(counters)}
+                metrics_file.write(json.dumps(metrics) + '\n')
+                metrics_file.flush()
+            start = perf_counter()
+    
+    print()
+    print('Parsed {} of {} sentences ({} lines with identical source and target, {} cache hits, {} from disk).'.format(
+        counters['parsed_sents'], counters['sents'], counters['same_lines'],
+        counters['cache_hits'] + counters['disk_hits'], counters['disk_hits']))
+    if empty_lines:
+        print('Skipped {} lines with an empty source or target (lines {}{}).'.format(
+            len(empty_lines), ', '.join(map(str, empty_lines[:10])), ', ...' if len(empty_lines) > 10 else ''))
+    
+    # Merge partial statistics of checkpoints, then the rest in order of lines.
+    start = perf_counter()
+    if progress['num_parts'] or has_stats:
+        if progress['num_parts']:
+            print('Merging {} checkpoint parts...'.format(progress['num_parts']))
+        stats_iter = chain(iter_checkpoint_parts(checkpoint_path, progress['num_parts']), [stats])
+        if has_stats:
+            # Apply the statistics of the new (or removed) lines to the existing statistics.
+            print('{} statistics "{}"...'.format('Subtracting from' if args.remove else 'Adding to', out_path))
+            old_stats = next(iter_stat_files([out_path]))
+            if args.remove:
+                delta_count_dict, delta_ngram_dict = merge_stats(stats_iter)
+                count_dict = subtract_counts(old_stats['count_dict'], delta_count_dict)
+                ngram_dict = subtract_counts(old_stats['ngram_dict'], delta_ngram_dict)
+            else:
+                count_dict, ngram_dict = merge_stats(stats_iter, old_stats['count_dict'], old_stats['ngram_dict'],
+                                                     max_ngrams=args.max_ngrams)
+        else:
+            count_dict, ngram_dict = merge_stats(stats_iter, max_ngrams=args.max_ngrams)
+    else:
+        count_dict, ngram_dict = stats.to_nested()
+    
+    # Save statistics to file
+    print('Saving statistics to "{}"...'.format(out_path))
+    save_stats(out_path, count_dict, ngram_dict)
+    
+    # An existing compact file is rewritten with the statistics, thus it is never stale.
+    store_path = os.path.join(args.out_path, '{}.grampat.bin'.format(args.out_prefix))
+    if args.save_index or os.path.exists(store_path):
+        print('Saving statistics with query indexes to "{}"...'.format(store_path))
+        save_store(store_path, count_dict, ngram_dict)
+    
+    # Record the ingested lines, and the statistics they belong to.
+    if args.remove:
+        remove_input(manifest, args.in_src_path, args.in_tgt_path)
+    else:
+        add_input(manifest, args.in_src_path, args.in_tgt_path, shard_start, shard_end)
+    manifest['stats_digest'] = digest_file(out_path)
+    save_manifest(manifest_path, manifest)
+    
+    if progress['num_parts']:
+        remove_checkpoint(checkpoint_path)
+    counters['time.save'] += perf_counter() - start
+    
+    print(format_report(counters, perf_counter() - wall_start))
+    if metrics_file:
+        metrics_file.write(json.dumps({'done': True, 'elapsed_sec': perf_counter() - wall_start,
+                                       'sents': counters['sents'], 'parsed_sents': counters['parsed_sents'],
+                                       'empty_lines': len(empty_lines), 'empty_line_numbers': empty_lines,
+                                       'stages': stage_times(counters)}) + '\n')
+        metrics_file.close()
     
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Get statistics of parallel grammar patterns and examples')
     parser.add_argument('-in_src_path', type=str, required=True,
-                        help='The source *file* path to the input file contained sentences seperated by newline.')
+                        help='The source *file* path to the input file contained sentences seperated by newline '
+                             '(may be compressed: .gz, .xz, .bz2).')
     parser.add_argument('-in_tgt_path', type=str, required=True,
-                        help='The target *file* path to the input file contained sentences seperated by newline.')
+                        help='The target *file* path to the input file contained sentences seperated by newline '
+                             '(may be compressed: .gz, .xz, .bz2).')
     parser.add_argument('-out_path', type=str, required=True,
                         help='The *folder* path to the output files.')
     parser.add_argument('-out_prefix', type=str, required=True,
@@ -122,5 +458,58 @@ if __name__ == '__main__':
                         help='The maximum number of concurrently running jobs for detokenization.')
     parser.add_argument('-batch_size', type=int, default=4096,
                         help='The number of sentences to lazily processed by spacy pipeline.')
+    parser.add_argument('-prefetch', type=int, default=2,
+                        help='The number of batches read ahead in a background thread (0: read in the main thread).')
+    parser.add_argument('-lemmatizer', type=str, default='spacy', choices=['spacy', 'lookup'],
+                        help='The lemmatizer backend: a spaCy model or a (word, POS tag) lookup table.')
+    parser.add_argument('-spacy_model', type=str, default='en_core_web_lg',
+                        help='The spaCy model for the "spacy" lemmatizer, e.g., "en_core_web_sm".')
+    parser.add_argument('-lemma_table', type=str, default=None,
+                        help='The *file* path to the lookup table for the "lookup" lemmatizer.')
+    parser.add_argument('-pool', action='store_true',
+                        help='Use a process pool whose workers load the lemmatizer once at startup instead of joblib.')
+    parser.add_argument('-vectorized', action='store_true',
+                        help='Extract grammar patterns of every worker chunk in batch with NumPy.')
+    parser.add_argument('-checkpoint_every', type=int, default=0,
+                        help='Save partial statistics every N batches to "<out_prefix>.checkpoint" (0: never).')
+    parser.add_argument('-resume', action='store_true',
+                        help='Resume from the last completed batch of the checkpoint.')
+    parser.add_argument('-align_by_position', action='store_true',
+                        help='Align grammar patterns of the same headword by nearest n-gram span instead of order.')
+    parser.add_argument('-max_ngrams', type=int, default=0,
+                        help='Keep at most K most frequent n-gram examples per (src_pat, tgt_pat, head) (0: all).')
+    parser.add_argument('-pats_path', type=str, default=None,
+                        help='The *file* path to a pattern inventory of `discover_grampat.py` to match instead of COBUILD patterns.')
+    parser.add_argument('-pats_top', type=int, default=0,
+                        help='Only match the N most frequent patterns of -pats_path (0: all).')
+    parser.add_argument('-pats_with_cobuild', action='store_true',
+                        help='Match the COBUILD patterns in addition to the patterns of -pats_path.')
+    parser.add_argument('-cache_size', type=int, default=0,
+                        help='The number of grammar pattern results of tree strings cached in every worker (0: no cache).')
+    parser.add_argument('-cache_path', type=str, default=None,
+                        help='The *file* path to a persistent cache (SQLite) shared across runs and workers.')
+    parser.add_argument('-shard', type=str, default='0/1',
+                        help='Only process the i-th of N shards of consecutive lines, given as "i/N" (0 <= i < N).')
+    parser.add_argument('-save_index', action='store_true',
+                        help='Also save statistics with query indexes to the compact file "<out_prefix>.grampat.bin" '
+                             '(an existing one is always rewritten).')
+    parser.add_argument('-update', action='store_true',
+                        help='Add the lines of the inputs not ingested yet to the existing statistics (see the manifest).')
+    parser.add_argument('-remove', action='store_true',
+                        help='Subtract the ingested lines of the inputs from the existing statistics.')
+    parser.add_argument('-metrics_path', type=str, default=None,
+                        help='The *file* path to append JSON lines of throughput, ETA and stage timings of every batch.')
+    parser.add_argument('-profile_dir', type=str, default=None,
+                        help='The *folder* path to dump cProfile stats of every worker ("worker-<pid>.prof").')
     args = parser.parse_args()
+    if args.lemmatizer == 'lookup' and not args.lemma_table:
+        parser.error('-lemma_table is required by the "lookup" lemmatizer.')
+    try:
+        parse_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.update and args.remove:
+        parser.error('-update and -remove cannot be used together.')
+    if (args.update or args.remove) and args.shard != '0/1':
+        parser.error('-update and -remove process whole inputs, thus they cannot be used with -shard.')
     main(args)
\ No newline at end of file
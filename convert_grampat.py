@@ -0,0 +1,12 @@
+import argparse
+from modules.grampat_store import convert_dill
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert statistics of parallel grammar patterns into a compact file')
+    parser.add_argument('-in_path', type=str, required=True,
+                        help='The *file* path to the input statistics, e.g., "data/dataset_name.grampat.dill".')
+    parser.add_argument('-out_path', type=str, required=True,
+                        help='The *file* path to the output statistics, e.g., "data/dataset_name.grampat.bin".')
+    args = parser.parse_args()
+    print('Converting "{}" to "{}"...'.format(args.in_path, args.out_path))
+    convert_dill(args.in_path, args.out_path)
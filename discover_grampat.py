@@ -0,0 +1,92 @@
+import os
+import argparse
+from itertools import islice
+from collections import Counter
+from joblib import Parallel, delayed, effective_n_jobs
+from modules.shallow_parser import shallow_parse_batch, set_lemmatizer
+from modules.input_reader import open_input
+from modules.grampat import cobuild_pats
+from modules.grampat_discover import sent_to_candidates, PatternCounter, write_inventory
+from compute_grampat import split_chunks, get_lemmatizer_config, _safe_read_tree_line
+
+def count_candidates(lines, batch_size=1024, lemmatizer_config=None):
+    """ Returns counts of candidate patterns (`Counter`), and the numbers of sentences and tokens of a worker chunk.
+        Only the counts of the chunk are sent back to the main process for merging.
+    """
+    if lemmatizer_config:
+        set_lemmatizer(**lemmatizer_config)
+    tree_strs = [_safe_read_tree_line(line) for line in lines]
+    pat_counts, num_sents, num_tokens = Counter(), 0, 0
+    for parsed in shallow_parse_batch(tree_strs, batch_size=batch_size, ignore_errors=True):
+        try:
+            pat_counts.update(sent_to_candidates(parsed))
+        except:
+            continue
+        num_sents += 1
+        num_tokens += sum(map(len, parsed[0]))
+    return pat_counts, num_sents, num_tokens
+
+def main(args):
+    counter = PatternCounter(args.max_items, args.min_count)
+    lemmatizer_config = get_lemmatizer_config(args)
+    # Negative -n_jobs count back from the number of CPUs, like joblib.
+    n_jobs = effective_n_jobs(args.n_jobs)
+    num_lines, num_sents, num_tokens = 0, 0, 0
+
+    out_dir = os.path.dirname(args.out_path)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    print('Candidate patterns will be saved to "{}"...'.format(args.out_path))
+
+    with open_input(args.in_path) as in_file, Parallel(n_jobs=n_jobs) as parallel:
+        while True:
+            lines = [line.decode('utf-8').strip() for line in islice(in_file, args.batch_size)]
+            if not lines:
+                break
+            num_lines += len(lines)
+            # Every worker counts a contiguous chunk of lines, and chunk counts are merged in order.
+            chunks = split_chunks([line for line in lines if line], n_jobs)
+            for pat_counts, chunk_sents, chunk_tokens in parallel(
+                    delayed(count_candidates)(chunk, args.batch_size, lemmatizer_config) for chunk in chunks):
+                counter.update(pat_counts)
+                num_sents += chunk_sents
+                num_tokens += chunk_tokens
+            print('{} lines, {} sentences, {} tokens: {} counters (pruned count <= {})'.format(
+                num_lines, num_sents, num_tokens, len(counter), counter.floor))
+
+    ranked = counter.most_common()
+    comments = ['Candidate patterns of "{}": {} sentences, {} tokens, {} candidates counted.'.format(
+                    args.in_path, num_sents, num_tokens, counter.total),
+                'Counts are guaranteed (lower bounds) and true counts are at most max_count. '
+                'Candidates missing here were counted at most {} times (pruned counters).'.format(counter.floor)]
+    write_inventory(args.out_path, ranked, comments)
+    num_cobuild = sum(pat in cobuild_pats for pat, _, _ in ranked)
+    print('Saved {} candidate patterns counted at least {} times ({} COBUILD patterns, {} new).'.format(
+        len(ranked), args.min_count, num_cobuild, len(ranked) - num_cobuild))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Discover grammar patterns by counting candidate patterns of a corpus')
+    parser.add_argument('-in_path', type=str, required=True,
+                        help='The *file* path to the tree strings of a monolingual corpus seperated by newline '
+                             '(may be compressed: .gz, .xz, .bz2).')
+    parser.add_argument('-out_path', type=str, required=True,
+                        help='The *file* path to the ranked candidate patterns, e.g., "bnc.grampat.tsv".')
+    parser.add_argument('-n_jobs', type=int, default=8,
+                        help='The maximum number of concurrently running jobs.')
+    parser.add_argument('-batch_size', type=int, default=4096,
+                        help='The number of sentences to lazily processed by spacy pipeline.')
+    parser.add_argument('-lemmatizer', type=str, default='spacy', choices=['spacy', 'lookup'],
+                        help='The lemmatizer backend: a spaCy model or a (word, POS tag) lookup table.')
+    parser.add_argument('-spacy_model', type=str, default='en_core_web_lg',
+                        help='The spaCy model for the "spacy" lemmatizer, e.g., "en_core_web_sm".')
+    parser.add_argument('-lemma_table', type=str, default=None,
+                        help='The *file* path to the lookup table for the "lookup" lemmatizer.')
+    parser.add_argument('-min_count', type=int, default=10,
+                        help='Only keep candidate patterns guaranteed to be counted at least N times.')
+    parser.add_argument('-max_items', type=int, default=1 << 22,
+                        help='The memory budget: the maximum number of counters (24 bytes each), '
+                             'the smallest counters are pruned beyond it.')
+    args = parser.parse_args()
+    if args.lemmatizer == 'lookup' and not args.lemma_table:
+        parser.error('-lemma_table is required by the "lookup" lemmatizer.')
+    main(args)
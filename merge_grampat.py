@@ -0,0 +1,46 @@
+import os
+import argparse
+from modules.grampat_store import save_store
+from modules.grampat_stats import iter_stat_files, merge_stats, save_stats, load_manifest, save_manifest, merge_manifests,\
+    digest_file
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge statistics of parallel grammar patterns, e.g., of shards')
+    parser.add_argument('-in_paths', type=str, nargs='+', required=True,
+                        help='The *file* paths to the "*.grampat.dill" statistics, in order of lines (e.g., shard 0 to N-1).')
+    parser.add_argument('-out_path', type=str, required=True,
+                        help='The *folder* path to the output files.')
+    parser.add_argument('-out_prefix', type=str, required=True,
+                        help='The prefix file name for statistic files.')
+    parser.add_argument('-max_ngrams', type=int, default=0,
+                        help='Keep at most K most frequent n-gram examples per (src_pat, tgt_pat, head) (0: all).')
+    parser.add_argument('-save_index', action='store_true',
+                        help='Also save statistics with query indexes to the compact file "<out_prefix>.grampat.bin" '
+                             '(an existing one is always rewritten).')
+    args = parser.parse_args()
+    
+    if not os.path.exists(args.out_path):
+        os.makedirs(args.out_path)
+    out_path = os.path.join(args.out_path, '{}.grampat.dill'.format(args.out_prefix))
+    
+    # Merge manifests of ingested inputs first, thus statistics counted differently are refused before merging.
+    manifests = [load_manifest(os.path.splitext(path)[0] + '.manifest.json') for path in args.in_paths]
+    manifest = merge_manifests(manifests, args.max_ngrams) if None not in manifests else None
+    
+    # Inputs are loaded one by one.
+    print('Merging {} statistic files...'.format(len(args.in_paths)))
+    count_dict, ngram_dict = merge_stats(iter_stat_files(args.in_paths), max_ngrams=args.max_ngrams)
+    
+    print('Saving statistics to "{}"...'.format(out_path))
+    save_stats(out_path, count_dict, ngram_dict)
+    
+    # An existing compact file is rewritten with the statistics, thus it is never stale.
+    store_path = os.path.join(args.out_path, '{}.grampat.bin'.format(args.out_prefix))
+    if args.save_index or os.path.exists(store_path):
+        print('Saving statistics with query indexes to "{}"...'.format(store_path))
+        save_store(store_path, count_dict, ngram_dict)
+    
+    # Record the ingested inputs if every statistics file has a manifest, thus the merged file can be updated.
+    if manifest is not None:
+        manifest['stats_digest'] = digest_file(out_path)
+        save_manifest(os.path.join(args.out_path, '{}.grampat.manifest.json'.format(args.out_prefix)), manifest)
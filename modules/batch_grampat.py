@@ -0,0 +1,367 @@
+import numpy as np
+from array import array
+from modules.grampat import get_inventory, sent_to_pats, pronOBJ, mapHead, mapRest, mapRW
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Vectorized grammar pattern extraction over a batch of shallow parsed sentences
+    1. Pack sentences into flat arrays of interned string IDs with per-sentence offsets
+    2. Compute pattern elements of every chunk with NumPy lookup tables
+    3. Match every n-gram of the batch along the pattern trie, one n-gram degree at a time
+    Results are the same as `sent_to_pats`, returned as array records.
+    -------------------------------------------------------------------------------------------------
+"""
+
+class StringTable(object):
+    """ Interned strings: `ids[string]` is the ID, `strings[ID]` is the string. """
+    def __init__(self, strings=()):
+        self.ids = {}
+        self.strings = []
+        for string in strings:
+            self.intern(string)
+
+    def intern(self, string):
+        sid = self.ids.get(string)
+        if sid is None:
+            sid = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return sid
+
+    def __getitem__(self, sid):
+        return self.strings[sid]
+
+    def __len__(self):
+        return len(self.strings)
+
+class SentenceBatch(object):
+    """ Shallow parsed sentences packed into flat arrays.
+        - `words`, `lemmas`, `tags`, `chunks`: String IDs of every word (int32).
+        - `chunk_offsets`: Word offsets of every chunk, chunk c is `[chunk_offsets[c], chunk_offsets[c+1])`.
+        - `sent_offsets`: Chunk offsets of every sentence, sentence s is `[sent_offsets[s], sent_offsets[s+1])`.
+    """
+    def __init__(self, table, words, lemmas, tags, chunks, chunk_offsets, sent_offsets):
+        self.table = table
+        self.words = words
+        self.lemmas = lemmas
+        self.tags = tags
+        self.chunks = chunks
+        self.chunk_offsets = chunk_offsets
+        self.sent_offsets = sent_offsets
+
+    def __len__(self):
+        return len(self.sent_offsets) - 1
+
+    def unpack(self, sent_id):
+        """ Returns the shallow parsed results of a sentence, as `shallow_parse` does. """
+        strings = self.table.strings
+        parsed = [[], [], [], []]
+        for c in range(self.sent_offsets[sent_id], self.sent_offsets[sent_id+1]):
+            start, end = self.chunk_offsets[c], self.chunk_offsets[c+1]
+            for i, field in enumerate([self.words, self.lemmas, self.tags, self.chunks]):
+                parsed[i].append([strings[sid] for sid in field[start:end]])
+        return parsed
+
+def pack_sents(parsed_sents, table=None):
+    """ Pack shallow parsed results (`[lexicons, lemmas, pos_tags, chunk_tags]`) into a `SentenceBatch`.
+    `table`: `StringTable` shared across batches (default: a new one)
+    """
+    table = table if table is not None else StringTable()
+    intern = table.intern
+    # Typed arrays instead of lists, thus no Python int objects are kept while packing.
+    fields = [array('i'), array('i'), array('i'), array('i')]
+    chunk_offsets, sent_offsets = array('q', [0]), array('q', [0])
+    for parsed in parsed_sents:
+        for chunk in zip(*parsed):
+            for field, strings in zip(fields, chunk):
+                field.extend(intern(string) for string in strings)
+            chunk_offsets.append(len(fields[0]))
+        sent_offsets.append(len(chunk_offsets) - 1)
+    words, lemmas, tags, chunks = [np.frombuffer(field, dtype=np.int32) if field else np.zeros(0, dtype=np.int32)
+                                   for field in fields]
+    return SentenceBatch(table, words, lemmas, tags, chunks,
+                         np.frombuffer(chunk_offsets, dtype=np.int64), np.frombuffer(sent_offsets, dtype=np.int64))
+
+# Record of a matched grammar pattern, `start` and `end` are chunk positions as in `sent_to_pats`.
+pat_record_dtype = np.dtype([('sent', np.int32), ('start', np.int32), ('end', np.int32),
+                             ('head', np.int32), ('pat', np.int32)])
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Element lookup tables
+    -------------------------------------------------------------------------------------------------
+"""
+
+def _is_plain_element(string):
+    # Elements which `simplify_pat` keeps as they are (see `grampat.sent_to_pats`)
+    return string == '_' or (string != '' and '_' not in string and string == string.strip() and '  ' not in string)
+
+# Lookup table name, dtype and value of every string `s` given element IDs `ids`
+_lut_features = [
+    ('is_vnj', bool, lambda s, ids: s[:1] in ['V', 'N', 'J'] and s != ''),
+    ('is_to', bool, lambda s, ids: s == 'TO'),
+    ('is_rp', bool, lambda s, ids: s == 'RP'),
+    ('is_vb', bool, lambda s, ids: s[:2] == 'VB'),
+    ('is_w', bool, lambda s, ids: s[:1] == 'W'),
+    ('is_dt', bool, lambda s, ids: s == 'DT'),
+    ('is_cd', bool, lambda s, ids: s == 'CD'),
+    ('is_rb', bool, lambda s, ids: s == 'RB'),
+    ('is_pron_obj', bool, lambda s, ids: s in pronOBJ),
+    ('is_rb_word', bool, lambda s, ids: s in ['enough', 'someway', 'together']),
+    ('is_favour', bool, lambda s, ids: s == 'favour'),
+    ('is_in', bool, lambda s, ids: s == 'in'),
+    ('is_of', bool, lambda s, ids: s == 'of'),
+    ('is_h_np', bool, lambda s, ids: s == 'H-NP'),
+    ('is_plain', bool, lambda s, ids: _is_plain_element(s)),
+    ('rw', np.int32, lambda s, ids: ids[mapRW[s]] if s in mapRW else -1),
+    ('rest_tag', np.int32, lambda s, ids: ids[mapRest[s]] if s in mapRest else
+                                          ids[mapRest[s[:2]]] if s[:2] in mapRest else -1),
+    ('head_chunk', np.int32, lambda s, ids: ids[mapHead[s]] if s in mapHead else ids['*']),
+    ('rest_chunk', np.int32, lambda s, ids: ids[mapHead[s].lower()] if s in mapHead else -1),
+]
+
+def _build_luts(table):
+    """ Lookup tables indexed by string ID.
+        They are cached on the table and only extended for strings interned since the last call.
+    """
+    ids = {element: table.intern(element)
+           for element in ['to', 'favour', '_', 'n n', 'amount', '*', 'V', ','] + list(mapHead.values())
+                        + [v.lower() for v in mapHead.values()] + list(mapRest.values()) + list(mapRW.values())}
+    luts = getattr(table, 'luts', None)
+    if luts is None:
+        luts = table.luts = {name: np.zeros(0, dtype=dtype) for name, dtype, _ in _lut_features}
+    new_strings = table.strings[len(luts['is_vnj']):]
+    if new_strings:
+        for name, dtype, feature in _lut_features:
+            luts[name] = np.append(luts[name], np.array([feature(s, ids) for s in new_strings], dtype=dtype))
+    return ids, luts
+
+def chunk_elements(batch):
+    """ Vectorized `grampat.chunk_to_element` for every chunk of the batch.
+        Returns element IDs as headword and as non-headword, whether the chunk is a headword candidate
+        (verb, noun or adjective) and whether the sentence has to fall back to `sent_to_pats`.
+    """
+    ids, luts = _build_luts(batch.table)
+    num_chunks = len(batch.chunk_offsets) - 1
+    first = batch.chunk_offsets[:-1]
+    last = batch.chunk_offsets[1:] - 1
+    lemma_first, lemma_last = batch.lemmas[first], batch.lemmas[last]
+    tag_first, tag_last = batch.tags[first], batch.tags[last]
+    chunk_last = batch.chunks[last]
+
+    # Previous and next chunks in the same sentence.
+    # The previous chunk of the first chunk is the last chunk, as negative indexing does.
+    sent_sizes = np.diff(batch.sent_offsets)
+    sent_of_chunk = np.repeat(np.arange(len(sent_sizes)), sent_sizes)
+    sent_start, sent_end = batch.sent_offsets[:-1][sent_of_chunk], batch.sent_offsets[1:][sent_of_chunk]
+    chunk_ids = np.arange(num_chunks)
+    prev = np.where(chunk_ids == sent_start, sent_end - 1, chunk_ids - 1)
+    has_next = chunk_ids + 1 < sent_end
+    next_ = np.where(has_next, chunk_ids + 1, chunk_ids)
+
+    # 'DT' after the first word of the chunk.
+    is_dt_word = luts['is_dt'][batch.tags]
+    is_dt_word[first] = False
+    has_dt = np.add.reduceat(is_dt_word, first) > 0 if num_chunks else np.zeros(0, dtype=bool)
+    multi = last > first
+
+    is_to = luts['is_to'][tag_last]
+    favour = luts['is_favour'][lemma_first] & luts['is_in'][batch.words[last[prev]]]
+    # `words[i+1]` raises IndexError at the end of sentence.
+    invalid = favour & ~is_to & ~has_next
+    favour &= luts['is_of'][batch.words[first[next_]]] & has_next
+    rw = luts['rw'][lemma_last]
+    two_objs = luts['is_h_np'][chunk_last] & multi & (luts['is_pron_obj'][tag_first] | has_dt)
+    rest_tag = luts['rest_tag'][tag_last]
+    rest_chunk = luts['rest_chunk'][chunk_last]
+
+    rest = np.select(
+        [is_to,
+         favour,
+         luts['is_rp'][tag_last] & luts['is_vb'][tag_last[prev]],
+         luts['is_w'][tag_first] & (rw >= 0),
+         two_objs,
+         luts['is_cd'][tag_last],
+         luts['is_rb'][tag_last] & luts['is_rb_word'][lemma_last],
+         rest_tag >= 0,
+         rest_chunk >= 0],
+        [ids['to'], ids['favour'], ids['_'], rw, ids['n n'], ids['amount'], lemma_last, rest_tag, rest_chunk],
+        default=lemma_last).astype(np.int32)
+    head = np.where(is_to, rest, luts['head_chunk'][chunk_last]).astype(np.int32)
+
+    # Sentences with elements that `simplify_pat` rewrites fall back to `sent_to_pats`.
+    fallback = np.zeros(len(sent_sizes), dtype=bool)
+    np.logical_or.at(fallback, sent_of_chunk, ~luts['is_plain'][rest] | ~luts['is_plain'][head])
+    invalid_sents = np.zeros(len(sent_sizes), dtype=bool)
+    np.logical_or.at(invalid_sents, sent_of_chunk, invalid)
+
+    return head, rest, luts['is_vnj'][tag_last], fallback | invalid_sents, invalid_sents
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Pattern trie
+    -------------------------------------------------------------------------------------------------
+"""
+
+class PatternTrie(object):
+    """ Trie of a `PatternInventory` over pattern elements split by space. State 0 is the root, -1 is dead. """
+    def __init__(self, inventory):
+        self.children = [{}]
+        self.accepts = [None]
+        for pat in sorted(inventory.pats):
+            state = 0
+            for token in pat.split(' '):
+                if token not in self.children[state]:
+                    self.children[state][token] = len(self.children)
+                    self.children.append({})
+                    self.accepts.append(None)
+                state = self.children[state][token]
+            self.accepts[state] = pat
+
+    def step(self, state, element):
+        """ Next state after an element, which may contain several tokens, e.g., 'n n'. """
+        for token in element.split(' '):
+            state = self.children[state].get(token, -1)
+            if state < 0: break
+        return state
+
+_tries = {}
+
+def _get_trie(inventory):
+    if id(inventory) not in _tries:
+        _tries[id(inventory)] = (inventory, PatternTrie(inventory))
+    return _tries[id(inventory)][1]
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Main API
+    -------------------------------------------------------------------------------------------------
+"""
+
+def batch_sent_to_pats(batch, inventory=None):
+    """ Main API for extracting grammar patterns from a `SentenceBatch`.
+        Returns array records of `pat_record_dtype` ordered by sentence, start and end:
+        sentence ID, start and end (inclusive) chunk positions, headword ID and pattern ID in `batch.table`.
+        Same results as `sent_to_pats` for every sentence, sentences that raise have no patterns.
+    `inventory`: `PatternInventory` to match (default: the inventory of `grampat.set_inventory`, COBUILD patterns)
+    """
+    inventory = get_inventory() if inventory is None else inventory
+    trie = _get_trie(inventory)
+    table = batch.table
+    maxDegree = 9
+
+    head_elements, rest_elements, is_vnj, fallback, invalid = chunk_elements(batch)
+    num_chunks = len(head_elements)
+    sent_sizes = np.diff(batch.sent_offsets)
+    sent_of_chunk = np.repeat(np.arange(len(sent_sizes)), sent_sizes)
+    sent_end = batch.sent_offsets[1:][sent_of_chunk]
+
+    # Headword position of the n-grams starting at every chunk: first verb, noun or adjective onwards.
+    head_pos = np.where(is_vnj, np.arange(num_chunks), num_chunks)
+    head_pos = np.minimum.accumulate(head_pos[::-1])[::-1] if num_chunks else head_pos
+
+    underscore, v_id, comma_id = table.intern('_'), table.intern('V'), table.intern(',')
+    v_pat_id = table.intern('V') if 'V' in inventory else -1
+    # Pattern ID accepted by every trie state
+    pat_ids = np.array([table.intern(pat) if pat else -1 for pat in trie.accepts], dtype=np.int32)
+
+    # Walk the trie for the n-grams of every start position, one degree at a time.
+    starts = np.nonzero(~fallback[sent_of_chunk])[0]
+    states = np.zeros(len(starts), dtype=np.int64)
+    first_elements = None
+    matches = []
+    for d in range(maxDegree - 1):
+        pos = starts + d
+        alive = (pos < sent_end[starts]) & (states >= 0)
+        starts, states, pos = starts[alive], states[alive], pos[alive]
+        if first_elements is not None: first_elements = first_elements[alive]
+        if not len(starts): break
+
+        elements = np.where(pos == head_pos[starts], head_elements[pos], rest_elements[pos])
+        # '_' is dropped by `simplify_pat`, and a leading '_' never matches.
+        if d == 0:
+            first_elements = elements
+            states[elements == underscore] = -1
+        moving = elements != underscore
+
+        # Transit every distinct (state, element) pair once.
+        if moving.any():
+            keys = np.stack([states[moving], elements[moving]], axis=1)
+            uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+            next_states = np.array([trie.step(state, table[element]) if state >= 0 else -1 for state, element in uniq],
+                                   dtype=np.int64)
+            states[moving] = next_states[inverse.reshape(-1)]
+
+        if d == 0: continue
+        matched = np.where(states >= 0, pat_ids[np.maximum(states, 0)], -1)
+        if d == 1:
+            # 'V ,' is simplified to 'V'
+            matched = np.where((first_elements == v_id) & (elements == comma_id), v_pat_id, matched)
+        hit = matched >= 0
+        matches.append((starts[hit], starts[hit] + d, matched[hit]))
+
+    if matches:
+        starts, ends, pats = [np.concatenate(field) for field in zip(*matches)]
+    else:
+        starts, ends, pats = [np.zeros(0, dtype=np.int64)] * 3
+
+    # Headword: lemma of the first headword candidate of the n-gram, with a following particle (RP).
+    heads = head_pos[starts]
+    has_head = heads <= ends
+    sent_ids = sent_of_chunk[starts]
+    last = batch.chunk_offsets[1:] - 1
+    next_head = np.minimum(heads + 1, max(num_chunks - 1, 0))
+    # `tags[i+1]` raises IndexError at the end of sentence.
+    head_at_end = has_head & (heads + 1 >= sent_end[starts])
+    invalid_sents = invalid.copy()
+    invalid_sents[sent_ids[head_at_end]] = True
+    is_rp = _build_luts(table)[1]['is_rp']
+    head_lemma = np.where(has_head, batch.lemmas[last[np.minimum(heads, max(num_chunks - 1, 0))]], -1)
+    rp_lemma = np.where(has_head & ~head_at_end & is_rp[batch.tags[last[next_head]]], batch.lemmas[last[next_head]], -1)
+    head_ids = np.full(len(starts), -1, dtype=np.int32)
+    if len(starts):
+        pairs, inverse = np.unique(np.stack([head_lemma, rp_lemma], axis=1), axis=0, return_inverse=True)
+        pair_ids = np.array([-1 if lemma < 0 else
+                             table.intern(table[lemma].upper() + ('_' + table[rp].upper() if rp >= 0 else ''))
+                             for lemma, rp in pairs], dtype=np.int32)
+        head_ids = pair_ids[inverse.reshape(-1)]
+
+    records = np.zeros(len(starts), dtype=pat_record_dtype)
+    records['sent'] = sent_ids
+    records['start'] = starts - batch.sent_offsets[:-1][sent_ids]
+    records['end'] = ends - batch.sent_offsets[:-1][sent_ids]
+    records['head'] = head_ids
+    records['pat'] = pats
+    records = records[~invalid_sents[sent_ids]]
+
+    # Fallback sentences
+    fallback_records = []
+    for sent_id in np.nonzero(fallback & ~invalid)[0]:
+        try:
+            pats = sent_to_pats(batch.unpack(sent_id), inventory)
+        except Exception:
+            continue
+        for head, pat, _, (start, end) in pats:
+            fallback_records.append((sent_id, start, end, -1 if head is None else table.intern(head), table.intern(pat)))
+    if fallback_records:
+        records = np.concatenate([records, np.array(fallback_records, dtype=pat_record_dtype)])
+
+    return records[np.lexsort((records['end'], records['start'], records['sent']))]
+
+def records_to_pats(batch, records):
+    """ Materialize array records as `sent_to_pats` results, a list of patterns for every sentence. """
+    strings = batch.table.strings
+    sents_pats = [[] for _ in range(len(batch))]
+    for sent_id, start, end, head, pat in records.tolist():
+        offset = batch.sent_offsets[sent_id]
+        lexicons = ' '.join(strings[word]
+                            for word in batch.words[batch.chunk_offsets[offset+start]:batch.chunk_offsets[offset+end+1]])
+        sents_pats[sent_id].append((strings[head] if head >= 0 else None, strings[pat], lexicons, (start, end)))
+    return sents_pats
+
+def sents_to_pats(parsed_sents, inventory=None, table=None):
+    """ `sent_to_pats` for a list of shallow parsed results through the vectorized path.
+        None (unparsable sentence) stays None.
+    """
+    batch = pack_sents([parsed or [[], [], [], []] for parsed in parsed_sents], table)
+    sents_pats = records_to_pats(batch, batch_sent_to_pats(batch, inventory))
+    return [pats if parsed is not None else None for parsed, pats in zip(parsed_sents, sents_pats)]
@@ -52,91 +52,213 @@ def ngram_to_head(words, lemmas, tags, chunks, start, end):
         if tags[i][-1][0] in ['V', 'N', 'J']:
             return lemmas[i][-1].upper()
         
-def ngram_to_pats(words, lemmas, tags, chunks, start, end):
-    #------------------------------------------------------------------------------------------------
-    # Inner functions
-    #------------------------------------------------------------------------------------------------
-    def _chunk_to_element(words, lemmas, tags, chunks, i, isHead):
-        def _has_two_objs(tag, chunk):
-            if chunk[-1] != 'H-NP': return False
-            return (len(tag) > 1 and tag[0] in pronOBJ) or (len(tag) > 1 and 'DT' in tag[1:])    
-        
-        if isHead and not tags[i][-1] == 'TO': return mapHead[chunks[i][-1]] if chunks[i][-1] in mapHead else '*'
-        if tags[i][-1] == 'TO': return 'to' # Make "V to(H-VP) v" to ""V to v" instead "V v v". 
-        if lemmas[i][0] == 'favour' and words[i-1][-1] == 'in' and words[i+1][0] == 'of':
-                                                              return 'favour'
-        
-        if tags[i][-1] == 'RP' and tags[i-1][-1][:2] == 'VB': return '_'
-        if tags[i][0][0] == 'W' and lemmas[i][-1] in mapRW:     return mapRW[lemmas[i][-1]]
-        if _has_two_objs(tags[i], chunks[i]):                 return 'n n'
-        if tags[i][-1] == 'CD':                                 return 'amount'
-        if tags[i][-1] == 'RB' and lemmas[i][-1] in ['enough', 'someway', 'together']:
-                                                              return lemmas[i][-1]
-        if tags[i][-1] in mapRest:                            return mapRest[tags[i][-1]]
-        if tags[i][-1][:2] in mapRest:                        return mapRest[tags[i][-1][:2]]
-        if chunks[i][-1] in mapHead:                          return mapHead[chunks[i][-1]].lower()
-        if lemmas[i][-1] in pgPreps:                          return lemmas[i][-1]
-        return lemmas[i][-1]
-
-    def _simplify_pat(pat):
-        return 'V' if pat == 'V ,' else pat.replace(' _', '').replace('_', ' ').replace('  ', ' ')
-
-    def _is_cobuild_pattern(pat):
-        global verbpat, pgNoun, pgAdj
-        return pat in verbpat + pgNoun + pgAdj
+def chunk_to_element(words, lemmas, tags, chunks, i, isHead):
+    """ Returns the grammar pattern element of the i-th chunk. """
+    def _has_two_objs(tag, chunk):
+        if chunk[-1] != 'H-NP': return False
+        return (len(tag) > 1 and tag[0] in pronOBJ) or (len(tag) > 1 and 'DT' in tag[1:])    
+    
+    if isHead and not tags[i][-1] == 'TO': return mapHead[chunks[i][-1]] if chunks[i][-1] in mapHead else '*'
+    if tags[i][-1] == 'TO': return 'to' # Make "V to(H-VP) v" to ""V to v" instead "V v v". 
+    if lemmas[i][0] == 'favour' and words[i-1][-1] == 'in' and words[i+1][0] == 'of':
+                                                          return 'favour'
+    
+    if tags[i][-1] == 'RP' and tags[i-1][-1][:2] == 'VB': return '_'
+    if tags[i][0][0] == 'W' and lemmas[i][-1] in mapRW:     return mapRW[lemmas[i][-1]]
+    if _has_two_objs(tags[i], chunks[i]):                 return 'n n'
+    if tags[i][-1] == 'CD':                                 return 'amount'
+    if tags[i][-1] == 'RB' and lemmas[i][-1] in ['enough', 'someway', 'together']:
+                                                          return lemmas[i][-1]
+    if tags[i][-1] in mapRest:                            return mapRest[tags[i][-1]]
+    if tags[i][-1][:2] in mapRest:                        return mapRest[tags[i][-1][:2]]
+    if chunks[i][-1] in mapHead:                          return mapHead[chunks[i][-1]].lower()
+    if lemmas[i][-1] in pgPreps:                          return lemmas[i][-1]
+    return lemmas[i][-1]
+
+def simplify_pat(pat):
+    return 'V' if pat == 'V ,' else pat.replace(' _', '').replace('_', ' ').replace('  ', ' ')
+
+class PatternInventory(object):
+    """ Grammar pattern inventory compiled once for matching.
+        `pats`: Set of grammar patterns, e.g., 'V about n'.
+        `prefixes`: Set of every element prefix of every pattern (a flattened trie), e.g., 'V', 'V about'.
+    """
+    def __init__(self, pats):
+        self.pats = frozenset(pats)
+        prefixes = set()
+        for pat in self.pats:
+            elements = pat.split(' ')
+            for i in range(1, len(elements) + 1):
+                prefixes.add(' '.join(elements[:i]))
+        self.prefixes = frozenset(prefixes)
     
-    #------------------------------------------------------------------------------------------------
-    # Main
-    #------------------------------------------------------------------------------------------------
+    def __contains__(self, pat):
+        return pat in self.pats
+    
+    def __len__(self):
+        return len(self.pats)
+
+cobuild_pats = PatternInventory(verbpat + pgNoun + pgAdj)
+
+def load_inventory(path, top=0, min_count=0, with_cobuild=False):
+    """ Load a ranked pattern inventory written by `discover_grampat.py` as a `PatternInventory`.
+        Lines are "pattern<TAB>count<TAB>..." by descending count, and lines starting with '#' are comments.
+    `top`: Keep the `top` first patterns only (0: all)
+    `min_count`: Keep patterns counted at least `min_count` times only
+    `with_cobuild`: Add the COBUILD patterns to the discovered ones
+    """
+    pats = []
+    with open(path) as in_file:
+        for line in in_file:
+            if not line.strip() or line.startswith('#'): continue
+            pat, count = line.rstrip('\n').split('\t')[:2]
+            if int(count) >= min_count:
+                pats.append(pat)
+            if top and len(pats) == top: break
+    return PatternInventory(pats + (list(cobuild_pats.pats) if with_cobuild else []))
+
+# Default inventory of `sent_to_pats` and `batch_grampat`, set by `set_inventory`.
+_inventory_config = None
+_inventory = cobuild_pats
+
+def set_inventory(path=None, top=0, min_count=0, with_cobuild=False):
+    """ Configure the default pattern inventory of this process: the COBUILD patterns if `path` is None,
+        or a discovered inventory (see `load_inventory` for the other arguments).
+        Setting the same config again keeps the loaded inventory.
+    """
+    global _inventory_config, _inventory
+    config = (path, top, min_count, with_cobuild)
+    if config != _inventory_config:
+        _inventory_config = config
+        _inventory = cobuild_pats if path is None else load_inventory(path, top, min_count, with_cobuild)
+
+def get_inventory():
+    """ Returns the default pattern inventory of this process. """
+    return _inventory
+
+def ngram_to_pats(words, lemmas, tags, chunks, start, end):
+    """ Returns the grammar pattern of the n-gram or '' if it is not a COBUILD pattern.
+        Use `sent_to_pats` to match every n-gram of a sentence at once.
+    """
     pat, doneHead = [], False
     
     for i in range(start, end):
         isHead = tags[i][-1][0] in ['V', 'N', 'J'] and not doneHead
-        pat.append(_chunk_to_element(words, lemmas, tags, chunks, i, isHead))
+        pat.append(chunk_to_element(words, lemmas, tags, chunks, i, isHead))
         if isHead: doneHead = True
-    pat = _simplify_pat(' '.join(pat))
+    pat = simplify_pat(' '.join(pat))
+    
+    return pat if pat in cobuild_pats else ''
+
+def _is_plain_element(element):
+    """ Whether `simplify_pat` keeps the element as it is once joined by spaces,
+        thus patterns can be matched incrementally element by element.
+        The '_' element, which `simplify_pat` drops, is handled on its own.
+    """
+    return element != '' and '_' not in element and element == element.strip() and '  ' not in element
+
+def sent_to_windows(parsed, maxDegree=9):
+    """ Returns the headword position of the n-grams starting at every position, and the elements of
+        the longest n-gram of `sent_to_ngram` starting at every position (but the last one).
+        Every chunk is converted once as headword and once as non-headword at most.
+    """
+    words, lemmas, tags, chunks = parsed
+    n = len(words)
+    
+    heads, head = [None] * n, None
+    for i in range(n - 1, -1, -1):
+        if tags[i][-1][0] in ['V', 'N', 'J']: head = i
+        heads[i] = head
     
-    return pat if _is_cobuild_pattern(pat) else ''
+    head_elements, rest_elements = {}, {}
+    windows = []
+    for start in range(n - 1):
+        window = []
+        for i in range(start, min(start + maxDegree - 1, n)):
+            elements = head_elements if i == heads[start] else rest_elements
+            if i not in elements:
+                elements[i] = chunk_to_element(words, lemmas, tags, chunks, i, i == heads[start])
+            window.append(elements[i])
+        windows.append(window)
+    return heads, windows
 
-def sent_to_pats(parsed):
+def sent_to_pats(parsed, inventory=None):
     """ Main API for extracting grammar patterns from parsed results.
     `parsed`: Parsed results from shallow parser
+    `inventory`: `PatternInventory` to match (default: the inventory of `set_inventory`, COBUILD patterns)
+    
+    Same as matching every n-gram of `sent_to_ngram` with `ngram_to_pats`, but the elements of every chunk
+    are computed once, and the n-grams of a start position are extended along the pattern prefixes,
+    stopping as soon as no pattern prefix matches.
     """
+    inventory = _inventory if inventory is None else inventory
+    _, windows = sent_to_windows(parsed)
+    
     pats = []
-    for start, end in sent_to_ngram(*parsed):
-        pat = ngram_to_pats(*parsed, start, end)
-        if pat: 
-            head = ngram_to_head(*parsed, start, end)
-            lexicons = ' '.join([' '.join(x) for x in parsed[0][start:end] ])
-            pats.append((head, pat, lexicons, (start, end-1)))
+    for start, window in enumerate(windows):
+        is_plain = all(element == '_' or _is_plain_element(element) for element in window)
+        pat = ''
+        for degree in range(1, len(window) + 1):
+            element = window[degree - 1]
+            if not is_plain:
+                # Fallback: simplify the whole n-gram.
+                pat = simplify_pat(' '.join(window[:degree]))
+            elif element == '_':
+                # Dropped by `simplify_pat`, or a leading space which never matches.
+                if degree == 1: break
+            else:
+                pat = element if degree == 1 else pat + ' ' + element
+            
+            if degree > 1:
+                matched = 'V' if degree == 2 and window[:2] == ['V', ','] else pat
+                if matched in inventory:
+                    end = start + degree
+                    head = ngram_to_head(*parsed, start, end)
+                    lexicons = ' '.join([' '.join(x) for x in parsed[0][start:end] ])
+                    pats.append((head, matched, lexicons, (start, end-1)))
+            
+            if is_plain and pat not in inventory.prefixes: break
     return pats
 
-def align_parallel_pats(src_pats, tgt_pats):
+def _align_by_position(src_pats, tgt_pats):
+    """ Pair patterns by nearest n-gram span, greedily from the nearest pair. """
+    def _distance(src_pat, tgt_pat):
+        (src_start, src_end), (tgt_start, tgt_end) = src_pat[3], tgt_pat[3]
+        return abs(src_start - tgt_start) + abs(src_end - tgt_end)
+    
+    candidates = sorted((_distance(src_pat, tgt_pat), i, j)
+                        for i, src_pat in enumerate(src_pats) for j, tgt_pat in enumerate(tgt_pats))
+    src_done, tgt_done, pairs = set(), set(), []
+    for _, i, j in candidates:
+        if i in src_done or j in tgt_done: continue
+        src_done.add(i), tgt_done.add(j)
+        pairs.append((i, j))
+    return [[src_pats[i], tgt_pats[j]] for i, j in sorted(pairs)]
+
+def align_parallel_pats(src_pats, tgt_pats, by_position=False):
     """ Main API for aligning grammar patterns from parallel sentences
     `src_pats`: Results from `sent_to_pats` of a source sentence.
     `tgt_pats`: Results from `sent_to_pats` of a target sentence.
+    `by_position`: Pair patterns of the same headword by nearest n-gram span instead of their order.
     """
-    # Intersecting the common headwords.
-    src_heads = set([pat[0] for pat in src_pats])
-    tgt_heads = set([pat[0] for pat in tgt_pats])
-    intersect_heads = list(src_heads & tgt_heads)
-
-    # Group parallel patterns by common headword.
-    # `grouped_parallel_pats` = [[ src_pats, tgt_pats ], ...]
-    # Each [ src_pats, tgt_pats ] is grouped by headword.
-    # Since len(src_pats) probabily !== len(tgt_pats), we need to assure they are 1-to-1 mapping.
-    grouped_parallel_pats = []
-    for head in intersect_heads:
-        grouped_parallel_pats.append([list(filter(lambda pat: pat[0] in head, src_pats)),
-                                      list(filter(lambda pat: pat[0] in head, tgt_pats))])
+    # Group parallel patterns by headword in one pass, keeping their order.
+    # `grouped_parallel_pats` = {head: [ src_pats, tgt_pats ]}
+    grouped_parallel_pats = {}
+    for pat in src_pats:
+        grouped_parallel_pats.setdefault(pat[0], [[], []])[0].append(pat)
+    for pat in tgt_pats:
+        if pat[0] in grouped_parallel_pats:
+            grouped_parallel_pats[pat[0]][1].append(pat)
 
-    # Align parallel patterns from grouped parallel patterns
+    # Align parallel patterns of the common headwords.
     # `parallel_pats` = [[src_pat, tgt_pat], ...]
+    # Since len(src_pats) probabily !== len(tgt_pats), we need to assure they are 1-to-1 mapping.
     parallel_pats = []
-    for grouped_parallel_pat in grouped_parallel_pats: 
-        src_pats_, tgt_pats_ = grouped_parallel_pat[0], grouped_parallel_pat[1]
-        # Map parallel patterns one by one (they are ordered already.)
-        while len(src_pats_) and len(tgt_pats_):
-            parallel_pats.append([src_pats_.pop(0), tgt_pats_.pop(0)])
+    for src_pats_, tgt_pats_ in grouped_parallel_pats.values():
+        if by_position:
+            parallel_pats.extend(_align_by_position(src_pats_, tgt_pats_))
+        else:
+            # Map parallel patterns one by one (they are ordered already.)
+            parallel_pats.extend([src_pat, tgt_pat] for src_pat, tgt_pat in zip(src_pats_, tgt_pats_))
         
-    return parallel_pats
\ No newline at end of file
+    return parallel_pats
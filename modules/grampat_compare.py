@@ -0,0 +1,197 @@
+import numpy as np
+from modules.grampat_store import RowsView
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Cross-corpus comparison of headword x parallel grammar pattern statistics
+    `count_dict`s of several corpora are aligned into one count matrix:
+    - rows: (head, src_pat, tgt_pat) cells counted in any corpus, sorted by (head, src_pat, tgt_pat)
+    - columns: corpora
+    Cells missing from a corpus count 0, thus only the union of observed cells is stored.
+    Frequencies, log-odds, ratios and correction rates of every cell and corpus are computed on whole
+    columns at once, and ranked by `rank`, instead of probing nested dicts one cell at a time.
+    Compact `*.grampat.bin` statistics are read from their columns without building dicts.
+    -------------------------------------------------------------------------------------------------
+"""
+
+def _store_rows(count_dict, pat_ids, head_ids):
+    # (head, src, tgt, count) columns of a compact file, with IDs of `pat_ids` and `head_ids`.
+    store = count_dict.store
+    columns = store.columns['count']
+    pats, heads = store.tables['pat'], store.tables['head']
+    # Only strings of count rows are mapped (string tables also hold those of n-gram rows and '*').
+    pat_map = np.zeros(len(pats), dtype=np.int64)
+    for i in np.union1d(columns['src'], columns['tgt']).tolist():
+        pat_map[i] = pat_ids.setdefault(pats[i], len(pat_ids))
+    head_map = np.zeros(len(heads), dtype=np.int64)
+    for i in np.unique(columns['head']).tolist():
+        head_map[i] = head_ids.setdefault(heads[i], len(head_ids))
+    counts = np.asarray(columns['count'], dtype=np.int64)
+    return head_map[columns['head']], pat_map[columns['src']], pat_map[columns['tgt']], counts
+
+def _dict_rows(count_dict, pat_ids, head_ids):
+    # (head, src, tgt, count) columns of nested dicts, with IDs of `pat_ids` and `head_ids`.
+    rows = []
+    for src_pat, tgt_dict in count_dict.items():
+        src_id = pat_ids.setdefault(src_pat, len(pat_ids))
+        for tgt_pat, head_dict in tgt_dict.items():
+            tgt_id = pat_ids.setdefault(tgt_pat, len(pat_ids))
+            for head, count in head_dict.items():
+                if count:
+                    rows.append((head_ids.setdefault(head, len(head_ids)), src_id, tgt_id, count))
+    rows = np.array(rows, dtype=np.int64).reshape(-1, 4)
+    return rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+
+def _count_rows(count_dict, pat_ids, head_ids):
+    if isinstance(count_dict, RowsView) and (count_dict.lo, count_dict.hi) == (0, len(count_dict.store.columns['count']['count'])):
+        return _store_rows(count_dict, pat_ids, head_ids)
+    return _dict_rows(count_dict, pat_ids, head_ids)
+
+class CorpusComparison(object):
+    """ Count matrix of (head, src_pat, tgt_pat) cells by corpora. See `compare_corpora`.
+        - `names`: Corpus names, in column order.
+        - `pats`, `heads`: Grammar patterns and headwords by ID.
+        - `head_ids`, `src_ids`, `tgt_ids`: IDs of the cell of every row.
+        - `counts`: Counts of every row (cell) and column (corpus).
+    """
+    def __init__(self, names, pats, heads, head_ids, src_ids, tgt_ids, counts):
+        self.names = names
+        self.pats, self.heads = pats, heads
+        self._pat_index = {pat: i for i, pat in enumerate(pats)}
+        self._head_index = {head: i for i, head in enumerate(heads)}
+        self.head_ids, self.src_ids, self.tgt_ids = head_ids, src_ids, tgt_ids
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def column_id(self, name):
+        return self.names.index(name)
+
+    def column(self, name):
+        """ Counts of every cell in the corpus `name`. """
+        return self.counts[:, self.column_id(name)]
+
+    def totals(self):
+        """ Total counts of every corpus. """
+        return self.counts.sum(axis=0)
+
+    def _key_ids(self, keys):
+        ids = {'head': self.head_ids, 'src_pat': self.src_ids, 'tgt_pat': self.tgt_ids}
+        sizes = {'head': len(self.heads), 'src_pat': len(self.pats), 'tgt_pat': len(self.pats)}
+        group_ids = np.zeros(len(self), dtype=np.int64)
+        for key in keys:
+            group_ids = group_ids * sizes[key] + ids[key]
+        return group_ids
+
+    def group_totals(self, *keys):
+        """ Total counts of the rows sharing the values of `keys` ("head", "src_pat" and/or "tgt_pat") of every row,
+            e.g., `group_totals('head', 'src_pat')` counts (head, src_pat, *) of every (head, src_pat, tgt_pat).
+        """
+        _, groups = np.unique(self._key_ids(keys), return_inverse=True)
+        groups = groups.reshape(-1)
+        totals = np.empty(self.counts.shape, dtype=np.int64)
+        for j in range(len(self.names)):
+            totals[:, j] = np.bincount(groups, weights=self.counts[:, j]).astype(np.int64)[groups]
+        return totals
+
+    def select(self, head=None, src_pat=None, tgt_pat=None, changed=None):
+        """ Mask of rows of the given head, src_pat and tgt_pat (None: any).
+            `changed`: Only rows with src_pat != tgt_pat if True, with src_pat == tgt_pat if False.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for value, ids, index in [(head, self.head_ids, self._head_index), (src_pat, self.src_ids, self._pat_index),
+                                  (tgt_pat, self.tgt_ids, self._pat_index)]:
+            if value is not None:
+                mask &= ids == index.get(value, -1)
+        if changed is not None:
+            mask &= (self.src_ids != self.tgt_ids) == changed
+        return mask
+
+    def freq(self, per=1e6):
+        """ Counts of every cell normalized by the total count of its corpus (per `per` patterns). """
+        return self.counts * (per / np.maximum(self.totals(), 1))
+
+    def correction_rate(self):
+        """ Share of (head, src_pat) counts of every (head, src_pat, tgt_pat) in every corpus,
+            i.e., how often `src_pat` of the headword is corrected to `tgt_pat` (or kept if they are the same).
+            Rates of cells whose (head, src_pat) is never counted in a corpus are 0.
+        """
+        totals = self.group_totals('head', 'src_pat')
+        return self.counts / np.maximum(totals, 1)
+
+    def _smoothed(self, name, baseline, counts, alpha):
+        counts = self.counts if counts is None else counts
+        i, j = self.column_id(name), self.column_id(baseline)
+        totals = self.totals()
+        return counts[:, i] + alpha, totals[i] + alpha, counts[:, j] + alpha, totals[j] + alpha
+
+    def log_odds(self, name, baseline, counts=None, alpha=0.5):
+        """ Log-odds ratio of every cell in the corpus `name` against the corpus `baseline`,
+            smoothed by adding `alpha` to counts.
+            `counts`: Counts to compare instead of cell counts, e.g., `group_totals('head', 'src_pat')`
+                      to compare the usage of source patterns of learners against native speakers.
+        """
+        a, a_total, b, b_total = self._smoothed(name, baseline, counts, alpha)
+        return np.log(a / np.maximum(a_total - a, alpha)) - np.log(b / np.maximum(b_total - b, alpha))
+
+    def ratio(self, name, baseline, counts=None, alpha=0.5):
+        """ Ratio of normalized frequencies of every cell in the corpus `name` to the corpus `baseline`,
+            smoothed by adding `alpha` to counts. See `log_odds` for `counts`.
+        """
+        a, a_total, b, b_total = self._smoothed(name, baseline, counts, alpha)
+        return (a / a_total) / (b / b_total)
+
+    def row(self, i):
+        """ (head, src_pat, tgt_pat) of the row `i`. """
+        return self.heads[self.head_ids[i]], self.pats[self.src_ids[i]], self.pats[self.tgt_ids[i]]
+
+    def rank(self, scores, k=10, mask=None):
+        """ Top `k` rows by descending `scores` (NaN scores are skipped), only in `mask` if it is given.
+            Returns a list of dicts of head, src_pat, tgt_pat, score and counts of every corpus.
+        """
+        valid = ~np.isnan(scores)
+        if mask is not None:
+            valid &= mask
+        rows = np.flatnonzero(valid)
+        if k is not None and k < len(rows):
+            # Rows tied with the k-th score are all kept until ties are broken.
+            kth_score = -np.partition(-scores[rows], k - 1)[k - 1]
+            rows = rows[scores[rows] >= kth_score]
+        # Ties are broken by row order (head, src_pat, tgt_pat).
+        rows = rows[np.lexsort((rows, -scores[rows]))][:k]
+        results = []
+        for i in rows.tolist():
+            head, src_pat, tgt_pat = self.row(i)
+            results.append({'head': head, 'src_pat': src_pat, 'tgt_pat': tgt_pat, 'score': float(scores[i]),
+                            'counts': dict(zip(self.names, self.counts[i].tolist()))})
+        return results
+
+def compare_corpora(stats_dict):
+    """ Align `count_dict`s of corpora into a `CorpusComparison`.
+        `stats_dict`: Dict of corpus names to loaded statistics (`query_grampat.load_file` results).
+    """
+    names = list(stats_dict)
+    pat_ids, head_ids = {}, {}
+    corpus_rows = [_count_rows(stats_dict[name]['count_dict'], pat_ids, head_ids) for name in names]
+    # Rows are keyed by (head, src, tgt) IDs in one integer, and corpora are aligned by their keys.
+    num_pats = max(len(pat_ids), 1)
+    keys = np.concatenate([(heads * num_pats + srcs) * num_pats + tgts for heads, srcs, tgts, _ in corpus_rows])
+    row_keys, rows = np.unique(keys, return_inverse=True)
+    rows = rows.reshape(-1)
+    counts = np.zeros((len(row_keys), len(names)), dtype=np.int64)
+    start = 0
+    for j, (_, _, _, corpus_counts) in enumerate(corpus_rows):
+        end = start + len(corpus_counts)
+        counts[rows[start:end], j] = corpus_counts
+        start = end
+
+    # Sort IDs of patterns and headwords by strings, thus rows are sorted by (head, src_pat, tgt_pat) strings.
+    pats, heads = sorted(pat_ids), sorted(head_ids)
+    pat_rank, head_rank = np.empty(max(len(pats), 1), dtype=np.int64), np.empty(max(len(heads), 1), dtype=np.int64)
+    pat_rank[[pat_ids[pat] for pat in pats]] = np.arange(len(pats))
+    head_rank[[head_ids[head] for head in heads]] = np.arange(len(heads))
+    head_col, src_col, tgt_col = (row_keys // num_pats // num_pats, row_keys // num_pats % num_pats, row_keys % num_pats)
+    head_col, src_col, tgt_col = head_rank[head_col], pat_rank[src_col], pat_rank[tgt_col]
+    order = np.lexsort((tgt_col, src_col, head_col))
+    return CorpusComparison(names, pats, heads, head_col[order], src_col[order], tgt_col[order], counts[order])
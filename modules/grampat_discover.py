@@ -0,0 +1,140 @@
+import hashlib
+import numpy as np
+from modules.grampat import sent_to_windows, simplify_pat, cobuild_pats
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Data-driven discovery of grammar patterns from a monolingual corpus
+    Candidate patterns are head-anchored n-grams of pattern elements (see `chunk_to_element`): the
+    simplified elements of the n-grams of `sent_to_ngram` (2 to 8 chunks) starting at a headword,
+    e.g., 'V about n', up to the first element which is not a word (e.g., punctuation).
+    - `sent_to_candidates` lists the distinct candidates of every headword of a sentence.
+    - `PatternCounter` counts candidates of a whole corpus within a fixed budget of `max_items` counters
+      with the Space-Saving algorithm: 64-bit hashes of candidates, their counts and their errors are
+      kept in sorted arrays (24 bytes per counter), and strings are kept only for candidates whose
+      guaranteed count reaches `min_count`. Counts of worker chunks are merged in batch. Whenever there
+      are more than `max_items` counters, the smallest ones are pruned, and candidates counted again
+      later start from the largest pruned count (`floor`) with that much error. Thus every count is an
+      upper bound, the count minus its error is a lower bound (the guaranteed count), and candidates
+      counted more than `floor` times are never missing.
+    - `write_inventory` writes candidates ranked by guaranteed count, to be loaded by `grampat.load_inventory`.
+    -------------------------------------------------------------------------------------------------
+"""
+
+head_elements = frozenset(['V', 'N', 'ADJ'])
+
+def _is_word(element):
+    return element.replace('-', '').isalpha()
+
+def sent_to_candidates(parsed, maxDegree=9):
+    """ Returns candidate patterns of the n-grams starting at every headword of a sentence,
+        every distinct candidate once per headword.
+    `parsed`: Parsed results from shallow parser
+    """
+    heads, windows = sent_to_windows(parsed, maxDegree)
+    candidates = []
+    for start, window in enumerate(windows):
+        if heads[start] != start or window[0] not in head_elements: continue
+        pats = {}
+        for degree in range(2, len(window) + 1):
+            elements = simplify_pat(' '.join(window[:degree])).split(' ')
+            # Longer n-grams keep the element which is not a word.
+            if not all(_is_word(element) for element in elements[1:]): break
+            if len(elements) > 1:
+                pats[' '.join(elements)] = None
+        candidates.extend(pats)
+    return candidates
+
+def pattern_hash(pat):
+    """ 64-bit hash of a pattern, the same in every process (unlike `hash` of strings). """
+    return int.from_bytes(hashlib.blake2b(pat.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class PatternCounter(object):
+    """ Counts of candidate patterns within a fixed budget of counters (Space-Saving, updated in batch).
+        - `keys`: Hashes of counted candidates (sorted).
+        - `counts`: Upper bounds of the counts of candidates.
+        - `errors`: Overestimation of every count, thus `counts` - `errors` is a lower bound (the guaranteed count).
+        - `floor`: The largest pruned count. Candidates missing from `keys` are counted at most `floor` times,
+          thus every candidate counted more than `floor` times is kept.
+        - `names`: Dict of hashes to candidates whose guaranteed count is at least `min_count`.
+        - `total`: The number of counted candidates.
+    """
+    def __init__(self, max_items=1 << 22, min_count=10):
+        self.max_items, self.min_count = max_items, min_count
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.errors = np.zeros(0, dtype=np.int64)
+        self.names = {}
+        self.floor = 0
+        self.total = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, pat_counts):
+        """ Add counts of a dict of candidates, e.g., a `Counter` of `sent_to_candidates` of a worker chunk. """
+        if not pat_counts:
+            return
+        pats = list(pat_counts)
+        keys = np.fromiter((pattern_hash(pat) for pat in pats), dtype=np.uint64, count=len(pats))
+        counts = np.fromiter(pat_counts.values(), dtype=np.int64, count=len(pats))
+        self.total += int(counts.sum())
+        new_keys, inverse = np.unique(keys, return_inverse=True)
+        new_counts = np.bincount(inverse.reshape(-1), weights=counts).astype(np.int64)
+
+        # Counted candidates are added in place. The others are inserted in order, and they may have been
+        # pruned before, thus they start from `floor` with an error of `floor`.
+        ids = np.searchsorted(self.keys, new_keys)
+        found = ids < len(self.keys)
+        found[found] = self.keys[ids[found]] == new_keys[found]
+        self.counts[ids[found]] += new_counts[found]
+        ids, new_keys, new_counts = ids[~found], new_keys[~found], new_counts[~found]
+        self.keys = np.insert(self.keys, ids, new_keys)
+        self.counts = np.insert(self.counts, ids, new_counts + self.floor)
+        self.errors = np.insert(self.errors, ids, self.floor)
+
+        # Strings of the chunk's candidates whose guaranteed count reaches `min_count`.
+        ids = np.searchsorted(self.keys, keys)
+        for i in np.flatnonzero(self.counts[ids] - self.errors[ids] >= self.min_count).tolist():
+            self.names.setdefault(int(keys[i]), pats[i])
+        if len(self.keys) > self.max_items:
+            self.prune(self.max_items)
+
+    def prune(self, max_items):
+        """ Keep the `max_items` largest counts, and raise `floor` to the largest pruned count.
+            Among equal counts, the smallest guaranteed counts (the newest counters) are pruned first.
+        """
+        if len(self.keys) <= max_items:
+            return
+        keep = np.zeros(len(self.keys), dtype=bool)
+        keep[np.lexsort((self.counts - self.errors, self.counts))[-max_items:]] = True
+        pruned_max = int(self.counts[~keep].max())
+        self.floor = max(self.floor, pruned_max)
+        self.keys, self.counts, self.errors = self.keys[keep], self.counts[keep], self.errors[keep]
+        if pruned_max >= self.min_count and self.names:
+            name_keys = np.fromiter(self.names, dtype=np.uint64, count=len(self.names))
+            ids = np.minimum(np.searchsorted(self.keys, name_keys), max(len(self.keys) - 1, 0))
+            kept = self.keys[ids] == name_keys if len(self.keys) else np.zeros(len(name_keys), dtype=bool)
+            self.names = {key: self.names[key] for key in name_keys[kept].tolist()}
+
+    def most_common(self):
+        """ (candidate, count, max_count) of candidates whose guaranteed count is at least `min_count`,
+            by descending guaranteed count and candidate. True counts are between count and max_count.
+        """
+        guaranteed = self.counts - self.errors
+        ids = np.flatnonzero(guaranteed >= self.min_count)
+        items = [(self.names[key], count, max_count) for key, count, max_count
+                 in zip(self.keys[ids].tolist(), guaranteed[ids].tolist(), self.counts[ids].tolist())]
+        return sorted(items, key=lambda item: (-item[1], item[0]))
+
+def write_inventory(out_path, ranked, comments=()):
+    """ Write ranked (candidate, count, max_count) as "pattern<TAB>count<TAB>source<TAB>max_count" lines after
+        '#' comment lines, where the count is guaranteed, and the source is 'cobuild' for COBUILD patterns
+        and 'new' for the others.
+    """
+    with open(out_path, 'w') as out_file:
+        for comment in comments:
+            out_file.write('# {}\n'.format(comment))
+        out_file.write('# pattern\tcount\tsource\tmax_count\n')
+        for pat, count, max_count in ranked:
+            out_file.write('{}\t{}\t{}\t{}\n'.format(pat, count, 'cobuild' if pat in cobuild_pats else 'new', max_count))
@@ -0,0 +1,437 @@
+import os
+import dill
+import json
+import hashlib
+from functools import partial
+from collections import defaultdict
+from modules.input_reader import open_input
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Statistics of parallel grammar patterns
+    - `count_dict[src_pat][tgt_pat][head]`: count
+    - `ngram_dict[src_pat][tgt_pat][head][(src_ngram, tgt_ngram)]`: count
+    -------------------------------------------------------------------------------------------------
+"""
+
+# Nested defaultdicts are built with `partial` instead of lambdas, thus statistic files
+# can be unpickled without importing this module.
+def new_count_dict():
+    return defaultdict(partial(defaultdict, partial(defaultdict, int)))
+
+def new_ngram_dict():
+    return defaultdict(partial(defaultdict, partial(defaultdict, partial(defaultdict, int))))
+
+def add_ngram(ngrams, ngram, max_ngrams=0):
+    """ Count `ngram` in `ngrams` (counts of n-gram examples of a `ngram_dict` cell).
+        If `max_ngrams` > 0, at most `max_ngrams` heavy hitters are kept by Space-Saving:
+        a new n-gram replaces the one of the minimum count and takes over its count plus one,
+        thus counts are overestimated by at most the minimum count.
+    """
+    if not max_ngrams or ngram in ngrams or len(ngrams) < max_ngrams:
+        ngrams[ngram] += 1
+    else:
+        min_ngram = min(ngrams, key=ngrams.get)
+        ngrams[ngram] = ngrams.pop(min_ngram) + 1
+
+def add_parallel_pats(count_dict, ngram_dict, parallel_pats, max_ngrams=0):
+    """ Count aligned grammar patterns (`align_parallel_pats` results) of a parallel sentence.
+        `max_ngrams`: The maximum number of n-gram examples per (src_pat, tgt_pat, head) (0: unbounded).
+    """
+    for parallel_pat in parallel_pats:
+        head, src_pat, src_ngram, _ = parallel_pat[0]
+        head, tgt_pat, tgt_ngram, _ = parallel_pat[1]
+        count_dict[src_pat][tgt_pat][head] += 1
+        add_ngram(ngram_dict[src_pat][tgt_pat][head], (src_ngram, tgt_ngram), max_ngrams)
+
+def _keep_top(counts, max_items):
+    # Keep the `max_items` largest counts (earlier keys first on ties).
+    top_keys = set(sorted(counts, key=counts.get, reverse=True)[:max_items])
+    for key in [key for key in counts if key not in top_keys]:
+        del counts[key]
+
+def merge_counts(dst, src, max_items=0):
+    """ Add nested counts of `src` into `dst` (nested defaultdicts of the same depth).
+        If `max_items` > 0, innermost dicts keep at most `max_items` largest counts after merging,
+        e.g., to merge bounded `ngram_dict`s.
+    """
+    for key, value in src.items():
+        if isinstance(value, dict):
+            merge_counts(dst[key], value, max_items)
+        else:
+            dst[key] += value
+    if max_items and len(dst) > max_items and not isinstance(next(iter(dst.values())), dict):
+        _keep_top(dst, max_items)
+    return dst
+
+def subtract_counts(dst, src):
+    """ Subtract nested counts of `src` from `dst`, e.g., statistics of removed lines.
+        Keys whose counts drop to zero, and dicts left empty, are deleted.
+    """
+    for key, value in src.items():
+        if key not in dst:
+            raise ValueError('Cannot subtract counts of "{}", which were never counted.'.format(key))
+        if isinstance(value, dict):
+            subtract_counts(dst[key], value)
+            if not dst[key]: del dst[key]
+        else:
+            dst[key] -= value
+            if dst[key] <= 0: del dst[key]
+    return dst
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Compact statistics for aggregation
+    Patterns, headwords and n-gram examples are interned into tables of integer IDs, and counts are
+    kept in flat dicts keyed by tuples of IDs instead of nested dicts:
+    - `counts[(src_pat_id, tgt_pat_id, head_id)]`: count
+    - `ngram_counts[(src_pat_id, tgt_pat_id, head_id, ngram_id)]`: count, or
+      `ngram_counts[(src_pat_id, tgt_pat_id, head_id)][ngram_id]`: count if n-gram examples are bounded
+    Every distinct string is stored once. Nested dicts of strings are only built for output (`to_nested`),
+    in the key order of nested dicts counted line by line.
+    -------------------------------------------------------------------------------------------------
+"""
+
+class InternTable(object):
+    """ Values (strings or tuples of strings) and their integer IDs in order of first use.
+        IDs are assigned by `ids.setdefault(value, len(ids))`, which hot loops may call directly.
+    """
+    __slots__ = ('ids',)
+    
+    def __init__(self, values=()):
+        self.ids = {}
+        for value in values:
+            self.intern(value)
+    
+    def intern(self, value):
+        return self.ids.setdefault(value, len(self.ids))
+    
+    @property
+    def values(self):
+        """ List of values by ID. """
+        return list(self.ids)
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    # Only values are pickled (e.g., sent back from workers), IDs are rebuilt.
+    def __getstate__(self):
+        return list(self.ids)
+    
+    def __setstate__(self, values):
+        self.ids = {value: i for i, value in enumerate(values)}
+
+class FlatStats(object):
+    """ Statistics of parallel grammar patterns with interned keys.
+        `max_ngrams`: The maximum number of n-gram examples per (src_pat, tgt_pat, head) (0: unbounded).
+    """
+    __slots__ = ('pats', 'heads', 'ngrams', 'counts', 'ngram_counts', 'max_ngrams')
+    
+    def __init__(self, max_ngrams=0):
+        self.pats, self.heads, self.ngrams = InternTable(), InternTable(), InternTable()
+        self.counts = defaultdict(int)
+        self.ngram_counts = defaultdict(partial(defaultdict, int)) if max_ngrams else defaultdict(int)
+        self.max_ngrams = max_ngrams
+    
+    def __getstate__(self):
+        return (self.pats, self.heads, self.ngrams, dict(self.counts), dict(self.ngram_counts), self.max_ngrams)
+    
+    def __setstate__(self, state):
+        self.pats, self.heads, self.ngrams, counts, ngram_counts, self.max_ngrams = state
+        self.counts = defaultdict(int, counts)
+        self.ngram_counts = defaultdict(partial(defaultdict, int) if self.max_ngrams else int, ngram_counts)
+    
+    def add_parallel_pats(self, parallel_pats):
+        """ Count aligned grammar patterns (`align_parallel_pats` results) of a parallel sentence,
+            like `add_parallel_pats` of nested dicts.
+        """
+        pat_ids, head_ids, ngram_ids = self.pats.ids, self.heads.ids, self.ngrams.ids
+        for parallel_pat in parallel_pats:
+            head, src_pat, src_ngram, _ = parallel_pat[0]
+            head, tgt_pat, tgt_ngram, _ = parallel_pat[1]
+            key = (pat_ids.setdefault(src_pat, len(pat_ids)), pat_ids.setdefault(tgt_pat, len(pat_ids)),
+                   head_ids.setdefault(head, len(head_ids)))
+            ngram_id = ngram_ids.setdefault((src_ngram, tgt_ngram), len(ngram_ids))
+            self.counts[key] += 1
+            if self.max_ngrams:
+                add_ngram(self.ngram_counts[key], ngram_id, self.max_ngrams)
+            else:
+                self.ngram_counts[key + (ngram_id,)] += 1
+    
+    def merge(self, other):
+        """ Add statistics of `other` (e.g., of a worker chunk), mapping its IDs to the IDs of this one.
+            Like `merge_counts`, bounded n-gram examples keep the `max_ngrams` largest counts after merging.
+        """
+        pat_ids = [self.pats.intern(pat) for pat in other.pats.values]
+        head_ids = [self.heads.intern(head) for head in other.heads.values]
+        ngram_ids = [self.ngrams.intern(ngram) for ngram in other.ngrams.values]
+        for (src_pat_id, tgt_pat_id, head_id), count in other.counts.items():
+            self.counts[(pat_ids[src_pat_id], pat_ids[tgt_pat_id], head_ids[head_id])] += count
+        if self.max_ngrams:
+            for (src_pat_id, tgt_pat_id, head_id), ngrams in other.ngram_counts.items():
+                dst = self.ngram_counts[(pat_ids[src_pat_id], pat_ids[tgt_pat_id], head_ids[head_id])]
+                for ngram_id, count in ngrams.items():
+                    dst[ngram_ids[ngram_id]] += count
+                if len(dst) > self.max_ngrams:
+                    _keep_top(dst, self.max_ngrams)
+        else:
+            for (src_pat_id, tgt_pat_id, head_id, ngram_id), count in other.ngram_counts.items():
+                self.ngram_counts[(pat_ids[src_pat_id], pat_ids[tgt_pat_id], head_ids[head_id],
+                                   ngram_ids[ngram_id])] += count
+        return self
+    
+    def add_nested(self, count_dict, ngram_dict):
+        """ Add statistics of nested dicts (e.g., loaded from a `*.grampat.dill` file), like `merge_counts`. """
+        pats, heads, ngrams = self.pats, self.heads, self.ngrams
+        for src_pat, tgt_dict in count_dict.items():
+            for tgt_pat, head_dict in tgt_dict.items():
+                for head, count in head_dict.items():
+                    self.counts[(pats.intern(src_pat), pats.intern(tgt_pat), heads.intern(head))] += count
+        for src_pat, tgt_dict in ngram_dict.items():
+            for tgt_pat, head_dict in tgt_dict.items():
+                for head, ngram_counts in head_dict.items():
+                    key = (pats.intern(src_pat), pats.intern(tgt_pat), heads.intern(head))
+                    if self.max_ngrams:
+                        merge_counts(self.ngram_counts[key],
+                                     {ngrams.intern(ngram): count for ngram, count in ngram_counts.items()},
+                                     self.max_ngrams)
+                    else:
+                        for ngram, count in ngram_counts.items():
+                            self.ngram_counts[key + (ngrams.intern(ngram),)] += count
+        return self
+    
+    def to_nested(self):
+        """ Returns nested (`count_dict`, `ngram_dict`) of strings.
+            Keys of every level are in order of first use, like nested dicts counted line by line.
+        """
+        pats, heads, ngrams = self.pats.values, self.heads.values, self.ngrams.values
+        count_dict, ngram_dict = new_count_dict(), new_ngram_dict()
+        for (src_pat_id, tgt_pat_id, head_id), count in self.counts.items():
+            count_dict[pats[src_pat_id]][pats[tgt_pat_id]][heads[head_id]] = count
+        if self.max_ngrams:
+            for (src_pat_id, tgt_pat_id, head_id), ngram_counts in self.ngram_counts.items():
+                ngram_dict[pats[src_pat_id]][pats[tgt_pat_id]][heads[head_id]].update(
+                    (ngrams[i], count) for i, count in ngram_counts.items())
+        else:
+            for (src_pat_id, tgt_pat_id, head_id, ngram_id), count in self.ngram_counts.items():
+                ngram_dict[pats[src_pat_id]][pats[tgt_pat_id]][heads[head_id]][ngrams[ngram_id]] = count
+        return count_dict, ngram_dict
+
+def save_stats(out_path, count_dict, ngram_dict):
+    """ Save statistics to a `*.grampat.dill` file.
+        The file is replaced atomically, thus updated statistics are never left half written.
+    """
+    _write_atomic(out_path, lambda out_file: dill.dump({
+        'count_dict': count_dict,
+        'ngram_dict': ngram_dict
+    }, out_file))
+
+def iter_stat_files(paths):
+    """ Yields statistics of `*.grampat.dill` files one by one. """
+    for path in paths:
+        with open(path, 'rb') as f:
+            yield dill.load(f)
+
+def merge_stats(stats_iter, count_dict=None, ngram_dict=None, max_ngrams=0):
+    """ Sum statistics (dicts of `count_dict` and `ngram_dict`, or `FlatStats`) one by one into
+        `count_dict` and `ngram_dict` if they are given, thus only one of them is loaded besides the merged result.
+        Statistics of consecutive lines merged in order keep the key order of a single run,
+        thus the merged file is equal to the file of a single run (if `ngram_dict` is unbounded).
+        `max_ngrams`: The maximum number of n-gram examples per (src_pat, tgt_pat, head) (0: unbounded).
+    """
+    merged = FlatStats(max_ngrams)
+    if count_dict is not None:
+        merged.add_nested(count_dict, ngram_dict)
+    del count_dict, ngram_dict
+    for stats in stats_iter:
+        if isinstance(stats, FlatStats):
+            merged.merge(stats)
+        else:
+            merged.add_nested(stats['count_dict'], stats['ngram_dict'])
+    return merged.to_nested()
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Checkpoints of a streaming run
+    A checkpoint folder holds partial statistics `part-*.dill` of consecutive line ranges,
+    and `progress.json` of the last completed batch: line count and file offsets of the inputs.
+    -------------------------------------------------------------------------------------------------
+"""
+
+def _write_atomic(path, write):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def load_progress(checkpoint_path):
+    """ Returns progress of the last completed batch, or None if there is no checkpoint. """
+    progress_path = os.path.join(checkpoint_path, 'progress.json')
+    if not os.path.exists(progress_path):
+        return None
+    with open(progress_path) as f:
+        return json.load(f)
+
+def save_checkpoint(checkpoint_path, progress, count_dict, ngram_dict):
+    """ Save partial statistics since the last checkpoint, then the progress.
+        The progress is written last, thus a crash in between only loses the unfinished part.
+    """
+    if not os.path.exists(checkpoint_path):
+        os.makedirs(checkpoint_path)
+    part_path = os.path.join(checkpoint_path, 'part-{:06d}.dill'.format(progress['num_parts']))
+    _write_atomic(part_path, lambda f: dill.dump({'count_dict': count_dict, 'ngram_dict': ngram_dict}, f))
+    progress = dict(progress, num_parts=progress['num_parts'] + 1)
+    _write_atomic(os.path.join(checkpoint_path, 'progress.json'), lambda f: f.write(json.dumps(progress).encode()))
+    return progress
+
+def iter_checkpoint_parts(checkpoint_path, num_parts):
+    """ Yields partial statistics of the completed parts one by one. """
+    return iter_stat_files(os.path.join(checkpoint_path, 'part-{:06d}.dill'.format(i)) for i in range(num_parts))
+
+def remove_checkpoint(checkpoint_path):
+    for filename in os.listdir(checkpoint_path):
+        os.remove(os.path.join(checkpoint_path, filename))
+    os.rmdir(checkpoint_path)
+
+def parse_shard(shard):
+    """ Parse a shard "i/N" (the i-th of N shards, 0 <= i < N) into (i, N). """
+    try:
+        shard_id, num_shards = map(int, shard.split('/'))
+    except ValueError:
+        raise ValueError('Shard "{}" is not in the form of "i/N".'.format(shard))
+    if not 0 <= shard_id < num_shards:
+        raise ValueError('Shard "{}" is out of range, it should be 0 <= i < N.'.format(shard))
+    return shard_id, num_shards
+
+def shard_lines(num_lines, shard_id, num_shards):
+    """ Line range [start, end) of a shard: shards are consecutive lines of nearly equal size. """
+    return num_lines * shard_id // num_shards, num_lines * (shard_id + 1) // num_shards
+
+def count_lines(path, block_size=1 << 20):
+    """ Count lines without loading the whole file (decompressed if it is compressed, see `open_input`). """
+    num_lines, last_block = 0, b''
+    with open_input(path) as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            num_lines += block.count(b'\n')
+            last_block = block
+    # The last line without newline
+    if last_block and not last_block.endswith(b'\n'):
+        num_lines += 1
+    return num_lines
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Manifests of ingested inputs
+    A `*.grampat.manifest.json` file next to the statistics lists every ingested pair of input files
+    with its line ranges [start, end) and the digests of the lines of each range, thus updates only
+    count new lines and inputs counted before (or changed since) are detected.
+    It also holds the digest of the statistics file it belongs to (`stats_digest`).
+    -------------------------------------------------------------------------------------------------
+"""
+
+def digest_lines(path, start, end):
+    """ Hex digest of the bytes of lines [start, end) of a file (decompressed if it is compressed). """
+    digest = hashlib.blake2b(digest_size=16)
+    with open_input(path) as f:
+        for i, line in enumerate(f):
+            if i >= end: break
+            if i >= start: digest.update(line)
+    return digest.hexdigest()
+
+def digest_file(path, block_size=1 << 20):
+    """ Hex digest of a file, e.g., of the statistics a manifest belongs to. """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def new_manifest(max_ngrams=0):
+    return {'max_ngrams': max_ngrams, 'inputs': []}
+
+def load_manifest(path):
+    """ Returns the manifest of a `*.grampat.manifest.json` file, or None if there is none. """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(path, manifest):
+    _write_atomic(path, lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+
+def find_input(manifest, src_path, tgt_path):
+    """ Returns the manifest entry of a pair of input files, or None if it was never ingested. """
+    src_path, tgt_path = os.path.abspath(src_path), os.path.abspath(tgt_path)
+    for entry in manifest['inputs']:
+        if entry['src_path'] == src_path and entry['tgt_path'] == tgt_path:
+            return entry
+    return None
+
+def _range_digests(src_path, tgt_path, start, end):
+    return {'start': start, 'end': end,
+            'src_digest': digest_lines(src_path, start, end), 'tgt_digest': digest_lines(tgt_path, start, end)}
+
+def check_input(entry):
+    """ Raise ValueError if lines of the ingested ranges of a manifest entry changed since. """
+    for line_range in entry['ranges']:
+        if _range_digests(entry['src_path'], entry['tgt_path'], line_range['start'], line_range['end']) != line_range:
+            raise ValueError('Lines [{}, {}) of "{}" and "{}" changed since they were ingested.'.format(
+                line_range['start'], line_range['end'], entry['src_path'], entry['tgt_path']))
+
+def find_same_content(manifest, src_path, tgt_path, num_lines):
+    """ Returns the manifest entry of other input files with the same lines (e.g., copies), or None. """
+    digests = None
+    for entry in manifest['inputs']:
+        for line_range in entry['ranges']:
+            if line_range['start'] != 0 or line_range['end'] != num_lines:
+                continue
+            if digests is None:
+                digests = _range_digests(src_path, tgt_path, 0, num_lines)
+            if digests == line_range:
+                return entry
+    return None
+
+def add_input(manifest, src_path, tgt_path, start, end):
+    """ Record lines [start, end) of a pair of input files as ingested.
+        Consecutive ranges are coalesced.
+    """
+    src_path, tgt_path = os.path.abspath(src_path), os.path.abspath(tgt_path)
+    entry = find_input(manifest, src_path, tgt_path)
+    if entry is None:
+        entry = {'src_path': src_path, 'tgt_path': tgt_path, 'ranges': []}
+        manifest['inputs'].append(entry)
+    ranges = sorted([(r['start'], r['end']) for r in entry['ranges']] + [(start, end)])
+    coalesced = [list(ranges[0])]
+    for range_start, range_end in ranges[1:]:
+        if range_start <= coalesced[-1][1]:
+            coalesced[-1][1] = max(coalesced[-1][1], range_end)
+        else:
+            coalesced.append([range_start, range_end])
+    entry['ranges'] = [_range_digests(src_path, tgt_path, range_start, range_end)
+                       for range_start, range_end in coalesced]
+    return manifest
+
+def remove_input(manifest, src_path, tgt_path):
+    entry = find_input(manifest, src_path, tgt_path)
+    manifest['inputs'].remove(entry)
+    return manifest
+
+def merge_manifests(manifests, max_ngrams=0):
+    """ Merge manifests of statistics merged in order, e.g., of shards.
+        Every statistics must be counted with the same -max_ngrams and pattern inventory.
+    `max_ngrams`: The bound of n-gram examples of the merge (0: all), the stricter one is recorded
+    """
+    for manifest in manifests[1:]:
+        assert manifest['max_ngrams'] == manifests[0]['max_ngrams'],\
+            'Statistics were counted with -max_ngrams {} and {}.'.format(manifests[0]['max_ngrams'], manifest['max_ngrams'])
+        assert manifest.get('inventory') == manifests[0].get('inventory'),\
+            'Statistics were counted with different pattern inventories.'
+    bounds = [bound for bound in [manifests[0]['max_ngrams'], max_ngrams] if bound]
+    merged = new_manifest(min(bounds) if bounds else 0)
+    if manifests[0].get('inventory'):
+        merged['inventory'] = manifests[0]['inventory']
+    for manifest in manifests:
+        for entry in manifest['inputs']:
+            for line_range in entry['ranges']:
+                add_input(merged, entry['src_path'], entry['tgt_path'], line_range['start'], line_range['end'])
+    return merged
@@ -0,0 +1,366 @@
+import json
+import mmap
+import numpy as np
+from operator import itemgetter
+from collections import defaultdict
+from collections.abc import Mapping
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Compact statistics file `*.grampat.bin`, opened by memory mapping
+    A file holds:
+    - String tables of grammar patterns, headwords and n-grams in sorted (UTF-8 byte) order,
+      thus the ID of a string is found by binary search without building a dict.
+      Every table is an offset array and a UTF-8 blob.
+    - Columnar rows of `count_dict` (src, tgt, head, count) and
+      `ngram_dict` (src, tgt, head, src_ngram, tgt_ngram, count) sorted by their keys,
+      thus nested keys are looked up by binary search in the row ranges of outer keys.
+    - Query indexes:
+      - Rows of `head_stpat_dict` (head, src, tgt, count) with the '*' marginals,
+        i.e., `query_grampat.get_head_stpat_dict` computed once.
+      - `order` of every rows: row IDs sorted by descending count within their last level,
+        thus top-k lists are read without sorting.
+    Layout: magic, header length (uint64), JSON header of section offsets, then 8-byte aligned sections.
+    -------------------------------------------------------------------------------------------------
+"""
+
+MAGIC = b'GRAMPAT1'
+
+id_dtype = np.dtype('<i4')
+count_dtype = np.dtype('<i8')
+offset_dtype = np.dtype('<u8')
+
+# Row columns and their string tables.
+count_columns = [('src', 'pat'), ('tgt', 'pat'), ('head', 'head')]
+ngram_columns = [('src', 'pat'), ('tgt', 'pat'), ('head', 'head'), ('src_ngram', 'ngram'), ('tgt_ngram', 'ngram')]
+head_stpat_columns = [('head', 'head'), ('src', 'pat'), ('tgt', 'pat')]
+
+# Nested dict levels of rows: every level is keyed by one column, or a tuple of columns.
+count_levels = [('src',), ('tgt',), ('head',)]
+ngram_levels = [('src',), ('tgt',), ('head',), ('src_ngram', 'tgt_ngram')]
+head_stpat_levels = [('head',), ('src',), ('tgt',)]
+
+row_sets = {
+    'count': (count_columns, count_levels),
+    'ngram': (ngram_columns, ngram_levels),
+    'head_stpat': (head_stpat_columns, head_stpat_levels)
+}
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Writer
+    -------------------------------------------------------------------------------------------------
+"""
+
+def _iter_rows(nested_dict, depth, prefix=()):
+    # Yields (key1, ..., key_depth, count) of nested dicts.
+    for key, value in nested_dict.items():
+        if depth == 1:
+            if value: yield prefix + (key, value)
+        else:
+            yield from _iter_rows(value, depth - 1, prefix + (key,))
+
+def _string_table(strings):
+    strings = sorted(set(strings), key=lambda s: s.encode('utf-8'))
+    return strings, {s: i for i, s in enumerate(strings)}
+
+def _encode_table(strings):
+    blobs = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(blobs) + 1, dtype=offset_dtype)
+    np.cumsum([len(blob) for blob in blobs], out=offsets[1:])
+    return offsets, b''.join(blobs)
+
+def _rows_to_columns(rows, columns, levels, ids):
+    arrays = {name: np.fromiter((ids[table][row[i]] for row in rows), dtype=id_dtype, count=len(rows))
+              for i, (name, table) in enumerate(columns)}
+    arrays['count'] = np.fromiter((row[-1] for row in rows), dtype=count_dtype, count=len(rows))
+    # Sort rows by columns (the first column is the primary key).
+    sort_ids = np.lexsort([arrays[name] for name, _ in reversed(columns)])
+    arrays = {name: array[sort_ids] for name, array in arrays.items()}
+    # Row IDs sorted by outer keys, then descending count, thus every key range of the last level
+    # is the same in `order`.
+    outer_names = [name for level in levels[:-1] for name in level]
+    arrays['order'] = np.lexsort([arrays[name] for name in reversed(levels[-1])] + [-arrays['count']] +
+                                 [arrays[name] for name in reversed(outer_names)])
+    arrays['order'] = arrays['order'].astype(id_dtype if len(rows) < 2**31 else count_dtype)
+    return arrays
+
+def _head_stpat_rows(count_rows):
+    # Rows of `query_grampat.get_head_stpat_dict`: inverted counts and the '*' marginals.
+    counts = defaultdict(int)
+    for src_pat, tgt_pat, head, count in count_rows:
+        counts[(head, src_pat, tgt_pat)] = count
+        counts[('*', src_pat, tgt_pat)] += count
+        counts[(head, '*', tgt_pat)] += count
+        counts[(head, src_pat, '*')] += count
+    return [key + (count,) for key, count in counts.items()]
+
+def save_store(path, count_dict, ngram_dict):
+    """ Save `count_dict` and `ngram_dict` (nested dicts of `compute_grampat.py`) into a compact file. """
+    count_rows = list(_iter_rows(count_dict, 3))
+    ngram_rows = [row[:3] + row[3] + row[4:] for row in _iter_rows(ngram_dict, 4)]
+    rows = {'count': count_rows, 'ngram': ngram_rows, 'head_stpat': _head_stpat_rows(count_rows)}
+
+    strings = {
+        'pat': [s for row in count_rows for s in row[:2]] + [s for row in ngram_rows for s in row[:2]] + ['*'],
+        'head': [row[2] for row in count_rows] + [row[2] for row in ngram_rows] + ['*'],
+        'ngram': [s for row in ngram_rows for s in row[3:5]]
+    }
+    ids = {}
+    sections = []
+    for table, table_strings in strings.items():
+        table_strings, ids[table] = _string_table(table_strings)
+        offsets, blob = _encode_table(table_strings)
+        sections += [('{}.offsets'.format(table), offsets), ('{}.blob'.format(table), blob)]
+    for rows_name, (columns, levels) in row_sets.items():
+        arrays = _rows_to_columns(rows[rows_name], columns, levels, ids)
+        sections += [('{}.{}'.format(rows_name, name), array) for name, array in arrays.items()]
+
+    # Section offsets are relative to the end of the header.
+    header, offset = {}, 0
+    for name, data in sections:
+        nbytes = data.nbytes if isinstance(data, np.ndarray) else len(data)
+        header[name] = {'offset': offset, 'nbytes': nbytes}
+        if isinstance(data, np.ndarray):
+            header[name]['dtype'] = data.dtype.str
+        offset += -(-nbytes // 8) * 8
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (-(len(MAGIC) + 8 + len(header_bytes)) % 8)
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.array([len(header_bytes)], dtype=offset_dtype).tobytes())
+        f.write(header_bytes)
+        for name, data in sections:
+            data = data.tobytes() if isinstance(data, np.ndarray) else data
+            f.write(data)
+            f.write(b'\0' * (-len(data) % 8))
+
+def convert_dill(dill_path, out_path):
+    """ Convert a `*.grampat.dill` file into a `*.grampat.bin` file. """
+    import dill
+    with open(dill_path, 'rb') as f:
+        stats = dill.load(f)
+    save_store(out_path, stats['count_dict'], stats['ngram_dict'])
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Reader
+    -------------------------------------------------------------------------------------------------
+"""
+
+class StringTable(object):
+    """ Sorted string table in a memory map: `table[i]` is the i-th string, `table.find(s)` its ID or -1.
+        IDs of queried strings and strings of queried IDs are memoized.
+    """
+    def __init__(self, buffer, offsets, blob_offset):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.blob_offset = blob_offset
+        self._ids = {}
+        self._strings = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _bytes(self, i):
+        return self.buffer[self.blob_offset + int(self.offsets[i]):self.blob_offset + int(self.offsets[i + 1])]
+
+    def __getitem__(self, i):
+        s = self._strings.get(i)
+        if s is None:
+            s = self._strings[i] = self._bytes(i).decode('utf-8')
+        return s
+
+    def find(self, s):
+        i = self._ids.get(s)
+        if i is None:
+            i = self._ids[s] = self._find(s)
+        return i
+
+    def _find(self, s):
+        key = s.encode('utf-8')
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(mid) < key: lo = mid + 1
+            else: hi = mid
+        return lo if lo < len(self) and self._bytes(lo) == key else -1
+
+class RowsView(Mapping):
+    """ Read-only nested dict view over sorted rows [lo, hi).
+        Like `defaultdict`, missing keys give an empty view (or 0 at the last level) without insertion,
+        and `get` gives the default. Empty views of a level are shared.
+    """
+    # Ranges of at most `scan_rows` rows are scanned at once to split keys.
+    scan_rows = 1 << 16
+    
+    def __init__(self, store, rows_name, levels, lo, hi):
+        self.store = store
+        self.rows_name = rows_name
+        self.levels = levels
+        self.lo, self.hi = lo, hi
+
+    def _column(self, name):
+        return self.store.columns[self.rows_name][name]
+
+    def _narrow(self, key):
+        # Row range of `key` at the current level, or None if it is missing.
+        names = self.levels[0]
+        keys = key if len(names) > 1 else (key,)
+        if not isinstance(keys, tuple) or len(keys) != len(names):
+            return None
+        lo, hi = self.lo, self.hi
+        for name, s in zip(names, keys):
+            i = self.store.find(self.rows_name, name, s) if isinstance(s, str) else -1
+            if i < 0: return None
+            # Keys have the dtype of the column, otherwise numpy casts (copies) the whole column.
+            start, end = self._column(name)[lo:hi].searchsorted(np.array([i, i + 1], dtype=id_dtype)).tolist()
+            lo, hi = lo + start, lo + end
+            if lo == hi: return None
+        return lo, hi
+
+    def _value(self, lo, hi):
+        if len(self.levels) == 1:
+            return int(self.store.columns[self.rows_name]['count'][lo])
+        return RowsView(self.store, self.rows_name, self.levels[1:], lo, hi)
+
+    def _empty(self):
+        # Shared empty view of the next level.
+        key = (self.rows_name, len(self.levels) - 1)
+        if key not in self.store.empty_views:
+            self.store.empty_views[key] = RowsView(self.store, self.rows_name, self.levels[1:], 0, 0)
+        return self.store.empty_views[key]
+
+    def __getitem__(self, key):
+        span = self._narrow(key)
+        if span is None:
+            return 0 if len(self.levels) == 1 else self._empty()
+        return self._value(*span)
+
+    def get(self, key, default=None):
+        span = self._narrow(key)
+        return default if span is None else self._value(*span)
+
+    def __contains__(self, key):
+        return self._narrow(key) is not None
+
+    def __bool__(self):
+        # Every row range of a view has at least one key.
+        return self.hi > self.lo
+
+    def _spans(self):
+        # Row ranges of keys at the current level.
+        if len(self.levels) == 1:
+            # Rows are unique, thus every row of the last level is a key.
+            return zip(range(self.lo, self.hi), range(self.lo + 1, self.hi + 1))
+        return self._scan_spans()
+
+    def _scan_spans(self):
+        # Large ranges jump from run to run by binary search, thus only touched pages are read.
+        if self.hi - self.lo > self.scan_rows:
+            lo = self.lo
+            while lo < self.hi:
+                hi = self.hi
+                for name in self.levels[0]:
+                    column = self._column(name)
+                    hi = lo + int(np.searchsorted(column[lo:hi], column[lo], 'right'))
+                yield lo, hi
+                lo = hi
+            return
+        if self.lo == self.hi: return
+        changed = np.zeros(self.hi - self.lo - 1, dtype=bool)
+        for name in self.levels[0]:
+            changed |= np.diff(self._column(name)[self.lo:self.hi]) != 0
+        starts = np.concatenate([[0], np.flatnonzero(changed) + 1]) + self.lo
+        ends = np.append(starts[1:], self.hi)
+        yield from zip(starts.tolist(), ends.tolist())
+
+    def _key(self, i):
+        keys = tuple(self.store.string(self.rows_name, name, int(self._column(name)[i])) for name in self.levels[0])
+        return keys if len(keys) > 1 else keys[0]
+
+    def __iter__(self):
+        for lo, _ in self._spans():
+            yield self._key(lo)
+
+    def __len__(self):
+        if len(self.levels) == 1:
+            return self.hi - self.lo
+        return sum(1 for _ in self._spans())
+
+    def items(self):
+        for lo, hi in self._spans():
+            yield self._key(lo), self._value(lo, hi)
+
+    def most_common(self, k=None):
+        """ Returns the top `k` (key, count) pairs of the last level, like `Counter.most_common`. """
+        if len(self.levels) != 1:
+            raise TypeError('most_common() is only for the last level of counts.')
+        order = self.store.columns[self.rows_name].get('order')
+        if order is None:
+            return sorted(self.items(), key=itemgetter(1), reverse=True)[:k]
+        counts = self.store.columns[self.rows_name]['count']
+        hi = self.hi if k is None else min(self.hi, self.lo + k)
+        return [(self._key(i), int(counts[i])) for i in order[self.lo:hi].tolist()]
+
+class GrampatStore(object):
+    """ Memory-mapped `*.grampat.bin` file. Nothing is loaded until it is queried. """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError('"{}" is not a grammar pattern statistics file.'.format(path))
+        header_len = int(np.frombuffer(self.buffer, dtype=offset_dtype, count=1, offset=len(MAGIC))[0])
+        data_offset = len(MAGIC) + 8 + header_len
+        self.header = json.loads(self.buffer[len(MAGIC) + 8:data_offset].decode('utf-8'))
+
+        def _array(name):
+            section = self.header[name]
+            dtype = np.dtype(section['dtype'])
+            count = section['nbytes'] // dtype.itemsize
+            if not count: return np.zeros(0, dtype=dtype)
+            return np.frombuffer(self.buffer, dtype=dtype, count=count, offset=data_offset + section['offset'])
+
+        self.tables = {table: StringTable(self.buffer, _array('{}.offsets'.format(table)),
+                                          data_offset + self.header['{}.blob'.format(table)]['offset'])
+                       for table in ['pat', 'head', 'ngram']}
+        # Query indexes (`head_stpat` rows and `order`) are optional.
+        self.columns = {rows_name: {name: _array('{}.{}'.format(rows_name, name))
+                                    for name in [name for name, _ in columns] + ['count', 'order']
+                                    if '{}.{}'.format(rows_name, name) in self.header}
+                        for rows_name, (columns, _) in row_sets.items()
+                        if '{}.count'.format(rows_name) in self.header}
+        self.column_tables = {rows_name: dict(columns) for rows_name, (columns, _) in row_sets.items()}
+        # Empty views of missing keys by (rows_name, levels left), see `RowsView._empty`.
+        self.empty_views = {}
+
+    def find(self, rows_name, column, s):
+        return self.tables[self.column_tables[rows_name][column]].find(s)
+
+    def string(self, rows_name, column, i):
+        return self.tables[self.column_tables[rows_name][column]][i]
+
+    @property
+    def count_dict(self):
+        return RowsView(self, 'count', count_levels, 0, len(self.columns['count']['count']))
+
+    @property
+    def ngram_dict(self):
+        return RowsView(self, 'ngram', ngram_levels, 0, len(self.columns['ngram']['count']))
+
+    @property
+    def has_index(self):
+        return 'head_stpat' in self.columns
+
+    @property
+    def head_stpat_dict(self):
+        """ `head_stpat_dict[head][src_pat][tgt_pat]` with the '*' marginals (see `query_grampat.get_head_stpat_dict`). """
+        if not self.has_index:
+            raise KeyError('The statistics file has no query index.')
+        return RowsView(self, 'head_stpat', head_stpat_levels, 0, len(self.columns['head_stpat']['count']))
+
+def load_store(path):
+    """ Open a `*.grampat.bin` file as a dict of read-only nested views, like a loaded `*.grampat.dill`. """
+    store = GrampatStore(path)
+    return {'count_dict': store.count_dict, 'ngram_dict': store.ngram_dict}
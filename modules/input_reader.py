@@ -0,0 +1,146 @@
+import os
+import bz2
+import gzip
+import lzma
+import queue
+import threading
+from itertools import islice
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Pipelined reader of parallel input files
+    - Input files may be compressed (by extension: .gz, .xz, .lzma, .bz2). Lines are read as bytes
+      and decoded as UTF-8, thus files are split on "\n" only, like `count_lines`.
+    - `ParallelReader` reads, decompresses and decodes blocks of parallel lines in a background thread,
+      and keeps at most `prefetch` blocks in a bounded queue, thus reading overlaps the workers.
+    - Every block keeps its line numbers and the offsets of both files after it (for checkpoints).
+      Lines with an empty side are not counted but reported by line number, and inputs of different
+      lengths stop with an error at the first line of only one side.
+    -------------------------------------------------------------------------------------------------
+"""
+
+openers = {'.gz': gzip.open, '.xz': lzma.open, '.lzma': lzma.open, '.bz2': bz2.open}
+
+def open_input(path):
+    """ Open an input file to read bytes, decompressed by its extension. """
+    return openers.get(os.path.splitext(path)[1], open)(path, 'rb')
+
+def skip_lines(in_file, num_lines):
+    """ Skip `num_lines` lines and returns the file offset. """
+    for _ in islice(in_file, num_lines):
+        pass
+    return in_file.tell()
+
+class ParallelBlock(object):
+    """ Parallel lines [start, end) of input files (0-based line numbers).
+        - `parallel_lines`: (src_line, tgt_line) of lines with both sides, in order.
+        - `empty_lines`: Line numbers (1-based, as in editors) of lines with an empty side.
+        - `src_offset`, `tgt_offset`: File offsets after the block.
+    """
+    __slots__ = ('start', 'end', 'parallel_lines', 'empty_lines', 'src_offset', 'tgt_offset')
+
+    def __init__(self, start, end, parallel_lines, empty_lines, src_offset, tgt_offset):
+        self.start, self.end = start, end
+        self.parallel_lines, self.empty_lines = parallel_lines, empty_lines
+        self.src_offset, self.tgt_offset = src_offset, tgt_offset
+
+def read_blocks(src_file, tgt_file, block_size=1024, start=0, max_lines=None, src_path='source', tgt_path='target'):
+    """ Yields `ParallelBlock`s of `block_size` lines (less at the end of files) until the end of files,
+        or until `max_lines` lines are read if it is given. `start` is the line number of the first line.
+        Raise ValueError if one file ends before the other.
+    """
+    line_id, num_read = start, 0
+    while max_lines is None or num_read < max_lines:
+        num_lines = block_size if max_lines is None else min(block_size, max_lines - num_read)
+        src_lines, tgt_lines = list(islice(src_file, num_lines)), list(islice(tgt_file, num_lines))
+        if len(src_lines) != len(tgt_lines):
+            short_path, long_path = (src_path, tgt_path) if len(src_lines) < len(tgt_lines) else (tgt_path, src_path)
+            raise ValueError('Misaligned inputs: "{}" ends at line {}, but "{}" has more lines.'.format(
+                short_path, line_id + min(len(src_lines), len(tgt_lines)), long_path))
+        if not src_lines:
+            return
+        parallel_lines, empty_lines = [], []
+        for i, (src_line, tgt_line) in enumerate(zip(src_lines, tgt_lines), start=line_id + 1):
+            src_line, tgt_line = src_line.decode('utf-8').strip(), tgt_line.decode('utf-8').strip()
+            if src_line and tgt_line:
+                parallel_lines.append((src_line, tgt_line))
+            else:
+                empty_lines.append(i)
+        yield ParallelBlock(line_id, line_id + len(src_lines), parallel_lines, empty_lines,
+                            src_file.tell(), tgt_file.tell())
+        line_id += len(src_lines)
+        num_read += len(src_lines)
+        if len(src_lines) < num_lines:
+            return
+
+class ParallelReader(object):
+    """ Reads `ParallelBlock`s of two input files in a background thread, at most `prefetch` blocks ahead.
+        Errors of the thread are raised by the iterator. Use it as a context manager to stop the thread
+        and close the files.
+        `start`: Skip lines before this line number, or seek to `offsets` (src_offset, tgt_offset) of it if given.
+        `prefetch`: The maximum number of blocks read ahead (0: read blocks in the calling thread).
+    """
+    _end = object()
+
+    def __init__(self, src_path, tgt_path, block_size=1024, start=0, max_lines=None, offsets=None, prefetch=2):
+        self.src_path, self.tgt_path = src_path, tgt_path
+        self.block_size, self.start, self.max_lines = block_size, start, max_lines
+        self.offsets = offsets
+        self.prefetch = prefetch
+        self.src_file, self.tgt_file = open_input(src_path), open_input(tgt_path)
+        self.blocks = queue.Queue(max(1, prefetch))
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _blocks(self):
+        if self.offsets:
+            self.src_file.seek(self.offsets[0]), self.tgt_file.seek(self.offsets[1])
+        else:
+            skip_lines(self.src_file, self.start), skip_lines(self.tgt_file, self.start)
+        return read_blocks(self.src_file, self.tgt_file, self.block_size, self.start, self.max_lines,
+                           self.src_path, self.tgt_path)
+
+    def _put(self, item):
+        # Returns False if the reader was stopped before the queue had room.
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self):
+        try:
+            for block in self._blocks():
+                if not self._put((block, None)):
+                    return
+            self._put((self._end, None))
+        except Exception as e:
+            self._put((self._end, e))
+
+    def __iter__(self):
+        if not self.prefetch:
+            yield from self._blocks()
+            return
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+        while True:
+            block, error = self.blocks.get()
+            if block is self._end:
+                if error is not None:
+                    raise error
+                return
+            yield block
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.src_file.close(), self.tgt_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,95 @@
+import pickle
+import sqlite3
+import hashlib
+from collections import OrderedDict, Counter
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Cache of grammar patterns keyed by the content hash of tree strings
+    - In-process LRU of at most `max_size` entries.
+    - Optional persistent store (SQLite), shared across runs and worker processes.
+    Keys hash a namespace (the config that changes results, e.g., the lemmatizer) with the tree string.
+    Values are `sent_to_pats` results, or None for tree strings that cannot be parsed.
+    -------------------------------------------------------------------------------------------------
+"""
+
+class PatternCache(object):
+    def __init__(self, max_size=100000, disk_path=None, namespace=''):
+        self.max_size = max_size
+        self.disk_path = disk_path
+        self.namespace = namespace.encode('utf-8')
+        self.lru = OrderedDict()
+        self.counters = Counter()
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None and self.disk_path:
+            # Workers share the store: wait for locks of other writers.
+            self._db = sqlite3.connect(self.disk_path, timeout=600)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS pats (key BLOB PRIMARY KEY, value BLOB)')
+            self._db.commit()
+        return self._db
+
+    def key(self, tree_str):
+        return hashlib.blake2b(self.namespace + b'\n' + tree_str.encode('utf-8'), digest_size=16).digest()
+
+    def _put_lru(self, key, value):
+        self.lru[key] = value
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.max_size:
+            self.lru.popitem(last=False)
+
+    def get_many(self, tree_strs):
+        """ Returns a dict of cached grammar patterns of the distinct `tree_strs`. """
+        found, missing = {}, {}
+        for tree_str in set(tree_strs):
+            key = self.key(tree_str)
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                found[tree_str] = self.lru[key]
+            else:
+                missing[key] = tree_str
+        self.counters['cache_hits'] += len(found)
+        if missing and self.db is not None:
+            keys = list(missing)
+            for i in range(0, len(keys), 500):
+                batch_keys = keys[i:i+500]
+                query = 'SELECT key, value FROM pats WHERE key IN ({})'.format(','.join('?' * len(batch_keys)))
+                for key, value in self.db.execute(query, batch_keys):
+                    value = pickle.loads(value)
+                    found[missing.pop(key)] = value
+                    self._put_lru(key, value)
+                    self.counters['disk_hits'] += 1
+        self.counters['cache_misses'] += len(missing)
+        return found
+
+    def put_many(self, items):
+        """ Cache (tree string, grammar patterns) pairs. """
+        rows = []
+        for tree_str, pats in items:
+            key = self.key(tree_str)
+            self._put_lru(key, pats)
+            rows.append((key, pickle.dumps(pats, protocol=pickle.HIGHEST_PROTOCOL)))
+        if rows and self.db is not None:
+            with self.db:
+                self.db.executemany('INSERT OR IGNORE INTO pats VALUES (?, ?)', rows)
+
+# Cache config and the lazily created cache of this process.
+_cache_config = None
+_cache = None
+
+def set_cache(max_size=0, disk_path=None, namespace=''):
+    """ Configure the cache of this process (0 `max_size` and no `disk_path`: no cache).
+        Setting the same config again keeps the current cache.
+    """
+    global _cache_config, _cache
+    config = (max_size, disk_path, namespace)
+    if config != _cache_config:
+        _cache_config = config
+        _cache = PatternCache(max_size, disk_path, namespace) if max_size or disk_path else None
+
+def get_cache():
+    """ Returns the cache of this process, or None if there is no cache. """
+    return _cache
@@ -1,8 +1,7 @@
-import re
-import spacy
-from spacy.tokens import Doc
-from nltk.tree import ParentedTree
-from collections import defaultdict
+from collections import deque
+from collections import defaultdict, Counter
+from modules.tree_reader import parse_tree_str, is_pos
+from modules.stage_timer import timings, perf_counter
 
 """ 
     -------------------------------------------------------------------------------------------------
@@ -12,17 +11,147 @@ from collections import defaultdict
 
 class WhitespaceTokenizer(object):
     def __init__(self, vocab):
+        from spacy.tokens import Doc
         self.vocab = vocab
+        self.Doc = Doc
 
     def __call__(self, text):
         words = text.split()
         # All tokens 'own' a subsequent space character in this tokenizer
         spaces = [True] * len(words)
-        return Doc(self.vocab, words=words, spaces=spaces)
+        return self.Doc(self.vocab, words=words, spaces=spaces)
+
+""" 
+    -------------------------------------------------------------------------------------------------
+    Pluggable lemmatizer backends
+    Every backend lemmatizes batches of (words, PTB POS tags) through `pipe()`.
+    The backend is loaded lazily on first use, thus importing this module is cheap.
+    Call `load()` to load it eagerly, e.g., in a worker initializer.
+    -------------------------------------------------------------------------------------------------
+"""
+
+class SpacyLemmatizer(object):
+    """ Lemmatize with a spaCy model.
+        We only use `lemma_`, which spaCy looks up from the vocab without a tagger,
+        thus every pipeline component (tagger, parser, ner, textcat) is disabled.
+        Use a small model (e.g. 'en_core_web_sm') to avoid loading word vectors.
+    """
+    disable = ['tagger', 'parser', 'ner', 'textcat']
+    
+    def __init__(self, model='en_core_web_lg'):
+        self.model = model
+        self._nlp = None
+    
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            import spacy
+            print('Loading SpaCy "{}" with custom whitespace tokenizer...'.format(self.model))
+            self._nlp = spacy.load(self.model, disable=self.disable)
+            self._nlp.tokenizer = WhitespaceTokenizer(self._nlp.vocab)
+        return self._nlp
+    
+    def load(self):
+        self.nlp
+        return self
     
-print('Loading SpaCy with custom whitespace tokenizer...')
-nlp = spacy.load('en_core_web_lg', disable=['tagger', 'parser', 'textcat'])
-nlp.tokenizer = WhitespaceTokenizer(nlp.vocab)
+    def pipe(self, sents, batch_size=1000):
+        """ `sents`: Iterable of (words, tags). Yields a list of lemmas for every sentence. """
+        texts = (' '.join(words) for words, _ in sents)
+        for doc in self.nlp.pipe(texts, batch_size=batch_size):
+            yield [tok.lemma_.lower() if tok.lemma_ != '-PRON-' else tok.text.lower() for tok in doc]
+
+class LookupLemmatizer(object):
+    """ Lemmatize with a lookup table keyed on (word, PTB POS tag).
+        The table is a tab-separated file of `word<TAB>tag<TAB>lemma` lines (see `build_lemma_table`).
+        Unknown (word, tag) falls back to the most frequent lemma of the word, then the lowercased word.
+    """
+    def __init__(self, table_path):
+        self.table_path = table_path
+        self._table = None
+        self._word_table = None
+    
+    def _load(self):
+        print('Loading lemma lookup table "{}"...'.format(self.table_path))
+        self._table = {}
+        word_lemma_counts = defaultdict(Counter)
+        with open(self.table_path) as table_file:
+            for line in table_file:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != 3: continue
+                word, tag, lemma = fields
+                self._table[(word, tag)] = lemma
+                word_lemma_counts[word][lemma] += 1
+        self._word_table = {word: counts.most_common(1)[0][0] for word, counts in word_lemma_counts.items()}
+    
+    def load(self):
+        if self._table is None: self._load()
+        return self
+    
+    def lemmatize(self, words, tags):
+        if self._table is None: self._load()
+        lemmas = []
+        for word, tag in zip(words, tags):
+            word = word.lower()
+            lemma = self._table.get((word, tag))
+            if lemma is None: lemma = self._word_table.get(word, word)
+            lemmas.append(lemma)
+        return lemmas
+    
+    def pipe(self, sents, batch_size=1000):
+        """ `sents`: Iterable of (words, tags). Yields a list of lemmas for every sentence. """
+        for words, tags in sents:
+            yield self.lemmatize(words, tags)
+
+lemmatizer_backends = {
+    'spacy': SpacyLemmatizer,
+    'lookup': LookupLemmatizer
+}
+
+# Lemmatizer config and the lazily created lemmatizer.
+_lemmatizer_config = {'backend': 'spacy', 'model': 'en_core_web_lg'}
+_lemmatizer = None
+
+def set_lemmatizer(backend='spacy', **kwargs):
+    """ Configure the lemmatizer used by the shallow parser.
+        The lemmatizer is (re)loaded on first use. Setting the same config again keeps the loaded one.
+    `backend`: 'spacy' (kwargs: `model`) or 'lookup' (kwargs: `table_path`).
+    """
+    global _lemmatizer_config, _lemmatizer
+    config = dict(kwargs, backend=backend)
+    if backend not in lemmatizer_backends:
+        raise ValueError('Unknown lemmatizer backend "{}"'.format(backend))
+    if config != _lemmatizer_config:
+        _lemmatizer_config = config
+        _lemmatizer = None
+
+def get_lemmatizer():
+    """ Returns the configured lemmatizer, loading it on first use. """
+    global _lemmatizer
+    if _lemmatizer is None:
+        config = dict(_lemmatizer_config)
+        _lemmatizer = lemmatizer_backends[config.pop('backend')](**config)
+    return _lemmatizer
+
+def build_lemma_table(tree_strs, out_path, lemmatizer=None, batch_size=1000):
+    """ Build a lookup table for `LookupLemmatizer` from tree strings.
+        The most frequent lemma of every (word, tag) given by `lemmatizer` (default: spaCy) is kept.
+    """
+    lemmatizer = lemmatizer or SpacyLemmatizer()
+    lemma_counts = defaultdict(Counter)
+    sents = []
+    for tree_str in tree_strs:
+        try:
+            words, tags = _chunk_tree(tree_str)[:2]
+        except Exception:
+            continue
+        sents.append((words, tags))
+    for (words, tags), lemmas in zip(sents, lemmatizer.pipe(sents, batch_size=batch_size)):
+        for word, tag, lemma in zip(words, tags, lemmas):
+            lemma_counts[(word.lower(), tag)][lemma] += 1
+    with open(out_path, 'w') as out_file:
+        for (word, tag), counts in sorted(lemma_counts.items()):
+            out_file.write('{}\t{}\t{}\n'.format(word, tag, counts.most_common(1)[0][0]))
 
 """ 
     -------------------------------------------------------------------------------------------------
@@ -31,7 +160,16 @@ nlp.tokenizer = WhitespaceTokenizer(nlp.vocab)
     -------------------------------------------------------------------------------------------------
 """
 
-def shallow_parse(tree_str):
+def _chunk_tree(tree_str):
+    """ Chunk the tree string without lemmatizing it.
+        Returns words, POS tags, chunk positions and chunked lexicons, pos tags and chunk tags.
+        
+        The tree is walked once in O(n) by tree position:
+        - A minimum chunk is a phrase whose children are all POS tags (pre-terminals),
+          its words become one lexicon tagged by the phrase label.
+        - Other words become one-word lexicons tagged by their lowest phrase (excluding the root),
+          or 'O' if there is none.
+    """
     #------------------------------------------------------------------------------------------------
     # Inner functions
     #------------------------------------------------------------------------------------------------
@@ -40,90 +178,88 @@ def shallow_parse(tree_str):
         if 'O' in chunk_tags: return chunk_tags
         return ['I-' + chunk_tag if i != len(chunk_tags) - 1 else 'H-' + chunk_tag
                 for i, chunk_tag in enumerate(chunk_tags)]
+    
+    def _traverse_tree(children, chunk_tag):
+        # `chunk_tag`: Label of the lowest phrase that covers `children`.
+        if all(is_pos(child) for child in children) and chunk_tag != 'O':
+            # Minimum chunk
+            lexicon = [word for _, word in children]
+            lexicons.append(lexicon)
+            pos_tags.append([tag for tag, _ in children])
+            chunk_tags.append(_label_headword([chunk_tag] * len(lexicon)))
+            return
         
-    def _positionize(lexicons):
-        positions = []
-        start, end = 0, 0
-        for lexicon in lexicons:
-            start = end
-            end = start + len(lexicon)
-            positions.append((start, end))
-        return positions
-
-    def _traverse_tree(tree, label_dict):
-        for subtree in tree:
+        for label, child in children:
             # Leaf
-            if subtree.height() < 3:
-                leaf = subtree.leaves()[0]
-                label = subtree.label()
-                # Save traversed node's POS label
-                label_dict[leaf]['POS'] = label
-
+            if isinstance(child, str):
+                lexicons.append([child])
+                pos_tags.append([label])
+                chunk_tags.append(_label_headword([chunk_tag]))
             # Non-leaf
             else:
-                leaves_str = ' '.join(subtree.leaves())
-                label = subtree.label()
-                # Save traversed node's CHUNK label
-                label_dict[leaves_str]['CHUNK'] = label
-
-                _traverse_tree(subtree, label_dict)
+                _traverse_tree(child, label)
     
     #------------------------------------------------------------------------------------------------
     # Main
     #------------------------------------------------------------------------------------------------
     
-    # Get traversal history `label_dict`: {node_in_tree: {'POS': pos_tag, 'CHUNK': chunk_tag}}
-    label_dict = defaultdict(lambda: defaultdict(lambda: str))
-    tree = ParentedTree.fromstring(tree_str)
-    _traverse_tree(tree, label_dict)
-    
-    # Get chunks from label_dict and get the minimum chunks.
-    l = [k for k, v in label_dict.items() if 'CHUNK' in v.keys()]
-    sorted_l = sorted(l, key=len, reverse=True)
-    sorted_chunks = [j for i, j in enumerate(sorted_l) if not any(k in j for k in sorted_l[i + 1:])]
-    chunks = [chunk for chunk in l if chunk in sorted_chunks] # re-sort
-    
-    # Assign chunk tag for every leaf.
-    # The chunk tag is assigned from the leaf's minimum chunk.
-    for leaf in tree.leaves():
-        for chunk in sorted(l, key=len, reverse=False):
-            if leaf in chunk.split():
-                label_dict[leaf]['CHUNK'] = label_dict[chunk]['CHUNK']
-                break
-    
-    # Annotate the chunks in the sentence for further tokenization and labeling.
-    sent = ' '.join(tree.leaves())
-    chunked_sent = sent
-    for i, chunk in enumerate(chunks):
-        chunked_sent = re.sub(re.escape(chunk), 'CHUNK:{}'.format('￭'.join(chunk.split())), chunked_sent)
-
-    # Get chunked words and chunk tags.
+    # Get chunked words, pos tags and chunk tags.
     lexicons = [] # One word or a list of words (chunk)
+    pos_tags = []
     chunk_tags = []
-
-    for lexicon in chunked_sent.split():
-        # Detokenize labeled chunk
-        if 'CHUNK:' in lexicon:
-            lexicon = lexicon.replace('CHUNK:', '')
-            lexicon = ' '.join(lexicon.split('￭'))
-        
-        # Label the lexcion
-        chunk_tag = label_dict[lexicon].get('CHUNK', 'O')
-        
-        # Save results
-        lexicons.append(lexicon.split())
-        # Make chunk tag as same number as len(lexicon) and tag 'H'/'I' prefix for each chunk tag.
-        chunk_tags.append(_label_headword([chunk_tag]*len(lexicons[-1])))
-
+    # The root is not a chunk.
+    tree = parse_tree_str(tree_str)
+    _traverse_tree([tree] if is_pos(tree) else tree[1], 'O')
+    
     # Get chunk positions (start, end) in order to chunk other sequence.
-    positions = _positionize(lexicons)
+    positions = []
+    end = 0
+    for lexicon in lexicons:
+        positions.append((end, end + len(lexicon)))
+        end += len(lexicon)
+    
+    words = [word for lexicon in lexicons for word in lexicon]
+    tags = [tag for tag_chunk in pos_tags for tag in tag_chunk]
+    
+    return words, tags, positions, lexicons, pos_tags, chunk_tags
+
+def shallow_parse(tree_str):
+    """ Main API for shallow parsing a linearized constituency tree string. """
+    return next(shallow_parse_batch([tree_str]))
 
-    # Get chunked lemmas.
-    lemmas = [tok.lemma_.lower() if tok.lemma_ != '-PRON-' else tok.text.lower() for tok in nlp(sent)]
-    lemmas = [lemmas[start:end] for start, end in positions]
+def shallow_parse_batch(tree_strs, batch_size=1000, ignore_errors=False):
+    """ Batched version of `shallow_parse`.
+        Chunk every tree string and lemmatize all sentences through one lemmatizer `pipe()` stream,
+        which avoids the per-call overhead of spaCy. Yields the same results as `shallow_parse`
+        in input order.
+    `tree_strs`: Iterable of linearized constituency tree strings.
+    `batch_size`: The number of sentences buffered by the lemmatizer pipeline.
+    `ignore_errors`: Yield None for tree strings that cannot be parsed instead of raising.
+    """
+    # Chunked results waiting for their lemmas; None stands for an unparsable tree string.
+    pending = deque()
+    
+    def _sents():
+        for tree_str in tree_strs:
+            start = perf_counter()
+            try:
+                chunked = _chunk_tree(tree_str)
+            except Exception:
+                if not ignore_errors: raise
+                chunked = None
+            timings['chunk_tree'] += perf_counter() - start
+            pending.append(chunked)
+            if chunked is not None:
+                yield chunked[:2]
 
-    # Get chunked pos tags.
-    pos_tags = [label_dict[tok].get('POS') for tok in sent.split()]
-    pos_tags = [pos_tags[start:end] for start, end in positions]
+    for lemmas in get_lemmatizer().pipe(_sents(), batch_size=batch_size):
+        while pending[0] is None:
+            pending.popleft()
+            yield None
+        words, tags, positions, lexicons, pos_tags, chunk_tags = pending.popleft()
+        yield [lexicons, [lemmas[start:end] for start, end in positions], pos_tags, chunk_tags]
     
-    return [lexicons, lemmas, pos_tags, chunk_tags]
\ No newline at end of file
+    # Trailing unparsable tree strings.
+    while pending:
+        pending.popleft()
+        yield None
\ No newline at end of file
@@ -0,0 +1,85 @@
+import os
+import time
+import cProfile
+from collections import Counter
+from contextlib import contextmanager
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Low-overhead stage timers of the extraction pipeline
+    Seconds spent in every stage are added up in a `Counter` of this process. Workers return them
+    with their other counters (keys prefixed with "time."), thus they add up across workers.
+    Worker stages: read_tree, cache, load_lemmatizer, chunk_tree, lemmatize, grampat, align, aggregate (total: worker).
+    Main process stages: read_input, ipc, merge, checkpoint, save.
+    -------------------------------------------------------------------------------------------------
+"""
+
+perf_counter = time.perf_counter
+
+# Seconds of stages of this process.
+# Scripts should use the functions below: functions of `__main__` are pickled to joblib workers with
+# copies of the globals they refer to.
+timings = Counter()
+
+# Stages in order of the pipeline, for reports.
+worker_stages = ['read_tree', 'cache', 'load_lemmatizer', 'chunk_tree', 'lemmatize', 'grampat', 'align', 'aggregate']
+main_stages = ['read_input', 'ipc', 'merge', 'checkpoint', 'save']
+
+def add_time(stage, sec):
+    timings[stage] += sec
+
+def get_time(stage):
+    return timings[stage]
+
+@contextmanager
+def timed(stage):
+    """ Add the time spent in the block to `stage`. """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] += perf_counter() - start
+
+def pop_timings():
+    """ Returns timings of this process as counters ("time.<stage>": seconds) and resets them. """
+    counters = Counter({'time.' + stage: sec for stage, sec in timings.items()})
+    timings.clear()
+    return counters
+
+def stage_times(counters):
+    """ Dict of stages to seconds of `counters`. """
+    return {key[len('time.'):]: sec for key, sec in counters.items() if key.startswith('time.')}
+
+def format_report(counters, wall_sec):
+    """ Final report: seconds, share of worker (or wall) time and microseconds per sentence of every stage. """
+    times = stage_times(counters)
+    sents = max(1, counters['sents'])
+    lines = ['{:16s} {:>10s} {:>7s} {:>12s}'.format('stage', 'sec', '%', 'us/sent')]
+    for stages, total_name, total_sec in [(worker_stages, 'worker', times.get('worker', 0)),
+                                          (main_stages, 'wall', wall_sec)]:
+        for stage in stages + [total_name]:
+            sec = total_sec if stage == total_name else times.get(stage, 0)
+            lines.append('{:16s} {:10.2f} {:7.1f} {:12.1f}'.format(
+                stage, sec, 100 * sec / total_sec if total_sec else 0, 1e6 * sec / sents))
+    return '\n'.join(lines)
+
+# Profiler of this process, created on first use.
+_profiler = None
+
+@contextmanager
+def profiled(profile_dir, name):
+    """ Profile the block with cProfile if `profile_dir` is given.
+        Stats add up across blocks of this process and are dumped to "<profile_dir>/<name>-<pid>.prof".
+    """
+    global _profiler
+    if not profile_dir:
+        yield
+        return
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+    _profiler.enable()
+    try:
+        yield
+    finally:
+        _profiler.disable()
+        _profiler.dump_stats(os.path.join(profile_dir, '{}-{}.prof'.format(name, os.getpid())))
@@ -0,0 +1,62 @@
+import re
+import json
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Reader of linearized constituency tree strings
+    Input lines are either a quoted tree string (`*.tree.txt`) or AllenNLP jsonl output,
+    and trees are read into lightweight tuples instead of NLTK trees:
+    - Phrase: (label, [children])
+    - POS tag (pre-terminal): (tag, word)
+    -------------------------------------------------------------------------------------------------
+"""
+
+# A whole pre-terminal "(TAG word)", where the word may be a bracket, e.g., "(-LRB- ()";
+# otherwise an opening phrase "(LABEL", an opening bracket without label (PTB empty root "( (S ...))")
+# or a closing bracket. Tokens are only separated by whitespace.
+_token_re = re.compile(r'\s*(?:\(([^\s()]+)\s+([^\s()]+|[()])\)|\(([^\s()]+)|(\()|(\)))')
+
+def parse_tree_str(tree_str):
+    """ Parse a linearized constituency tree string into (label, children) tuples.
+        The empty root of PTB trees "( (S ...))" is dropped. Raise ValueError on malformed tree strings,
+        including text outside of tokens, e.g., the word of "(NP (DT the) dog)".
+    """
+    stack = [('', [])]
+    pos = 0
+    for match in _token_re.finditer(tree_str):
+        if match.start() != pos:
+            break
+        pos = match.end()
+        tag, word, label, empty, close = match.groups()
+        if tag:
+            stack[-1][1].append((tag, word))
+        elif label or empty:
+            stack.append((label or '', []))
+        else:
+            if len(stack) < 2:
+                raise ValueError('Unbalanced brackets in tree string: {}'.format(tree_str))
+            node = stack.pop()
+            stack[-1][1].append(node)
+    if tree_str[pos:].strip():
+        raise ValueError('Unexpected text at {} in tree string: {}'.format(pos, tree_str))
+    if len(stack) != 1 or len(stack[0][1]) != 1:
+        raise ValueError('Malformed tree string: {}'.format(tree_str))
+    root = stack[0][1][0]
+    if root[0] == '' and len(root[1]) == 1 and not is_pos(root):
+        return root[1][0]
+    return root
+
+def is_pos(node):
+    """ Whether the node is a pre-terminal (tag, word). """
+    return isinstance(node[1], str)
+
+def read_tree_line(line):
+    """ Returns the tree string of an input line.
+        A line is a JSON string (`*.tree.txt`) or a JSON object of AllenNLP output with a "trees" key.
+    """
+    obj = json.loads(line)
+    if isinstance(obj, dict):
+        obj = obj.get('trees', obj.get('tree'))
+    if not isinstance(obj, str):
+        raise ValueError('No tree string in line: {}'.format(line))
+    return obj
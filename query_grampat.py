@@ -1,27 +1,45 @@
+import os
 import dill
 import operator
 from collections import defaultdict
+from modules.grampat_store import load_store, RowsView
+from modules.grampat_compare import compare_corpora
+
+def load_file(prefix):
+    """ Load statistics of a corpus.
+        The compact `*.grampat.bin` file (see `convert_grampat.py`) is memory mapped and queried lazily,
+        otherwise (or if it is older than the `*.grampat.dill` file) the whole `*.grampat.dill` file is loaded.
+    """
+    bin_path, dill_path = prefix + '.grampat.bin', prefix + '.grampat.dill'
+    if os.path.exists(bin_path) and (not os.path.exists(dill_path) or
+                                     os.path.getmtime(bin_path) >= os.path.getmtime(dill_path)):
+        return load_store(bin_path)
+    
+    with open(dill_path, 'rb') as f:
+        return dill.load(f)
 
 def load_files():
-        
-    with open('bnc.grampat.dill', 'rb') as f:
-        bnc = dill.load(f)
-        
-    with open('clcfce.grampat.dill', 'rb') as f:
-        clcfce = dill.load(f)
-        
-    with open('efcamdat.grampat.dill', 'rb') as f:
-        efcamdat = dill.load(f)
-        
-    with open('lang8.grampat.dill', 'rb') as f:
-        lang8 = dill.load(f)
+    
+    bnc = load_file('bnc')
+    clcfce = load_file('clcfce')
+    efcamdat = load_file('efcamdat')
+    lang8 = load_file('lang8')
         
     return bnc, clcfce, efcamdat, lang8
 
+def get_topk(counts, topk):
+    """ Top `topk` (key, count) pairs of a dict of counts, read from the query index if there is one. """
+    if isinstance(counts, RowsView):
+        return counts.most_common(topk)
+    return sorted(counts.items(), key=operator.itemgetter(1), reverse=True)[:topk]
+
 def get_head_stpat_dict(count_dict):
     """
         Inverse the `count_dict` [src_pat][tgt_pat][headword] to [head][src_pat][tgt_pat].
+        Compact statistics files with query indexes have it precomputed.
     """
+    if isinstance(count_dict, RowsView) and count_dict.store.has_index:
+        return count_dict.store.head_stpat_dict
     
     head_stpat_dict = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
 
@@ -36,39 +54,66 @@ def get_head_stpat_dict(count_dict):
                     head_stpat_dict[head][src_pat]['*'] += count
     return head_stpat_dict
 
+# These preps are copied from Jason's `grampat.py`
+pgPreps = 'in_favor_of|_|about|after|against|among|as|at|between|behind|by|for|from|in|into|of|\
+on|upon|over|through|to|towards|toward|under|with'.split('|')
+otherPreps ='out|'.split('|')
+Preps = set(pgPreps + otherPreps)
+
+def is_prep_change(src_pat, tgt_pat, pat_tokens=None):
+    """ Whether `src_pat` and `tgt_pat` only differ in preposition words.
+        `pat_tokens`: Optional dict caching the set of words of every grammar pattern.
+    """
+    if pat_tokens is None: pat_tokens = {}
+    for pat in (src_pat, tgt_pat):
+        if pat not in pat_tokens:
+            pat_tokens[pat] = frozenset(pat.split())
+    diff = pat_tokens[src_pat] ^ pat_tokens[tgt_pat]
+    return bool(diff) and diff <= Preps
+
+def iter_inconsistent(head_stpat_dict):
+    """
+        Yields (head, case) of inconsistent grammar patterns in one pass over `head_stpat_dict`.
+        See `get_inconsistent_dict()`.
+        Pattern pairs are keyed by canonical (ordered) pairs, and every pair is classified once
+        for all headwords.
+    """
+    pat_tokens = {}
+    prep_changes = {}
+    for head, stpat_dict in head_stpat_dict.items():
+        if head == '*': continue
+        visited_pairs = set()
+        for src_pat, tgt_dict in stpat_dict.items():
+            if src_pat == '*': continue
+            for tgt_pat in tgt_dict.keys():
+                if tgt_pat == '*' or tgt_pat == src_pat: continue
+                # Find parallel grammars exists in either src->tgt or tgt->src (inconsistency)
+                reverse_dict = stpat_dict.get(tgt_pat)
+                if not reverse_dict or not reverse_dict.get(src_pat): continue
+                pair = (src_pat, tgt_pat) if src_pat < tgt_pat else (tgt_pat, src_pat)
+                if pair in visited_pairs: continue
+                # And only keep parallel changes involved preposition words
+                is_change = prep_changes.get(pair)
+                if is_change is None:
+                    is_change = prep_changes[pair] = is_prep_change(*pair, pat_tokens)
+                if not is_change: continue
+                visited_pairs.add(pair)
+                yield head, {
+                    f'{src_pat} -> {tgt_pat}': tgt_dict[tgt_pat],
+                    f'{tgt_pat} -> {src_pat}': reverse_dict[src_pat],
+                    f'{src_pat} -> {src_pat}': tgt_dict.get(src_pat, 0),
+                    f'{tgt_pat} -> {tgt_pat}': reverse_dict.get(tgt_pat, 0)
+                }
+
 def get_inconsistent_dict(head_stpat_dict):
     """ 
         Find inconsistent grammar patterns for each headword, for example,
         there exists either `src_pat` -> `tgt_pat` or `tgt_pat` -> `src_pat` for the specific headword.
+        Only parallel changes involved preposition words are kept.
     """
-    
-    # These preps are copied from Jason's `grampat.py`
-    pgPreps = 'in_favor_of|_|about|after|against|among|as|at|between|behind|by|for|from|in|into|of|\
-    on|upon|over|through|to|towards|toward|under|with'.split('|')
-    otherPreps ='out|'.split('|')
-    Preps = set(pgPreps + otherPreps)
-    
     inconsistent_dict = defaultdict(list)
-
-    for head in head_stpat_dict.keys():
-        if head == '*': continue
-        visited_pats = []
-        for src_pat in head_stpat_dict[head].keys():
-            for tgt_pat in head_stpat_dict[head][src_pat].keys():
-                # Find parallel grammars exists in either src->tgt or tgt->src (inconsistency)
-                # And only keep parallel changes involved preposition words
-                if src_pat != '*' and tgt_pat != '*' and src_pat != tgt_pat \
-                and head_stpat_dict[head].get(tgt_pat) and head_stpat_dict[head][tgt_pat].get(src_pat)\
-                and {src_pat, tgt_pat} not in visited_pats\
-                and set(src_pat.split()).symmetric_difference(set(tgt_pat.split()))\
-                and not set(src_pat.split()).symmetric_difference(set(tgt_pat.split())) - Preps:
-                    inconsistent_dict[head].append({
-                        f'{src_pat} -> {tgt_pat}': head_stpat_dict[head][src_pat][tgt_pat],
-                        f'{tgt_pat} -> {src_pat}': head_stpat_dict[head][tgt_pat][src_pat],
-                        f'{src_pat} -> {src_pat}': head_stpat_dict[head][src_pat].get(src_pat, 0),
-                        f'{tgt_pat} -> {tgt_pat}': head_stpat_dict[head][tgt_pat].get(tgt_pat, 0)
-                    })
-                    visited_pats.append({src_pat, tgt_pat})
+    for head, case in iter_inconsistent(head_stpat_dict):
+        inconsistent_dict[head].append(case)
     return inconsistent_dict
 
 if __name__ == '__main__':
@@ -107,7 +152,7 @@ if __name__ == '__main__':
     tgt_pat = 'V n'
     
     print('Top {} headwords that exists "{} -> {}" in EFCAMDAT:'.format(topk, src_pat, tgt_pat))
-    print(sorted(efcamdat['count_dict'][src_pat][tgt_pat].items(), key=operator.itemgetter(1), reverse=True)[:topk])
+    print(get_topk(efcamdat['count_dict'][src_pat][tgt_pat], topk))
     print()
     
     #---------------------------------------------------------------------------
@@ -120,8 +165,7 @@ if __name__ == '__main__':
     head = 'DISCUSS'
     
     print('Top {} n-gram examples of "{} -> {}" of the headword "{}" in EFCAMDAT:'.format(topk, src_pat, tgt_pat, head))
-    for ((src_ngram, tgt_ngram), count) in sorted(efcamdat['ngram_dict'][src_pat][tgt_pat][head].items(),\
-                                                  key=operator.itemgetter(1), reverse=True)[:5]:
+    for ((src_ngram, tgt_ngram), count) in get_topk(efcamdat['ngram_dict'][src_pat][tgt_pat][head], topk):
         print('{} -> {}: {}'.format(src_ngram, tgt_ngram, count))
     print()
     
@@ -184,4 +228,31 @@ if __name__ == '__main__':
         for parallel_grampat, count in inconsistent_case.items():
             print('{}: {}'.format(parallel_grampat, count))
         print()
-    print()
\ No newline at end of file
+    print()
+
+    #---------------------------------------------------------------------------
+    # 7. Compare corpora: headwords whose correction rate of 'V about n' -> 'V n'
+    #    in EFCAMDAT most exceeds the BNC baseline.
+    #    Counts of all corpora are aligned into one matrix, thus statistics of
+    #    every (headword, src_pat, tgt_pat) are computed at once.
+    #---------------------------------------------------------------------------
+    topk = 5
+    src_pat = 'V about n'
+    tgt_pat = 'V n'
+    comparison = compare_corpora({'bnc': bnc, 'clcfce': clcfce, 'efcamdat': efcamdat, 'lang8': lang8})
+    rates = comparison.correction_rate()
+    # Number of (headword, src_pat) instances, thus rates of rare headwords can be skipped.
+    source_totals = comparison.group_totals('head', 'src_pat')
+    efcamdat_id, bnc_id = comparison.column_id('efcamdat'), comparison.column_id('bnc')
+    
+    print('Top {} headwords whose correction rate of "{} -> {}" in EFCAMDAT most exceeds BNC:'.format(topk, src_pat, tgt_pat))
+    mask = comparison.select(src_pat=src_pat, tgt_pat=tgt_pat) & (source_totals[:, efcamdat_id] >= 2)
+    for row in comparison.rank(rates[:, efcamdat_id] - rates[:, bnc_id], topk, mask):
+        print('{}: {:.3f} {}'.format(row['head'], row['score'], row['counts']))
+    print()
+    
+    print('Top {} headwords of "{}" used more often in EFCAMDAT than in BNC (log-odds):'.format(topk, src_pat))
+    mask = comparison.select(src_pat=src_pat, tgt_pat=src_pat)
+    for row in comparison.rank(comparison.log_odds('efcamdat', 'bnc', counts=source_totals), topk, mask):
+        print('{}: {:.3f}'.format(row['head'], row['score']))
+    print()
@@ -0,0 +1,346 @@
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import contextlib
+from concurrent.futures import Future
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from modules.shallow_parser import set_lemmatizer, get_lemmatizer
+from modules.grampat import align_parallel_pats, set_inventory
+from modules.grampat_store import load_store
+from modules.pat_cache import set_cache, get_cache
+from compute_grampat import extract_pats, get_lemmatizer_config, get_inventory_config, get_cache_namespace
+from query_grampat import get_head_stpat_dict, get_topk
+
+"""
+    -------------------------------------------------------------------------------------------------
+    Resident grammar pattern service: the lemmatizer is loaded once and kept warm.
+    Requests (JSON objects) over local HTTP (POST /) or JSON lines (stdin -> stdout):
+    - {"tree": tree_str}: grammar patterns of a sentence (`sent_to_pats`)
+    - {"src_tree": tree_str, "tgt_tree": tree_str}: grammar patterns of both sentences and
+      aligned grammar patterns (`align_parallel_pats`)
+    - {"stats": name, "src_pat": ..., "tgt_pat": ..., ["head": ...], ["topk": 5]}: top-k headwords of
+      a parallel grammar pattern, or the count and top-k n-gram examples of a headword
+    - {"stats": name, "head": ..., ["src_pat": ...], ["topk": 5]}: top-k target patterns of a headword
+      (of all source patterns if `src_pat` is not given)
+    An optional "id" is echoed in the response. Errors are returned as {"error": message}.
+    Concurrent sentence requests are micro-batched through the batched shallow parser.
+    -------------------------------------------------------------------------------------------------
+"""
+
+class MicroBatcher(object):
+    """ Collects concurrent requests into batches of at most `max_batch` requests,
+        waiting at most `max_wait` seconds after the first request of a batch.
+        With no wait, a batch takes the requests that arrived while the last batch was processed.
+        `process_batch`: Function of a list of requests returning a list of results. An exception as the result
+                         of a request fails this request only.
+    """
+    def __init__(self, process_batch, max_batch=64, max_wait=0):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.counters = Counter()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, request):
+        """ Returns a `Future` of the result of `request`. """
+        future = Future()
+        self.queue.put((request, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    # Requests queued while the last batch ran are always taken.
+                    batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.counters['batches'] += 1
+            self.counters['requests'] += len(batch)
+            try:
+                results = self.process_batch([request for request, _ in batch])
+            except Exception as e:
+                for _, future in batch: future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+def _to_json(pats):
+    # Tuples of grammar patterns to lists, None (cannot be parsed) as is.
+    return None if pats is None else [list(pat) for pat in pats]
+
+def _get_path(d, *keys):
+    for key in keys:
+        d = d.get(key, {})
+    return d
+
+class GrampatService(object):
+    """ Handles requests of the service.
+        `stats`: Dict of statistic names to loaded statistics (`count_dict` and `ngram_dict`).
+    """
+    def __init__(self, stats=None, batch_size=1024, vectorized=False, by_position=False,
+                 max_batch=64, max_wait=0):
+        self.stats = stats or {}
+        self.batch_size = batch_size
+        self.vectorized = vectorized
+        self.by_position = by_position
+        self.head_stpat_dicts = {name: get_head_stpat_dict(stat['count_dict']) for name, stat in self.stats.items()}
+        self.batcher = MicroBatcher(self.process_batch, max_batch, max_wait)
+
+    def _extract(self, tree_strs):
+        """ (tree_str, pats) of tree strings extracted in one batch. If the batch fails, every tree string is
+            extracted on its own, and the pats of a tree string that fails are its exception.
+        """
+        try:
+            return list(zip(tree_strs, extract_pats(tree_strs, self.batch_size, self.vectorized)))
+        except Exception:
+            pass
+        tree_pats = []
+        for tree_str in tree_strs:
+            try:
+                tree_pats.append((tree_str, extract_pats([tree_str], self.batch_size, self.vectorized)[0]))
+            except Exception as e:
+                tree_pats.append((tree_str, e))
+        return tree_pats
+
+    def process_batch(self, requests):
+        """ Grammar patterns of sentence requests: distinct tree strings are extracted in one batch.
+            Errors of a tree string only fail the requests of this tree string.
+        """
+        tree_strs = list(dict.fromkeys(tree_str for request in requests
+                                       for tree_str in (request.get('tree'), request.get('src_tree'), request.get('tgt_tree'))
+                                       if tree_str is not None))
+        cache = get_cache()
+        tree_pats = cache.get_many(tree_strs) if cache is not None else {}
+        new_tree_strs = [tree_str for tree_str in tree_strs if tree_str not in tree_pats]
+        new_tree_pats = self._extract(new_tree_strs)
+        tree_pats.update(new_tree_pats)
+        if cache is not None:
+            cache.put_many([(tree_str, pats) for tree_str, pats in new_tree_pats if not isinstance(pats, Exception)])
+
+        results = []
+        for request in requests:
+            try:
+                results.append(self._response(request, tree_pats))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _response(self, request, tree_pats):
+        keys = ['tree'] if 'tree' in request else ['src_tree', 'tgt_tree']
+        for pats in [tree_pats[request[key]] for key in keys]:
+            if isinstance(pats, Exception):
+                raise pats
+        if 'tree' in request:
+            return {'pats': _to_json(tree_pats[request['tree']])}
+        src_pats, tgt_pats = tree_pats[request['src_tree']], tree_pats[request['tgt_tree']]
+        parallel_pats = None
+        if src_pats is not None and tgt_pats is not None:
+            parallel_pats = [[list(src_pat), list(tgt_pat)] for src_pat, tgt_pat
+                             in align_parallel_pats(src_pats, tgt_pats, self.by_position)]
+        return {'src_pats': _to_json(src_pats), 'tgt_pats': _to_json(tgt_pats), 'parallel_pats': parallel_pats}
+
+    def lookup(self, request):
+        """ Statistics lookups are answered directly, without batching.
+            Missing keys are looked up with `get`, thus requests never grow the (default)dicts.
+        """
+        name = request['stats']
+        if name not in self.stats:
+            raise ValueError('Unknown statistics "{}".'.format(name))
+        topk = request.get('topk', 5)
+        if 'tgt_pat' in request:
+            if 'src_pat' not in request:
+                raise ValueError('A lookup by "tgt_pat" needs "src_pat".')
+            head_dict = _get_path(self.stats[name]['count_dict'], request['src_pat'], request['tgt_pat'])
+            if 'head' not in request:
+                return {'heads': get_topk(head_dict, topk)}
+            ngrams = _get_path(self.stats[name]['ngram_dict'], request['src_pat'], request['tgt_pat'], request['head'])
+            return {'count': head_dict.get(request['head'], 0), 'ngrams': get_topk(ngrams, topk)}
+        if 'head' in request:
+            tgt_dict = _get_path(self.head_stpat_dicts[name], request['head'], request.get('src_pat', '*'))
+            # The '*' marginal of a source pattern counts more than any target pattern, thus it is in the top k + 1.
+            return {'tgt_pats': [(tgt_pat, count) for tgt_pat, count in get_topk(tgt_dict, topk + 1)
+                                 if tgt_pat != '*'][:topk]}
+        raise ValueError('A statistics lookup needs "tgt_pat" or "head".')
+
+    def submit(self, request):
+        """ Returns a `Future` of the response of a request. """
+        if not isinstance(request, dict):
+            raise ValueError('A request should be a JSON object.')
+        if 'stats' in request:
+            future = Future()
+            future.set_result(self.lookup(request))
+            return future
+        if 'tree' not in request and ('src_tree' not in request or 'tgt_tree' not in request):
+            raise ValueError('A request needs "tree", "src_tree" and "tgt_tree", or "stats".')
+        # Checked before batching, thus a malformed request does not fail the requests batched with it.
+        for key in ['tree', 'src_tree', 'tgt_tree']:
+            if key in request and not isinstance(request[key], str):
+                raise ValueError('"{}" should be a tree string.'.format(key))
+        return self.batcher.submit(request)
+
+    def handle(self, request):
+        """ Returns the response of a request. """
+        try:
+            response = self.submit(request).result()
+        except Exception as e:
+            response = {'error': str(e)}
+        if isinstance(request, dict) and 'id' in request:
+            response = dict(response, id=request['id'])
+        return response
+
+def make_server(service, host='127.0.0.1', port=8000):
+    """ Local HTTP server of `service`: POST / a JSON request, GET /stats for service counters. """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Keep-alive responses are small: do not wait for ACKs of the headers (Nagle).
+        disable_nagle_algorithm = True
+
+        def _send(self, code, response):
+            body = json.dumps(response).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/stats':
+                return self._send(404, {'error': 'Not found.'})
+            self._send(200, dict(service.batcher.counters))
+
+        def do_POST(self):
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            except ValueError as e:
+                return self._send(400, {'error': 'Invalid JSON: {}'.format(e)})
+            response = service.handle(request)
+            self._send(400 if 'error' in response else 200, response)
+
+        def log_message(self, format, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # Bursts of new connections beyond the listen backlog wait for SYN retries (1 sec).
+        request_queue_size = 128
+
+    server = Server((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+def serve_jsonl(service, in_file=sys.stdin, out_file=sys.stdout):
+    """ Answer JSON lines of `in_file` in order. Requests are read ahead, thus they are micro-batched. """
+    futures = queue.Queue(maxsize=service.batcher.max_batch * 4)
+
+    def _write():
+        while True:
+            item = futures.get()
+            if item is None: return
+            request, future = item
+            try:
+                response = future.result()
+            except Exception as e:
+                response = {'error': str(e)}
+            if isinstance(request, dict) and 'id' in request:
+                response = dict(response, id=request['id'])
+            out_file.write(json.dumps(response) + '\n')
+            out_file.flush()
+
+    writer = threading.Thread(target=_write)
+    writer.start()
+    for line in in_file:
+        if not line.strip(): continue
+        request, future = None, Future()
+        try:
+            request = json.loads(line)
+            future = service.submit(request)
+        except Exception as e:
+            future.set_exception(e)
+        futures.put((request, future))
+    futures.put(None)
+    writer.join()
+
+def load_stats(specs):
+    """ Load statistics of "name=path" specs, `*.grampat.bin` (memory mapped) or `*.grampat.dill`. """
+    stats = {}
+    for spec in specs:
+        name, path = spec.split('=', 1)
+        if path.endswith('.bin'):
+            stats[name] = load_store(path)
+        else:
+            import dill
+            with open(path, 'rb') as f:
+                stats[name] = dill.load(f)
+    return stats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve grammar pattern extraction and statistics lookups')
+    parser.add_argument('-mode', type=str, default='http', choices=['http', 'jsonl'],
+                        help='Serve over local HTTP, or JSON lines from stdin to stdout.')
+    parser.add_argument('-host', type=str, default='127.0.0.1',
+                        help='The host of the HTTP server.')
+    parser.add_argument('-port', type=int, default=8000,
+                        help='The port of the HTTP server.')
+    parser.add_argument('-stats', type=str, nargs='*', default=[],
+                        help='Statistics to serve, given as "name=path" of "*.grampat.bin" or "*.grampat.dill" files.')
+    parser.add_argument('-max_batch', type=int, default=64,
+                        help='The maximum number of sentence requests per batch.')
+    parser.add_argument('-max_wait_ms', type=float, default=0,
+                        help='The maximum time (ms) to wait for more requests of a batch.')
+    parser.add_argument('-lemmatizer', type=str, default='spacy', choices=['spacy', 'lookup'],
+                        help='The lemmatizer backend: a spaCy model or a (word, POS tag) lookup table.')
+    parser.add_argument('-spacy_model', type=str, default='en_core_web_lg',
+                        help='The spaCy model for the "spacy" lemmatizer, e.g., "en_core_web_sm".')
+    parser.add_argument('-lemma_table', type=str, default=None,
+                        help='The *file* path to the lookup table for the "lookup" lemmatizer.')
+    parser.add_argument('-vectorized', action='store_true',
+                        help='Extract grammar patterns of every batch with NumPy.')
+    parser.add_argument('-align_by_position', action='store_true',
+                        help='Align grammar patterns of the same headword by nearest n-gram span instead of order.')
+    parser.add_argument('-pats_path', type=str, default=None,
+                        help='The *file* path to a pattern inventory of `discover_grampat.py` to match instead of COBUILD patterns.')
+    parser.add_argument('-pats_top', type=int, default=0,
+                        help='Only match the N most frequent patterns of -pats_path (0: all).')
+    parser.add_argument('-pats_with_cobuild', action='store_true',
+                        help='Match the COBUILD patterns in addition to the patterns of -pats_path.')
+    parser.add_argument('-cache_size', type=int, default=0,
+                        help='The number of grammar pattern results of tree strings cached (0: no cache).')
+    args = parser.parse_args()
+    if args.lemmatizer == 'lookup' and not args.lemma_table:
+        parser.error('-lemma_table is required by the "lookup" lemmatizer.')
+
+    lemmatizer_config = get_lemmatizer_config(args)
+    set_lemmatizer(**lemmatizer_config)
+    inventory_config = get_inventory_config(args)
+    if inventory_config:
+        set_inventory(**inventory_config)
+    # Keep stdout for responses in the "jsonl" mode.
+    with contextlib.redirect_stdout(sys.stderr):
+        get_lemmatizer().load()
+        stats = load_stats(args.stats)
+    if args.cache_size:
+        set_cache(args.cache_size, namespace=get_cache_namespace(args))
+    service = GrampatService(stats, vectorized=args.vectorized, by_position=args.align_by_position,
+                             max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+
+    if args.mode == 'jsonl':
+        serve_jsonl(service)
+    else:
+        server = make_server(service, args.host, args.port)
+        print('Serving on http://{}:{}/ ...'.format(args.host, args.port), file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()